@@ -7,15 +7,32 @@ class AppConfig(BaseModel):
     amaterus_hasura_url: str | None
     internal_useragent: str | None
     external_useragent: str | None
+    http2: bool
+    http_max_connections: int
+    http_max_keepalive_connections: int
+    http_keepalive_expiry: float
+    http_timeout: float
 
 
 def load_app_config_from_env() -> AppConfig:
     amaterus_hasura_url = os.environ.get("APP_AMATERUS_HASURA_URL") or None
     internal_useragent = os.environ.get("APP_INTERNAL_USERAGENT") or None
     external_useragent = os.environ.get("APP_EXTERNAL_USERAGENT") or None
+    http2 = (os.environ.get("APP_HTTP2") or "0") == "1"
+    http_max_connections = int(os.environ.get("APP_HTTP_MAX_CONNECTIONS") or "20")
+    http_max_keepalive_connections = int(
+        os.environ.get("APP_HTTP_MAX_KEEPALIVE_CONNECTIONS") or "10"
+    )
+    http_keepalive_expiry = float(os.environ.get("APP_HTTP_KEEPALIVE_EXPIRY") or "60")
+    http_timeout = float(os.environ.get("APP_HTTP_TIMEOUT") or "15")
 
     return AppConfig(
         amaterus_hasura_url=amaterus_hasura_url,
         internal_useragent=internal_useragent,
         external_useragent=external_useragent,
+        http2=http2,
+        http_max_connections=http_max_connections,
+        http_max_keepalive_connections=http_max_keepalive_connections,
+        http_keepalive_expiry=http_keepalive_expiry,
+        http_timeout=http_timeout,
     )
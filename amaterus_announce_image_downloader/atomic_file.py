@@ -0,0 +1,101 @@
+import os
+import tempfile
+import time
+from contextlib import suppress
+from pathlib import Path
+
+# Temporary files live beside their target so that os.replace stays on the
+# same filesystem, but hidden so that they are never mistaken for finished
+# files. The output directory collects them in a subdirectory of its own.
+TMP_DIR_NAME = ".tmp"
+
+
+def _get_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# mkstemp creates files with mode 0600. Published files get the mode
+# which open() would have given them.
+FILE_MODE = 0o666 & ~_get_umask()
+
+
+def get_tmp_dir(output_dir: Path) -> Path:
+    return output_dir / TMP_DIR_NAME
+
+
+def create_tmp_file(
+    target_file: Path,
+    tmp_dir: Path | None = None,
+) -> tuple[int, Path]:
+    target_file.parent.mkdir(parents=True, exist_ok=True)
+
+    # Files in shard subdirectories share the .tmp of the output directory,
+    # other files such as --metrics_textfile do not get a .tmp beside them
+    prefix = f"{target_file.name}."
+    if tmp_dir is None:
+        tmp_dir = target_file.parent
+        prefix = f".{prefix}"
+    else:
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=tmp_dir,
+        prefix=prefix,
+        suffix=".tmp",
+    )
+    os.fchmod(fd, FILE_MODE)
+    return fd, Path(tmp_path)
+
+
+def discard_tmp_file(tmp_file: Path) -> None:
+    with suppress(FileNotFoundError):
+        tmp_file.unlink()
+
+
+def write_bytes_atomically(
+    target_file: Path,
+    data: bytes,
+    tmp_dir: Path | None = None,
+) -> None:
+    fd, tmp_file = create_tmp_file(target_file=target_file, tmp_dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        os.replace(tmp_file, target_file)
+    except BaseException:
+        discard_tmp_file(tmp_file=tmp_file)
+        raise
+
+
+def write_text_atomically(
+    target_file: Path,
+    text: str,
+    tmp_dir: Path | None = None,
+) -> None:
+    write_bytes_atomically(
+        target_file=target_file,
+        data=text.encode("utf-8"),
+        tmp_dir=tmp_dir,
+    )
+
+
+def remove_stale_tmp_files(output_dir: Path, max_age: float) -> int:
+    tmp_dir = get_tmp_dir(output_dir=output_dir)
+    if not tmp_dir.exists():
+        return 0
+
+    # Left behind by crashed runs. Recent ones may belong to a running process.
+    removed_count = 0
+    threshold = time.time() - max_age
+    with os.scandir(tmp_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < threshold:
+                discard_tmp_file(tmp_file=Path(entry.path))
+                removed_count += 1
+
+    return removed_count
@@ -0,0 +1,452 @@
+import asyncio
+import logging
+import multiprocessing
+import resource
+import time
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from logging import Logger
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from pydantic import BaseModel, TypeAdapter
+
+from .app_config import AppConfig
+from .atomic_file import write_text_atomically
+from .benchmark_server import BenchmarkServer, BenchmarkServerConfig
+from .http_client import (
+    HttpClientConfig,
+    add_http_client_arguments,
+    get_http_client_config_from_args,
+    open_http_client,
+)
+from .image_source_crawler import crawl_image_source
+from .image_sources import IMAGE_SOURCES, get_image_source
+from .profiler import (
+    PROFILER,
+    StageStats,
+    add_profile_arguments,
+    start_profile_from_args,
+    write_profile,
+)
+from .rate_limiter import HostRateLimiter
+from .retry_policy import (
+    RetryPolicy,
+    add_retry_policy_arguments,
+    get_retry_policy_from_args,
+)
+from .state_store import StateStore, get_default_state_file
+
+BENCHMARK_SUBCOMMANDS = [source.name for source in IMAGE_SOURCES]
+
+# Results are only compared with a baseline of the same scenario
+BENCHMARK_SCENARIO_FIELDS = {
+    "row_count",
+    "image_size",
+    "image_latency",
+    "error_rate",
+    "concurrency",
+}
+
+
+class BenchmarkResult(BaseModel):
+    subcommand: str
+    row_count: int
+    image_size: int
+    image_latency: float
+    error_rate: float
+    concurrency: int
+    downloaded_count: int
+    elapsed: float
+    items_per_second: float
+    bytes_per_second: float
+    time_to_first_download: float | None
+    peak_rss_bytes: int
+
+
+class BenchmarkCrawlResult(BaseModel):
+    # Wall clock, compared with the first download seen by the server
+    started_at: float
+    elapsed: float
+    peak_rss_bytes: int
+    profile_stages: dict[str, StageStats]
+    trace_events: list[dict[str, Any]]
+
+
+def get_peak_rss_bytes() -> int:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def crawl_benchmark(
+    subcommand: str,
+    base_url: str,
+    max_image_size: int,
+    http_client_config: HttpClientConfig,
+    retry_policy: RetryPolicy,
+    hasura_page_size: int,
+    concurrency: int,
+    rate_limit_per_host: float,
+    logger: Logger,
+) -> float:
+    with TemporaryDirectory() as tmp_dir:
+        output_dir = Path(tmp_dir)
+        rate_limiter = HostRateLimiter(
+            rate_per_host=rate_limit_per_host,
+            burst_per_host=concurrency,
+        )
+
+        with StateStore(
+            state_file=get_default_state_file(output_dir=output_dir),
+        ) as state_store:
+            started_at = time.monotonic()
+
+            async with open_http_client(
+                http_client_config=http_client_config,
+                logger=logger,
+            ) as client:
+                await crawl_image_source(
+                    client=client,
+                    source=get_image_source(name=subcommand),
+                    amaterus_hasura_url=base_url,
+                    internal_useragent="benchmark",
+                    external_useragent="benchmark",
+                    variants=["maxresdefault"],
+                    variant_mode="first",
+                    thumbnail_base_url=f"{base_url}vi/",
+                    output_dir=output_dir,
+                    state_store=state_store,
+                    retry_policy=retry_policy,
+                    hasura_page_size=hasura_page_size,
+                    incremental=False,
+                    refresh_older_than=None,
+                    max_image_size=max_image_size,
+                    content_addressed=False,
+                    output_layout=None,
+                    metadata_output="files",
+                    derivative_generator=None,
+                    concurrency=concurrency,
+                    rate_limiter=rate_limiter,
+                    shard=None,
+                    work_queue=None,
+                    pending_rows=None,
+                    listing_cache_config=None,
+                    logger=logger,
+                )
+
+            return time.monotonic() - started_at
+
+
+def run_benchmark_crawl(
+    subcommand: str,
+    base_url: str,
+    max_image_size: int,
+    http_client_config: HttpClientConfig,
+    retry_policy: RetryPolicy,
+    hasura_page_size: int,
+    concurrency: int,
+    rate_limit_per_host: float,
+    profile: bool,
+    logger_name: str,
+) -> BenchmarkCrawlResult:
+    # As configured by cli.main, but one log line per request would dominate
+    # the measurement
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s : %(message)s",
+    )
+    if profile:
+        PROFILER.enable()
+
+    started_at = time.time()
+    elapsed = asyncio.run(
+        crawl_benchmark(
+            subcommand=subcommand,
+            base_url=base_url,
+            max_image_size=max_image_size,
+            http_client_config=http_client_config,
+            retry_policy=retry_policy,
+            hasura_page_size=hasura_page_size,
+            concurrency=concurrency,
+            rate_limit_per_host=rate_limit_per_host,
+            logger=logging.getLogger(logger_name),
+        )
+    )
+
+    return BenchmarkCrawlResult(
+        started_at=started_at,
+        elapsed=elapsed,
+        peak_rss_bytes=get_peak_rss_bytes(),
+        profile_stages=PROFILER.stages,
+        trace_events=PROFILER.get_chrome_trace()["traceEvents"],
+    )
+
+
+async def run_benchmark(
+    subcommand: str,
+    server_config: BenchmarkServerConfig,
+    http_client_config: HttpClientConfig,
+    retry_policy: RetryPolicy,
+    hasura_page_size: int,
+    concurrency: int,
+    rate_limit_per_host: float,
+    logger: Logger,
+) -> BenchmarkResult:
+    server = BenchmarkServer(config=server_config)
+    await server.start()
+
+    # Each crawl runs in a fresh process, so that it shares its event loop with
+    # neither the server nor reports the peak RSS of the server or earlier crawls
+    try:
+        with ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) as executor:
+            crawl_result = await asyncio.get_running_loop().run_in_executor(
+                executor,
+                partial(
+                    run_benchmark_crawl,
+                    subcommand=subcommand,
+                    base_url=server.base_url,
+                    max_image_size=server_config.image_size * 2,
+                    http_client_config=http_client_config,
+                    retry_policy=retry_policy,
+                    hasura_page_size=hasura_page_size,
+                    concurrency=concurrency,
+                    rate_limit_per_host=rate_limit_per_host,
+                    profile=PROFILER.enabled,
+                    logger_name=logger.getChild(subcommand).name,
+                ),
+            )
+    finally:
+        await server.close()
+
+    PROFILER.merge(
+        stages=crawl_result.profile_stages,
+        trace_events=crawl_result.trace_events,
+    )
+
+    time_to_first_download: float | None = None
+    if server.first_image_at is not None:
+        time_to_first_download = server.first_image_at - crawl_result.started_at
+
+    return BenchmarkResult(
+        subcommand=subcommand,
+        row_count=server_config.row_count,
+        image_size=server_config.image_size,
+        image_latency=server_config.image_latency,
+        error_rate=server_config.error_rate,
+        concurrency=concurrency,
+        downloaded_count=server.image_success_count,
+        elapsed=crawl_result.elapsed,
+        items_per_second=server.image_success_count / crawl_result.elapsed,
+        bytes_per_second=server.image_bytes / crawl_result.elapsed,
+        time_to_first_download=time_to_first_download,
+        peak_rss_bytes=crawl_result.peak_rss_bytes,
+    )
+
+
+def find_regressions(
+    results: list[BenchmarkResult],
+    baseline_results: list[BenchmarkResult],
+    max_regression: float,
+) -> list[str]:
+    baseline_by_subcommand = {result.subcommand: result for result in baseline_results}
+
+    regressions: list[str] = []
+    for result in results:
+        baseline = baseline_by_subcommand.get(result.subcommand)
+        if baseline is None:
+            continue
+        # Results of other scenarios are not comparable
+        scenario = result.model_dump(include=BENCHMARK_SCENARIO_FIELDS)
+        if baseline.model_dump(include=BENCHMARK_SCENARIO_FIELDS) != scenario:
+            continue
+
+        if result.items_per_second < baseline.items_per_second * (1 - max_regression):
+            regressions.append(
+                f"{result.subcommand}: {result.items_per_second:.1f} items/s, "
+                f"baseline {baseline.items_per_second:.1f} items/s"
+            )
+
+    return regressions
+
+
+def benchmark_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    subcommands: list[str] = args.subcommand
+    server_config = BenchmarkServerConfig(
+        row_count=args.rows,
+        image_size=args.image_size,
+        image_latency=args.image_latency,
+        hasura_latency=args.hasura_latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    http_client_config = get_http_client_config_from_args(args)
+    retry_policy = get_retry_policy_from_args(args)
+    hasura_page_size: int = args.hasura_page_size
+    concurrency: int = args.concurrency
+    rate_limit_per_host: float = args.rate_limit_per_host
+    output_file: Path | None = args.output_file
+    baseline_file: Path | None = args.baseline_file
+    max_regression: float = args.max_regression
+    profile_file = start_profile_from_args(args)
+
+    baseline_results: list[BenchmarkResult] = []
+    if baseline_file is not None:
+        baseline_results = TypeAdapter(list[BenchmarkResult]).validate_json(
+            baseline_file.read_bytes()
+        )
+
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results: list[BenchmarkResult] = []
+    for subcommand in subcommands:
+        result = asyncio.run(
+            run_benchmark(
+                subcommand=subcommand,
+                server_config=server_config,
+                http_client_config=http_client_config,
+                retry_policy=retry_policy,
+                hasura_page_size=hasura_page_size,
+                concurrency=concurrency,
+                rate_limit_per_host=rate_limit_per_host,
+                logger=logger,
+            )
+        )
+        results.append(result)
+
+        time_to_first_download = (
+            f"{result.time_to_first_download:.3f}s"
+            if result.time_to_first_download is not None
+            else "-"
+        )
+        logger.info(
+            f"[{subcommand}] {result.downloaded_count} images in "
+            f"{result.elapsed:.3f}s, "
+            f"{result.items_per_second:.1f} items/s, "
+            f"{result.bytes_per_second / 1024 / 1024:.2f} MiB/s, "
+            f"first download after {time_to_first_download}, "
+            f"peak RSS {result.peak_rss_bytes / 1024 / 1024:.1f} MiB"
+        )
+
+    write_profile(profile_file=profile_file, logger=logger)
+
+    if output_file is not None:
+        write_text_atomically(
+            target_file=output_file,
+            text=TypeAdapter(list[BenchmarkResult])
+            .dump_json(results, indent=2)
+            .decode("utf-8"),
+        )
+
+    # Checked after the results are written, so that they are kept either way
+    regressions = find_regressions(
+        results=results,
+        baseline_results=baseline_results,
+        max_regression=max_regression,
+    )
+    if len(regressions) > 0:
+        raise RuntimeError(
+            f"Throughput fell more than {max_regression:.0%} below the baseline: "
+            + "; ".join(regressions)
+        )
+
+
+def add_benchmark_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--subcommand",
+        type=str,
+        nargs="+",
+        choices=BENCHMARK_SUBCOMMANDS,
+        default=BENCHMARK_SUBCOMMANDS,
+        help="Crawls to benchmark",
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=1000,
+        help="Number of rows in each stand-in Hasura table",
+    )
+    parser.add_argument(
+        "--image_size",
+        type=int,
+        default=64 * 1024,
+        help="Size in bytes of every stand-in image",
+    )
+    parser.add_argument(
+        "--image_latency",
+        type=float,
+        default=0.01,
+        help="Seconds the stand-in image host waits before each response",
+    )
+    parser.add_argument(
+        "--hasura_latency",
+        type=float,
+        default=0.01,
+        help="Seconds the stand-in Hasura waits before each response",
+    )
+    parser.add_argument(
+        "--error_rate",
+        type=float,
+        default=0.0,
+        help="Fraction of image requests answered with 503",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the error injection",
+    )
+    parser.add_argument(
+        "--hasura_page_size",
+        type=int,
+        default=1000,
+        help="Number of rows fetched from the stand-in Hasura per request",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=16,
+        help="Number of downloads in flight at the same time",
+    )
+    parser.add_argument(
+        "--rate_limit_per_host",
+        type=float,
+        default=1000,
+        help="Requests per second to the stand-in image host",
+    )
+    parser.add_argument(
+        "--output_file",
+        type=Path,
+        help="Write the results as JSON",
+    )
+    parser.add_argument(
+        "--baseline_file",
+        type=Path,
+        help="Fail when items/s falls below the --output_file of an earlier run",
+    )
+    parser.add_argument(
+        "--max_regression",
+        type=float,
+        default=0.2,
+        help="Fraction of the baseline items/s which may be lost before failing",
+    )
+    add_http_client_arguments(
+        parser=parser,
+        app_config=app_config,
+    )
+    add_retry_policy_arguments(parser=parser)
+    add_profile_arguments(parser=parser)
+    parser.set_defaults(
+        handler=benchmark_command,
+    )
@@ -0,0 +1,307 @@
+import asyncio
+import bisect
+import json
+import random
+import re
+import struct
+import time
+from collections import Counter
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from pydantic import BaseModel
+
+from .image_sources import IMAGE_SOURCES
+
+TABLE_NAMES = [source.table_name for source in IMAGE_SOURCES]
+
+GRAPHQL_TABLE_PATTERN = re.compile(r"\{\s*(\w+)\s*\(\s*where:")
+
+GRAPHQL_MAX_FIELDS_PATTERN = re.compile(r"\bmax\s*\{([^}]*)\}")
+
+# As in Hasura, max is only exposed for columns Postgres can compare,
+# not for the uuid ids of Amaterus
+AGGREGATE_MAX_COLUMNS = ["updated_at"]
+
+IMAGE_WIDTH = 1280
+IMAGE_HEIGHT = 720
+
+
+class BenchmarkServerConfig(BaseModel):
+    row_count: int
+    image_size: int
+    image_latency: float
+    hasura_latency: float
+    error_rate: float
+    seed: int
+
+
+def build_jpeg(size: int, width: int, height: int) -> bytes:
+    # SOI, a baseline SOF0 header carrying the dimensions,
+    # COM segments padding the file to the requested size and EOI
+    sof0 = (
+        b"\xff\xc0"
+        + struct.pack(">HBHHB", 17, 8, height, width, 3)
+        + bytes([1, 0x11, 0, 2, 0x11, 1, 3, 0x11, 1])
+    )
+
+    segments = [b"\xff\xd8", sof0]
+    padding = max(size - 2 - len(sof0) - 2, 0)
+    while padding > 0:
+        # Each segment carries a 4 byte header
+        payload_size = min(max(padding - 4, 0), 65533)
+        segments.append(b"\xff\xfe" + struct.pack(">H", payload_size + 2))
+        segments.append(b"\x00" * payload_size)
+        padding -= payload_size + 4
+    segments.append(b"\xff\xd9")
+
+    return b"".join(segments)
+
+
+def compare(column_value: Any, operator: str, operand: Any) -> bool:
+    if operator == "_eq":
+        return bool(column_value == operand)
+    if operator == "_gt":
+        return bool(column_value > operand)
+    if operator == "_gte":
+        return bool(column_value >= operand)
+    if operator == "_lt":
+        return bool(column_value < operand)
+    if operator == "_lte":
+        return bool(column_value <= operand)
+    if operator == "_in":
+        return column_value in operand
+    raise ValueError(f"Unsupported operator: {operator}")
+
+
+def matches_where(row: dict[str, Any], where: dict[str, Any]) -> bool:
+    for key, value in where.items():
+        if key == "_and":
+            if not all(matches_where(row, child) for child in value):
+                return False
+        elif key == "_or":
+            if not any(matches_where(row, child) for child in value):
+                return False
+        else:
+            for operator, operand in value.items():
+                if not compare(row[key], operator, operand):
+                    return False
+    return True
+
+
+def get_id_lower_bound(where: dict[str, Any]) -> str | None:
+    # Keyset pagination puts id._gt either at the top or inside _and
+    id_where = where.get("id", {})
+    if "_gt" in id_where:
+        return str(id_where["_gt"])
+
+    for child in where.get("_and", []):
+        lower_bound = get_id_lower_bound(child)
+        if lower_bound is not None:
+            return lower_bound
+
+    return None
+
+
+class BenchmarkServer:
+    def __init__(self, config: BenchmarkServerConfig) -> None:
+        self.config = config
+        self.base_url = ""
+
+        self.image_body = build_jpeg(
+            size=config.image_size,
+            width=IMAGE_WIDTH,
+            height=IMAGE_HEIGHT,
+        )
+
+        self.hasura_request_count = 0
+        self.image_request_count = 0
+        self.image_success_count = 0
+        self.image_bytes = 0
+        self.first_image_at: float | None = None
+        # Successful responses by path, e.g. to check that no image is fetched twice
+        self.image_path_counts: Counter[str] = Counter()
+
+        self._random = random.Random(config.seed)
+        self._rows: dict[str, list[dict[str, Any]]] = {}
+        self._row_ids: list[str] = []
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self.handle_connection,
+            host="127.0.0.1",
+            port=0,
+        )
+        port = self._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/"
+
+        updated_at = datetime(2024, 1, 1, tzinfo=UTC)
+        self._row_ids = [f"{index:08d}" for index in range(self.config.row_count)]
+        for table_name in TABLE_NAMES:
+            self._rows[table_name] = [
+                {
+                    "id": row_id,
+                    "url": f"{self.base_url}images/{row_id}.jpg",
+                    "remote_youtube_video_id": f"video{row_id}",
+                    "updated_at": (updated_at + timedelta(seconds=index)).isoformat(),
+                }
+                for index, row_id in enumerate(self._row_ids)
+            ]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    def query_rows(
+        self,
+        table_name: str,
+        where: dict[str, Any],
+        limit: int,
+    ) -> list[dict[str, Any]]:
+        rows = self._rows[table_name]
+
+        start = 0
+        lower_bound = get_id_lower_bound(where)
+        if lower_bound is not None:
+            start = bisect.bisect_right(self._row_ids, lower_bound)
+
+        matched_rows: list[dict[str, Any]] = []
+        for row in rows[start:]:
+            if len(matched_rows) >= limit:
+                break
+            if matches_where(row, where):
+                matched_rows.append(row)
+        return matched_rows
+
+    async def handle_graphql(self, body: bytes) -> tuple[int, str, bytes]:
+        self.hasura_request_count += 1
+        await asyncio.sleep(self.config.hasura_latency)
+
+        request = json.loads(body)
+        query: str = request["query"]
+        match = GRAPHQL_TABLE_PATTERN.search(query)
+        if match is None or match.group(1).removesuffix("_aggregate") not in self._rows:
+            return 400, "application/json", b'{"errors": [{"message": "bad query"}]}'
+
+        field_name = match.group(1)
+        table_name = field_name.removesuffix("_aggregate")
+        variables = request["variables"]
+
+        response: dict[str, Any]
+        if field_name != table_name:
+            response = self.query_aggregate(
+                table_name=table_name,
+                query=query,
+                where=variables["where"],
+            )
+        else:
+            rows = self.query_rows(
+                table_name=table_name,
+                where=variables["where"],
+                limit=variables["limit"],
+            )
+            response = {"data": {table_name: rows}}
+
+        # Hasura answers validation errors with 200 as well
+        return 200, "application/json", json.dumps(response).encode("utf-8")
+
+    def query_aggregate(
+        self,
+        table_name: str,
+        query: str,
+        where: dict[str, Any],
+    ) -> dict[str, Any]:
+        max_columns: list[str] = []
+        match = GRAPHQL_MAX_FIELDS_PATTERN.search(query)
+        if match is not None:
+            max_columns = match.group(1).split()
+
+        for column in max_columns:
+            if column not in AGGREGATE_MAX_COLUMNS:
+                return {
+                    "errors": [
+                        {
+                            "message": (
+                                f"field '{column}' not found in type: "
+                                f"'{table_name}_max_fields'"
+                            ),
+                            "extensions": {"code": "validation-failed"},
+                        }
+                    ]
+                }
+
+        rows = [row for row in self._rows[table_name] if matches_where(row, where)]
+        aggregate: dict[str, Any] = {"count": len(rows)}
+        if match is not None:
+            aggregate["max"] = {
+                column: max((row[column] for row in rows), default=None)
+                for column in max_columns
+            }
+
+        return {"data": {f"{table_name}_aggregate": {"aggregate": aggregate}}}
+
+    async def handle_image(self, path: str) -> tuple[int, str, bytes]:
+        self.image_request_count += 1
+        await asyncio.sleep(self.config.image_latency)
+
+        if self._random.random() < self.config.error_rate:
+            return 503, "text/plain", b""
+
+        self.image_success_count += 1
+        self.image_bytes += len(self.image_body)
+        self.image_path_counts[path] += 1
+        if self.first_image_at is None:
+            # Wall clock, compared with the start of the crawl process
+            self.first_image_at = time.time()
+
+        return 200, "image/jpeg", self.image_body
+
+    async def handle_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        # HTTP/1.1 with keep-alive, enough for httpx
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+
+                content_length = 0
+                while True:
+                    header_line = await reader.readline()
+                    if not header_line.strip():
+                        break
+                    name, _, value = header_line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "content-length":
+                        content_length = int(value.strip())
+
+                body = await reader.readexactly(content_length)
+
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                if method == "POST" and path == "/v1/graphql":
+                    status, content_type, response_body = await self.handle_graphql(
+                        body=body,
+                    )
+                elif method == "GET" and path.endswith(".jpg"):
+                    status, content_type, response_body = await self.handle_image(
+                        path=path,
+                    )
+                else:
+                    status, content_type, response_body = 404, "text/plain", b""
+
+                writer.write(
+                    f"HTTP/1.1 {status} -\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(response_body)}\r\n"
+                    "\r\n".encode("latin-1")
+                    + response_body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,71 @@
+import os
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from .atomic_file import create_tmp_file, discard_tmp_file, get_tmp_dir
+
+BLOBS_DIR_NAME = "blobs"
+
+
+class PublishedBlob(BaseModel):
+    file_name: str
+    deduplicated: bool
+
+
+def get_blob_file_name(sha256: str, suffix: str) -> str:
+    return f"{BLOBS_DIR_NAME}/sha256/{sha256[:2]}/{sha256}{suffix}"
+
+
+def link_file_atomically(
+    source_file: Path,
+    target_file: Path,
+    tmp_dir: Path | None = None,
+) -> None:
+    # os.link fails if the target exists, so link to a temporary name first
+    fd, tmp_file = create_tmp_file(target_file=target_file, tmp_dir=tmp_dir)
+    os.close(fd)
+    discard_tmp_file(tmp_file=tmp_file)
+
+    try:
+        os.link(source_file, tmp_file)
+        os.replace(tmp_file, target_file)
+    except BaseException:
+        discard_tmp_file(tmp_file=tmp_file)
+        raise
+
+
+def publish_blob(
+    tmp_file: Path,
+    output_dir: Path,
+    sha256: str,
+    suffix: str,
+    file_name: str,
+) -> PublishedBlob:
+    blob_file_name = get_blob_file_name(sha256=sha256, suffix=suffix)
+    blob_file = output_dir / blob_file_name
+
+    deduplicated = blob_file.exists()
+    if deduplicated:
+        discard_tmp_file(tmp_file=tmp_file)
+    else:
+        blob_file.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_file, blob_file)
+
+    try:
+        link_file_atomically(
+            source_file=blob_file,
+            target_file=output_dir / file_name,
+            tmp_dir=get_tmp_dir(output_dir=output_dir),
+        )
+    except OSError:
+        # Filesystem without hard links: the metadata references the blob instead
+        return PublishedBlob(
+            file_name=blob_file_name,
+            deduplicated=deduplicated,
+        )
+
+    return PublishedBlob(
+        file_name=file_name,
+        deduplicated=deduplicated,
+    )
@@ -6,11 +6,18 @@ from dotenv import load_dotenv
 
 from . import __version__ as APP_VERSION
 from .app_config import load_app_config_from_env
-from .twitter_tweet_image_cli import add_twitter_tweet_image_arguments
-from .youtube_live_thumbnail_image_cli import add_youtube_live_thumbnail_image_arguments
-from .youtube_video_thumbnail_image_cli import (
-    add_youtube_video_thumbnail_image_arguments,
-)
+from .benchmark_cli import add_benchmark_arguments
+from .compact_manifest_cli import add_compact_manifest_arguments
+from .crawl_all_cli import add_crawl_all_arguments
+from .dedup_report_cli import add_dedup_report_arguments
+from .export_cli import add_export_arguments
+from .image_source_cli import add_image_source_arguments
+from .image_sources import IMAGE_SOURCES
+from .merge_shards_cli import add_merge_shards_arguments
+from .migrate_layout_cli import add_migrate_layout_arguments
+from .migrate_state_cli import add_migrate_state_arguments
+from .plan_cli import add_plan_arguments
+from .release_leases_cli import add_release_leases_arguments
 
 
 def main() -> None:
@@ -27,25 +34,71 @@ def main() -> None:
 
     subparsers = parser.add_subparsers()
 
-    subparser_twitter_tweet_image = subparsers.add_parser("twitter_tweet_image")
-    add_twitter_tweet_image_arguments(
-        parser=subparser_twitter_tweet_image,
+    for source in IMAGE_SOURCES:
+        subparser_image_source = subparsers.add_parser(source.name)
+        add_image_source_arguments(
+            parser=subparser_image_source,
+            app_config=app_config,
+            source=source,
+        )
+
+    subparser_plan = subparsers.add_parser("plan")
+    add_plan_arguments(
+        parser=subparser_plan,
+        app_config=app_config,
+    )
+
+    subparser_crawl_all = subparsers.add_parser("crawl_all")
+    add_crawl_all_arguments(
+        parser=subparser_crawl_all,
+        app_config=app_config,
+    )
+
+    subparser_migrate_state = subparsers.add_parser("migrate_state")
+    add_migrate_state_arguments(
+        parser=subparser_migrate_state,
+        app_config=app_config,
+    )
+
+    subparser_migrate_layout = subparsers.add_parser("migrate_layout")
+    add_migrate_layout_arguments(
+        parser=subparser_migrate_layout,
         app_config=app_config,
     )
 
-    subparser_youtube_live_thumbnail_image = subparsers.add_parser(
-        "youtube_live_thumbnail_image"
+    subparser_compact_manifest = subparsers.add_parser("compact_manifest")
+    add_compact_manifest_arguments(
+        parser=subparser_compact_manifest,
+        app_config=app_config,
+    )
+
+    subparser_merge_shards = subparsers.add_parser("merge_shards")
+    add_merge_shards_arguments(
+        parser=subparser_merge_shards,
+        app_config=app_config,
+    )
+
+    subparser_release_leases = subparsers.add_parser("release_leases")
+    add_release_leases_arguments(
+        parser=subparser_release_leases,
+        app_config=app_config,
     )
-    add_youtube_live_thumbnail_image_arguments(
-        parser=subparser_youtube_live_thumbnail_image,
+
+    subparser_export = subparsers.add_parser("export")
+    add_export_arguments(
+        parser=subparser_export,
         app_config=app_config,
     )
 
-    subparser_youtube_video_thumbnail_image = subparsers.add_parser(
-        "youtube_video_thumbnail_image"
+    subparser_dedup_report = subparsers.add_parser("dedup_report")
+    add_dedup_report_arguments(
+        parser=subparser_dedup_report,
+        app_config=app_config,
     )
-    add_youtube_video_thumbnail_image_arguments(
-        parser=subparser_youtube_video_thumbnail_image,
+
+    subparser_benchmark = subparsers.add_parser("benchmark")
+    add_benchmark_arguments(
+        parser=subparser_benchmark,
         app_config=app_config,
     )
 
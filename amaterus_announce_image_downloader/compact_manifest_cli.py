@@ -0,0 +1,123 @@
+from argparse import ArgumentParser, Namespace
+from logging import Logger
+from pathlib import Path
+
+from .app_config import AppConfig
+from .image_sources import IMAGE_SOURCES
+from .manifest import (
+    Manifest,
+    check_parquet_support,
+    get_manifest_file,
+    write_manifest_parquet,
+)
+from .output_layout import find_item_file, parse_output_layout
+from .state_store import StateStore, add_state_store_arguments, get_default_state_file
+
+
+def import_metadata_files(
+    source_name: str,
+    output_dir: Path,
+    state_store: StateStore,
+    manifest: Manifest,
+) -> int:
+    stored_output_layout = state_store.load_output_layout(source_name=source_name)
+    output_layout = parse_output_layout(stored_output_layout or "flat")
+
+    imported_count = 0
+    for item_id in state_store.get_item_ids(source_name=source_name):
+        if manifest.has(item_id=item_id):
+            continue
+
+        metadata_file = find_item_file(
+            output_dir=output_dir,
+            item_id=item_id,
+            suffix=".json",
+            output_layout=output_layout,
+        )
+        if not metadata_file.exists():
+            continue
+
+        # Written by model_dump_json, so already a single line
+        manifest.append(
+            item_id=item_id,
+            text=metadata_file.read_text(encoding="utf-8").strip(),
+        )
+        imported_count += 1
+
+    return imported_count
+
+
+def compact_manifest_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source_name: str | None = args.source
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+    parquet_file: Path | None = args.parquet_file
+
+    if parquet_file is not None:
+        check_parquet_support()
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with Manifest(manifest_file=get_manifest_file(output_dir=output_dir)) as manifest:
+        if source_name is not None:
+            with StateStore(state_file=state_file, mode="rw") as state_store:
+                state_store.ensure_migrated_source(
+                    source_name=source_name,
+                    output_dir=output_dir,
+                )
+                imported_count = import_metadata_files(
+                    source_name=source_name,
+                    output_dir=output_dir,
+                    state_store=state_store,
+                    manifest=manifest,
+                )
+            logger.info(f"Imported {imported_count} {{id}}.json files")
+
+        stale_count = manifest.stale_count
+        manifest.compact()
+        logger.info(
+            f"Compacted {manifest.manifest_file}: "
+            f"dropped {stale_count} superseded records, kept {manifest.live_count}"
+        )
+
+        if parquet_file is not None:
+            record_count = write_manifest_parquet(
+                manifest=manifest,
+                parquet_file=parquet_file,
+                # Columns of every source, so that each export has the same ones
+                metadata_models=[source.metadata_model for source in IMAGE_SOURCES],
+            )
+            logger.info(f"Wrote {record_count} records to {parquet_file}")
+
+
+def add_compact_manifest_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory containing manifest.jsonl",
+    )
+    parser.add_argument(
+        "--source",
+        type=str,
+        help=(
+            "Also import {id}.json files of this source missing from the manifest "
+            "(e.g. twitter_tweet_images, youtube_lives_maxresdefault)"
+        ),
+    )
+    parser.add_argument(
+        "--parquet_file",
+        type=Path,
+        help="Also write the compacted manifest as Parquet (needs the parquet extra)",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=compact_manifest_command,
+    )
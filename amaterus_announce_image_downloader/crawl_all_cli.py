@@ -0,0 +1,247 @@
+import asyncio
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable, Coroutine
+from contextlib import ExitStack
+from logging import Logger
+from pathlib import Path
+from typing import Any
+
+from .app_config import AppConfig
+from .crawler import (
+    add_crawler_arguments,
+    get_host_rate_limiter_from_args,
+    get_watch_interval_from_args,
+    run_crawl,
+)
+from .derivatives import (
+    add_derivative_arguments,
+    get_derivative_config_from_args,
+    open_derivative_generator,
+)
+from .http_client import (
+    add_http_client_arguments,
+    get_http_client_config_from_args,
+    open_http_client,
+)
+from .image_source import ImageSource
+from .image_source_crawler import crawl_image_source
+from .image_sources import IMAGE_SOURCES
+from .listing_cache import get_listing_cache_config_from_args
+from .metadata_store import MetadataOutput
+from .metrics import (
+    add_metrics_arguments,
+    get_metrics_config_from_args,
+    open_metrics_server,
+    write_metrics_textfile,
+)
+from .output_layout import OutputLayout
+from .profiler import add_profile_arguments, start_profile_from_args, write_profile
+from .retry_policy import add_retry_policy_arguments, get_retry_policy_from_args
+from .state_store import StateStore, get_default_state_file
+from .work_distribution import (
+    Shard,
+    add_work_distribution_arguments,
+    get_work_queue_config_from_args,
+)
+from .youtube_thumbnail import VariantMode, add_thumbnail_variant_arguments
+
+
+def get_source_output_dir_dest(source: ImageSource) -> str:
+    return f"{source.name}_output_dir"
+
+
+def crawl_all_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    amaterus_hasura_url: str = args.amaterus_hasura_url
+    internal_useragent: str = args.internal_useragent
+    external_useragent: str = args.external_useragent
+    source_output_dirs: list[tuple[ImageSource, Path]] = [
+        (source, getattr(args, get_source_output_dir_dest(source=source)))
+        for source in IMAGE_SOURCES
+        if getattr(args, get_source_output_dir_dest(source=source)) is not None
+    ]
+    variants: list[str] | None = args.variant
+    variant_mode: VariantMode = args.variant_mode
+    thumbnail_base_url: str = args.thumbnail_base_url
+    http_client_config = get_http_client_config_from_args(args)
+    metrics_config = get_metrics_config_from_args(args)
+    retry_policy = get_retry_policy_from_args(args)
+    hasura_page_size: int = args.hasura_page_size
+    incremental: bool = args.incremental
+    watch_interval = get_watch_interval_from_args(args)
+    refresh_older_than: float | None = args.refresh_older_than
+    max_image_size: int = args.max_image_size
+    content_addressed: bool = args.content_addressed
+    output_layout: OutputLayout | None = args.output_layout
+    metadata_output: MetadataOutput = args.metadata_output
+    derivative_config = get_derivative_config_from_args(args)
+    concurrency: int = args.concurrency
+    shard: Shard | None = args.shard
+    work_queue = get_work_queue_config_from_args(args)
+    listing_cache_config = get_listing_cache_config_from_args(args)
+
+    if not source_output_dirs:
+        raise ValueError("At least one output directory is required")
+
+    variant_output_dir_flags = [
+        f"--{get_source_output_dir_dest(source=source)}"
+        for source, _ in source_output_dirs
+        if source.has_variants
+    ]
+    if variants is None and variant_output_dir_flags:
+        raise ValueError(
+            f"--variant is required with {', '.join(variant_output_dir_flags)}"
+        )
+
+    # Shared by all sources, so that i.ytimg.com sees a single budget
+    rate_limiter = get_host_rate_limiter_from_args(args)
+    profile_file = start_profile_from_args(args)
+
+    failed_source_names: list[str] = []
+
+    async def run() -> None:
+        # Each source keeps its state in its own output directory
+        with ExitStack() as exit_stack:
+            # One process pool shared by all sources
+            derivative_generator = exit_stack.enter_context(
+                open_derivative_generator(config=derivative_config)
+            )
+            async with (
+                open_metrics_server(
+                    metrics_config=metrics_config,
+                    logger=logger,
+                ),
+                open_http_client(
+                    http_client_config=http_client_config,
+                    logger=logger,
+                ) as client,
+                asyncio.TaskGroup() as task_group,
+            ):
+                for source, output_dir in source_output_dirs:
+                    state_store = exit_stack.enter_context(
+                        StateStore(
+                            state_file=get_default_state_file(output_dir=output_dir),
+                        )
+                    )
+                    source_logger = logger.getChild(source.name)
+
+                    async def crawl(
+                        incremental: bool,
+                        source: ImageSource = source,
+                        output_dir: Path = output_dir,
+                        state_store: StateStore = state_store,
+                        source_logger: Logger = source_logger,
+                    ) -> None:
+                        await crawl_image_source(
+                            client=client,
+                            source=source,
+                            amaterus_hasura_url=amaterus_hasura_url,
+                            internal_useragent=internal_useragent,
+                            external_useragent=external_useragent,
+                            variants=variants or [],
+                            variant_mode=variant_mode,
+                            thumbnail_base_url=thumbnail_base_url,
+                            output_dir=output_dir,
+                            state_store=state_store,
+                            retry_policy=retry_policy,
+                            hasura_page_size=hasura_page_size,
+                            incremental=incremental,
+                            refresh_older_than=refresh_older_than,
+                            max_image_size=max_image_size,
+                            content_addressed=content_addressed,
+                            output_layout=output_layout,
+                            metadata_output=metadata_output,
+                            derivative_generator=derivative_generator,
+                            concurrency=concurrency,
+                            rate_limiter=rate_limiter,
+                            shard=shard,
+                            work_queue=work_queue,
+                            pending_rows=None,
+                            listing_cache_config=listing_cache_config,
+                            logger=source_logger,
+                        )
+
+                    async def run_source_crawl(
+                        crawl: Callable[[bool], Coroutine[Any, Any, None]] = crawl,
+                        source: ImageSource = source,
+                        source_logger: Logger = source_logger,
+                    ) -> None:
+                        # A failing source must not cancel the others
+                        try:
+                            await run_crawl(
+                                crawl=crawl,
+                                incremental=incremental,
+                                watch_interval=watch_interval,
+                                logger=source_logger,
+                            )
+                        except Exception:
+                            source_logger.exception("Crawl failed")
+                            failed_source_names.append(source.name)
+
+                    task_group.create_task(run_source_crawl())
+
+    try:
+        asyncio.run(run())
+    finally:
+        # Also written when a --watch run is interrupted
+        write_profile(profile_file=profile_file, logger=logger)
+
+    rate_limiter.log_summary(logger=logger)
+    write_metrics_textfile(metrics_config=metrics_config)
+
+    if failed_source_names:
+        raise RuntimeError(f"Crawl failed: {', '.join(failed_source_names)}")
+
+
+def add_crawl_all_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    external_service_names = ", ".join(
+        dict.fromkeys(source.external_service_name for source in IMAGE_SOURCES)
+    )
+
+    parser.add_argument(
+        "--amaterus_hasura_url",
+        type=str,
+        default=app_config.amaterus_hasura_url,
+        required=app_config.amaterus_hasura_url is None,
+        help="Amaterus Hasura URL",
+    )
+    parser.add_argument(
+        "--internal_useragent",
+        type=str,
+        default=app_config.internal_useragent,
+        required=app_config.internal_useragent is None,
+        help="Useragent for internal HTTP request (Amaterus Hasura)",
+    )
+    parser.add_argument(
+        "--external_useragent",
+        type=str,
+        default=app_config.external_useragent,
+        required=app_config.external_useragent is None,
+        help=f"Useragent for external HTTP request ({external_service_names})",
+    )
+    for source in IMAGE_SOURCES:
+        parser.add_argument(
+            f"--{get_source_output_dir_dest(source=source)}",
+            type=Path,
+            help=f"Output directory of {source.name} (skipped if omitted)",
+        )
+    # Only needed by the sources with variants
+    add_thumbnail_variant_arguments(parser=parser, required=False)
+    add_http_client_arguments(
+        parser=parser,
+        app_config=app_config,
+    )
+    add_retry_policy_arguments(parser=parser)
+    add_derivative_arguments(parser=parser)
+    add_metrics_arguments(parser=parser)
+    add_profile_arguments(parser=parser)
+    add_crawler_arguments(parser=parser)
+    add_work_distribution_arguments(parser=parser)
+    parser.set_defaults(
+        handler=crawl_all_command,
+    )
@@ -0,0 +1,284 @@
+import asyncio
+import time
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from collections.abc import AsyncIterable, Awaitable, Callable, Coroutine
+from logging import Logger
+from typing import Any, TypeVar
+
+import httpx
+from pydantic import ValidationError
+
+from .hasura import HasuraQueryError
+from .image_downloader import ImageDownloadError
+from .listing_cache import add_listing_cache_arguments
+from .metadata_store import METADATA_OUTPUTS, parse_metadata_output
+from .metrics import CRAWL_ITEMS, WORKER_QUEUE_DEPTH
+from .output_layout import OUTPUT_LAYOUTS, parse_output_layout
+from .profiler import PROFILER
+from .rate_limiter import HostRateLimiter
+from .retry_policy import RetryPolicy
+from .state_store import StateStore
+
+T = TypeVar("T")
+
+STALE_TMP_FILE_MAX_AGE: float = 24 * 3600
+
+
+async def run_workers(
+    items: AsyncIterable[T],
+    worker: Callable[[T], Awaitable[None]],
+    concurrency: int,
+    source_name: str,
+) -> None:
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1: {concurrency}")
+
+    # Bounded so that the producer never runs far ahead of the workers
+    queue: asyncio.Queue[tuple[T] | None] = asyncio.Queue(maxsize=concurrency)
+
+    async def produce() -> None:
+        async for item in items:
+            await queue.put((item,))
+            WORKER_QUEUE_DEPTH.set(value=queue.qsize(), labels=(source_name,))
+
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def consume() -> None:
+        while True:
+            # Workers waiting here are starved by the Hasura listing
+            with PROFILER.span("queue_wait"):
+                entry = await queue.get()
+            WORKER_QUEUE_DEPTH.set(value=queue.qsize(), labels=(source_name,))
+            if entry is None:
+                return
+
+            with PROFILER.span("item"):
+                await worker(entry[0])
+
+    async with asyncio.TaskGroup() as task_group:
+        task_group.create_task(produce())
+        for _ in range(concurrency):
+            task_group.create_task(consume())
+
+
+async def run_crawl(
+    crawl: Callable[[bool], Coroutine[Any, Any, None]],
+    incremental: bool,
+    watch_interval: float | None,
+    logger: Logger,
+) -> None:
+    if watch_interval is None:
+        await crawl(incremental)
+        return
+
+    # Passes after the first one only list rows updated since the watermark
+    while True:
+        started_at = time.monotonic()
+        # Listing errors come out of the TaskGroup of run_workers in a group
+        try:
+            await crawl(incremental)
+        except* (httpx.HTTPError, HasuraQueryError, ValidationError):
+            logger.exception("Crawl pass failed")
+
+        incremental = True
+        elapsed = time.monotonic() - started_at
+        with PROFILER.span("watch_sleep"):
+            await asyncio.sleep(max(watch_interval - elapsed, 0))
+
+
+def get_watch_interval_from_args(args: Namespace) -> float | None:
+    if not args.watch:
+        return None
+    return float(args.watch_interval)
+
+
+def parse_host_rate_range(value: str) -> tuple[str, float, float]:
+    host, separator, rate_range = value.partition("=")
+    min_rate, range_separator, max_rate = rate_range.partition(":")
+    if not host or not separator or not range_separator:
+        raise ArgumentTypeError(f"Expected HOST=MIN:MAX: {value}")
+
+    try:
+        return host, float(min_rate), float(max_rate)
+    except ValueError as error:
+        raise ArgumentTypeError(f"Expected HOST=MIN:MAX: {value}") from error
+
+
+def get_host_rate_limiter_from_args(args: Namespace) -> HostRateLimiter:
+    host_rate_ranges: list[tuple[str, float, float]] = args.host_rate_limit
+
+    return HostRateLimiter(
+        rate_per_host=args.rate_limit_per_host,
+        burst_per_host=args.rate_limit_burst,
+        min_rate_per_host=args.rate_limit_min_per_host,
+        max_rate_per_host=args.rate_limit_max_per_host,
+        rate_increase=args.rate_limit_increase,
+        host_rate_ranges={
+            host: (min_rate, max_rate) for host, min_rate, max_rate in host_rate_ranges
+        },
+    )
+
+
+def record_download_error(
+    state_store: StateStore,
+    retry_policy: RetryPolicy,
+    source_name: str,
+    item_id: str,
+    error: ImageDownloadError,
+    logger: Logger,
+) -> None:
+    item_state = state_store.get_item_state(
+        source_name=source_name,
+        item_id=item_id,
+    )
+    failure_count = (item_state.failure_count if item_state is not None else 0) + 1
+
+    next_attempt_at = None
+    if error.transient:
+        next_attempt_at = retry_policy.get_next_attempt_at(
+            failure_count=failure_count,
+            retry_after=error.retry_after,
+            failed_at=error.fetched_at,
+        )
+
+    state_store.record_failed(
+        source_name=source_name,
+        item_id=item_id,
+        error=error.message,
+        fetched_at=error.fetched_at,
+        next_attempt_at=next_attempt_at,
+    )
+
+    CRAWL_ITEMS.inc(
+        labels=(source_name, "retrying" if next_attempt_at is not None else "errored"),
+    )
+
+    if next_attempt_at is not None:
+        logger.warning(
+            f"[id={item_id}] Failed {failure_count} time(s). "
+            f"Retry after {next_attempt_at.isoformat()}"
+        )
+    else:
+        logger.warning(f"[id={item_id}] Failed permanently")
+
+
+def add_crawler_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--hasura_page_size",
+        type=int,
+        default=1000,
+        help="Number of rows fetched from Amaterus Hasura per request",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "Fetch only rows updated since the watermark "
+            "saved by the previous complete run"
+        ),
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and poll Amaterus Hasura for new rows",
+    )
+    parser.add_argument(
+        "--watch_interval",
+        type=float,
+        default=10,
+        help="Seconds between the starts of two crawl passes in --watch mode",
+    )
+    parser.add_argument(
+        "--refresh_older_than",
+        type=float,
+        help=(
+            "Re-check fetched images last checked more than this many seconds ago "
+            "with If-None-Match/If-Modified-Since"
+        ),
+    )
+    parser.add_argument(
+        "--max_image_size",
+        type=int,
+        default=20 * 1024 * 1024,
+        help="Abort a download whose body exceeds this many bytes",
+    )
+    parser.add_argument(
+        "--content_addressed",
+        action="store_true",
+        help=(
+            "Store each distinct image once under blobs/sha256/ "
+            "and hard link {id}.* to it"
+        ),
+    )
+    parser.add_argument(
+        "--output_layout",
+        type=parse_output_layout,
+        choices=OUTPUT_LAYOUTS,
+        help=(
+            "flat: {id}.* in the output directory, "
+            "sharded: ab/cd/{id}.* by a hash of the id "
+            "(default: the layout recorded in the state file, else flat)"
+        ),
+    )
+    parser.add_argument(
+        "--metadata_output",
+        type=parse_metadata_output,
+        choices=METADATA_OUTPUTS,
+        default="files",
+        help=(
+            "files: {id}.json next to each image, "
+            "manifest: records appended to manifest.jsonl in the output directory, "
+            "both: files and manifest"
+        ),
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of downloads in flight at the same time",
+    )
+    parser.add_argument(
+        "--rate_limit_per_host",
+        type=float,
+        default=0.1,
+        help="Initial requests per second to each image host",
+    )
+    parser.add_argument(
+        "--rate_limit_burst",
+        type=float,
+        default=1,
+        help="Number of requests allowed to each image host in a burst",
+    )
+    parser.add_argument(
+        "--rate_limit_min_per_host",
+        type=float,
+        help=(
+            "Floor of the adaptive request rate to each image host "
+            "(default: --rate_limit_per_host)"
+        ),
+    )
+    parser.add_argument(
+        "--rate_limit_max_per_host",
+        type=float,
+        help=(
+            "Ceiling of the adaptive request rate to each image host "
+            "(default: --rate_limit_per_host)"
+        ),
+    )
+    parser.add_argument(
+        "--rate_limit_increase",
+        type=float,
+        default=0.1,
+        help="Requests per second added per second while a host responds healthily",
+    )
+    parser.add_argument(
+        "--host_rate_limit",
+        type=parse_host_rate_range,
+        action="append",
+        default=[],
+        help="Floor and ceiling for one host as HOST=MIN:MAX (repeatable)",
+    )
+    add_listing_cache_arguments(parser=parser)
@@ -0,0 +1,57 @@
+from argparse import ArgumentParser, Namespace
+from logging import Logger
+from pathlib import Path
+
+from .app_config import AppConfig
+from .state_store import StateStore, add_state_store_arguments, get_default_state_file
+
+
+def dedup_report_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source_name: str = args.source
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with StateStore(state_file=state_file, mode="ro") as state_store:
+        # Also the youtube_lives_{variant} sources of --variant_mode all
+        state_store.check_source(source_name=source_name)
+        dedup_stats = state_store.get_dedup_stats(source_name=source_name)
+
+    logger.info(
+        f"{source_name}: "
+        f"{dedup_stats.item_count} items stored as blobs, "
+        f"{dedup_stats.blob_count} distinct blobs, "
+        f"{dedup_stats.total_size} bytes referenced, "
+        f"{dedup_stats.stored_size} bytes stored, "
+        f"{dedup_stats.saved_size} bytes saved by deduplication"
+    )
+
+
+def add_dedup_report_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--source",
+        type=str,
+        required=True,
+        help=(
+            "Source to report "
+            "(e.g. twitter_tweet_images, youtube_lives_maxresdefault)"
+        ),
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory of the crawl",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=dedup_report_command,
+    )
@@ -0,0 +1,285 @@
+import asyncio
+import importlib.util
+import io
+import multiprocessing
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from logging import Logger
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from .atomic_file import get_tmp_dir, write_bytes_atomically
+from .output_layout import OutputLayout, get_item_file_name
+from .profiler import PROFILER
+
+DERIVATIVES_DIR_NAME = "derivatives"
+
+DERIVATIVE_SUFFIXES = {
+    "webp": ".webp",
+    "avif": ".avif",
+    "jpeg": ".jpg",
+    "png": ".png",
+}
+
+
+class DerivativeSpec(BaseModel):
+    format: str
+    width: int
+
+
+class DerivativeImage(BaseModel):
+    format: str
+    target_width: int
+    width: int
+    height: int
+    file_name: str
+    size: int
+    source_sha256: str | None
+
+    def matches(self, spec: DerivativeSpec) -> bool:
+        return self.format == spec.format and self.target_width == spec.width
+
+
+class DerivativeConfig(BaseModel):
+    specs: list[DerivativeSpec]
+    quality: int
+    workers: int | None
+
+
+def parse_derivative_spec(value: str) -> DerivativeSpec:
+    format, separator, width = value.partition(":")
+    if format not in DERIVATIVE_SUFFIXES or not separator:
+        raise ArgumentTypeError(
+            f"Expected FORMAT:WIDTH with FORMAT one of "
+            f"{', '.join(DERIVATIVE_SUFFIXES)}: {value}"
+        )
+
+    try:
+        spec = DerivativeSpec(format=format, width=int(width))
+    except ValueError as error:
+        raise ArgumentTypeError(f"Expected FORMAT:WIDTH: {value}") from error
+
+    if spec.width < 1:
+        raise ArgumentTypeError(f"Width must be at least 1: {value}")
+    return spec
+
+
+def get_derivative_file_name(
+    spec: DerivativeSpec,
+    item_id: str,
+    output_layout: OutputLayout,
+) -> str:
+    item_file_name = get_item_file_name(
+        item_id=item_id,
+        suffix=DERIVATIVE_SUFFIXES[spec.format],
+        output_layout=output_layout,
+    )
+    return f"{DERIVATIVES_DIR_NAME}/{spec.format}_{spec.width}/{item_file_name}"
+
+
+def check_derivative_support(specs: list[DerivativeSpec]) -> None:
+    # Pillow is an optional dependency, only needed with --derivative
+    if importlib.util.find_spec("PIL") is None:
+        raise ValueError("--derivative requires Pillow (poetry install -E derivatives)")
+
+    from PIL import Image
+
+    Image.init()
+    for spec in specs:
+        if spec.format.upper() not in Image.SAVE:
+            raise ValueError(f"Pillow cannot encode {spec.format} in this environment")
+
+
+def encode_derivatives(
+    source_file: Path,
+    output_dir: Path,
+    item_id: str,
+    source_sha256: str | None,
+    specs: list[DerivativeSpec],
+    quality: int,
+    output_layout: OutputLayout,
+) -> list[DerivativeImage]:
+    # Runs in a worker process
+    from PIL import Image
+
+    derivative_images: list[DerivativeImage] = []
+    with Image.open(source_file) as source_image:
+        source_width, source_height = source_image.size
+
+        # JPEG is decoded at 1/2, 1/4 or 1/8 scale when the largest
+        # derivative does not need the full resolution
+        max_width = min(max(spec.width for spec in specs), source_width)
+        source_image.draft(
+            "RGB",
+            (max_width, max(round(source_height * max_width / source_width), 1)),
+        )
+        source_image.load()
+
+        image: Image.Image = source_image
+        if image.mode not in ("RGB", "RGBA", "L"):
+            has_alpha = "A" in image.mode or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for spec in specs:
+            # Never upscale
+            width = min(spec.width, source_width)
+            height = max(round(source_height * width / source_width), 1)
+
+            derivative: Image.Image = image
+            if derivative.size != (width, height):
+                derivative = derivative.resize(
+                    (width, height),
+                    resample=Image.Resampling.LANCZOS,
+                )
+            if spec.format == "jpeg" and derivative.mode == "RGBA":
+                derivative = derivative.convert("RGB")
+
+            buffer = io.BytesIO()
+            derivative.save(buffer, format=spec.format.upper(), quality=quality)
+            data = buffer.getvalue()
+
+            file_name = get_derivative_file_name(
+                spec=spec,
+                item_id=item_id,
+                output_layout=output_layout,
+            )
+            write_bytes_atomically(
+                target_file=output_dir / file_name,
+                data=data,
+                tmp_dir=get_tmp_dir(output_dir=output_dir),
+            )
+
+            derivative_images.append(
+                DerivativeImage(
+                    format=spec.format,
+                    target_width=spec.width,
+                    width=width,
+                    height=height,
+                    file_name=file_name,
+                    size=len(data),
+                    source_sha256=source_sha256,
+                )
+            )
+
+    return derivative_images
+
+
+class DerivativeGenerator:
+    def __init__(
+        self,
+        config: DerivativeConfig,
+        executor: ProcessPoolExecutor,
+    ) -> None:
+        self.config = config
+        self._executor = executor
+
+    async def generate(
+        self,
+        item_id: str,
+        output_dir: Path,
+        file_name: str,
+        sha256: str | None,
+        previous_derivatives: list[DerivativeImage] | None,
+        output_layout: OutputLayout,
+        logger: Logger,
+    ) -> list[DerivativeImage]:
+        # Derivatives of the same source bytes are not encoded again
+        kept_derivatives = [
+            derivative
+            for derivative in previous_derivatives or []
+            if derivative.source_sha256 == sha256
+            and any(derivative.matches(spec) for spec in self.config.specs)
+            and (output_dir / derivative.file_name).exists()
+        ]
+        missing_specs = [
+            spec
+            for spec in self.config.specs
+            if not any(derivative.matches(spec) for derivative in kept_derivatives)
+        ]
+        if not missing_specs:
+            return kept_derivatives
+
+        # Encoding is CPU-bound and stays off the event loop
+        loop = asyncio.get_running_loop()
+        try:
+            with PROFILER.span("derivatives", item_id=item_id):
+                generated_derivatives = await loop.run_in_executor(
+                    self._executor,
+                    encode_derivatives,
+                    output_dir / file_name,
+                    output_dir,
+                    item_id,
+                    sha256,
+                    missing_specs,
+                    self.config.quality,
+                    output_layout,
+                )
+        except Exception:
+            # Pillow raises a variety of errors for images it cannot decode.
+            # The source image is kept either way.
+            logger.exception(f"[id={item_id}] Failed to generate derivatives")
+            return kept_derivatives
+
+        logger.info(
+            f"[id={item_id}] Generated {len(generated_derivatives)} derivatives"
+        )
+        return kept_derivatives + generated_derivatives
+
+
+@contextmanager
+def open_derivative_generator(
+    config: DerivativeConfig | None,
+) -> Iterator[DerivativeGenerator | None]:
+    if config is None:
+        yield None
+        return
+
+    check_derivative_support(specs=config.specs)
+
+    # spawn, since forking a process running asyncio and its threads is unsafe
+    with ProcessPoolExecutor(
+        max_workers=config.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        yield DerivativeGenerator(config=config, executor=executor)
+
+
+def get_derivative_config_from_args(args: Namespace) -> DerivativeConfig | None:
+    specs: list[DerivativeSpec] = args.derivative
+    if not specs:
+        return None
+
+    return DerivativeConfig(
+        specs=specs,
+        quality=args.derivative_quality,
+        workers=args.derivative_workers,
+    )
+
+
+def add_derivative_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--derivative",
+        type=parse_derivative_spec,
+        action="append",
+        default=[],
+        help=(
+            "Generate a resized copy as FORMAT:WIDTH after each download "
+            f"({', '.join(DERIVATIVE_SUFFIXES)}; repeatable, requires Pillow)"
+        ),
+    )
+    parser.add_argument(
+        "--derivative_quality",
+        type=int,
+        default=80,
+        help="Encoder quality of derivatives",
+    )
+    parser.add_argument(
+        "--derivative_workers",
+        type=int,
+        help="Number of derivative encoding processes (default: CPU count)",
+    )
@@ -0,0 +1,409 @@
+import importlib.util
+import json
+import os
+import re
+import tarfile
+from argparse import ArgumentParser, Namespace
+from contextlib import ExitStack
+from datetime import datetime
+from io import BytesIO
+from logging import Logger
+from pathlib import Path
+from typing import IO, Any, Literal
+
+from pydantic import BaseModel
+
+from .app_config import AppConfig
+from .atomic_file import FILE_MODE, create_tmp_file, discard_tmp_file
+from .image_sources import get_source_output_dir
+from .manifest import ManifestReader, get_manifest_file
+from .metadata_store import MetadataStore
+from .output_layout import parse_output_layout
+from .state_store import StateStore, add_state_store_arguments, get_default_state_file
+
+ExportCompression = Literal["none", "zstd"]
+
+EXPORT_COMPRESSIONS: list[ExportCompression] = ["none", "zstd"]
+
+SHARD_SUFFIXES: dict[ExportCompression, str] = {
+    "none": ".tar",
+    "zstd": ".tar.zst",
+}
+
+SHARD_NUMBER_PATTERN = re.compile(r"-(\d{6})\.tar(?:\.zst)?$")
+
+
+def parse_export_compression(value: str) -> ExportCompression:
+    for compression in EXPORT_COMPRESSIONS:
+        if compression == value:
+            return compression
+    raise ValueError(f"Unknown export compression: {value}")
+
+
+class ExportMember(BaseModel):
+    name: str
+    # Of the data in the uncompressed tar stream
+    offset: int
+    size: int
+
+
+class ExportIndexRecord(BaseModel):
+    id: str
+    shard: str
+    fetched_at: datetime | None
+    sha256: str | None
+    members: list[ExportMember]
+
+
+def check_zstd_support() -> None:
+    # zstandard is an optional dependency, only needed for compressed shards
+    if importlib.util.find_spec("zstandard") is None:
+        raise ValueError("zstd shards require zstandard (poetry install -E zstd)")
+
+
+def get_index_file(export_dir: Path, source_name: str) -> Path:
+    return export_dir / f"{source_name}.index.jsonl"
+
+
+def get_shard_file_name(
+    source_name: str,
+    shard_number: int,
+    compression: ExportCompression,
+) -> str:
+    return f"{source_name}-{shard_number:06d}{SHARD_SUFFIXES[compression]}"
+
+
+def get_next_shard_number(export_dir: Path, source_name: str) -> int:
+    # Continues after every shard in the directory, indexed or not
+    shard_numbers = [
+        int(match.group(1))
+        for match in (
+            SHARD_NUMBER_PATTERN.search(shard_file.name)
+            for shard_file in export_dir.glob(f"{source_name}-*.tar*")
+        )
+        if match is not None
+    ]
+    return max(shard_numbers, default=-1) + 1
+
+
+def load_exported_fetched_ats(index_file: Path) -> dict[str, datetime | None]:
+    exported_fetched_ats: dict[str, datetime | None] = {}
+    if not index_file.exists():
+        return exported_fetched_ats
+
+    # The last record of an id wins, as in the manifest
+    with index_file.open("rb") as fp:
+        for line in fp:
+            record: dict[str, Any] = json.loads(line)
+            fetched_at: str | None = record["fetched_at"]
+            exported_fetched_ats[record["id"]] = (
+                datetime.fromisoformat(fetched_at) if fetched_at is not None else None
+            )
+    return exported_fetched_ats
+
+
+# Size-bounded tar, written to a temporary file until it is complete
+class ShardWriter:
+    def __init__(
+        self,
+        shard_file: Path,
+        compression: ExportCompression,
+        zstd_level: int,
+    ) -> None:
+        self.shard_file = shard_file
+
+        fd, self._tmp_file = create_tmp_file(target_file=shard_file)
+        self._fp = os.fdopen(fd, "wb")
+
+        self._stream: IO[bytes] = self._fp
+        if compression == "zstd":
+            import zstandard
+
+            self._stream = zstandard.ZstdCompressor(level=zstd_level).stream_writer(
+                self._fp,
+                closefd=False,
+            )
+
+        # Stream mode, so that nothing is read back or seeked
+        self._tar = tarfile.open(fileobj=self._stream, mode="w|")
+
+    @property
+    def size(self) -> int:
+        return self._tar.offset
+
+    def _add(self, tarinfo: tarfile.TarInfo, fileobj: IO[bytes]) -> ExportMember:
+        # Copied in blocks, without loading the file into memory
+        self._tar.addfile(tarinfo, fileobj)
+
+        padded_size = -(-tarinfo.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        return ExportMember(
+            name=tarinfo.name,
+            offset=self._tar.offset - padded_size,
+            size=tarinfo.size,
+        )
+
+    def add_file(self, name: str, source_file: Path, mtime: float) -> ExportMember:
+        with source_file.open("rb") as fp:
+            tarinfo = tarfile.TarInfo(name=name)
+            tarinfo.size = os.fstat(fp.fileno()).st_size
+            tarinfo.mtime = int(mtime)
+            tarinfo.mode = FILE_MODE
+            return self._add(tarinfo=tarinfo, fileobj=fp)
+
+    def add_bytes(self, name: str, data: bytes, mtime: float) -> ExportMember:
+        tarinfo = tarfile.TarInfo(name=name)
+        tarinfo.size = len(data)
+        tarinfo.mtime = int(mtime)
+        tarinfo.mode = FILE_MODE
+        return self._add(tarinfo=tarinfo, fileobj=BytesIO(data))
+
+    def close(self) -> None:
+        self._tar.close()
+        if self._stream is not self._fp:
+            # Ends the zstd frame
+            self._stream.close()
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        self._fp.close()
+
+        os.replace(self._tmp_file, self.shard_file)
+
+    def discard(self) -> None:
+        self._fp.close()
+        discard_tmp_file(tmp_file=self._tmp_file)
+
+
+def export_source(
+    source_name: str,
+    output_dir: Path,
+    export_dir: Path,
+    state_store: StateStore,
+    shard_size: int,
+    compression: ExportCompression,
+    zstd_level: int,
+    logger: Logger,
+) -> int:
+    state_store.check_migrated_source(
+        source_name=source_name,
+        output_dir=output_dir,
+    )
+    stored_output_layout = state_store.load_output_layout(source_name=source_name)
+    output_layout = parse_output_layout(stored_output_layout or "flat")
+
+    export_dir.mkdir(parents=True, exist_ok=True)
+    index_file = get_index_file(export_dir=export_dir, source_name=source_name)
+    exported_fetched_ats = load_exported_fetched_ats(index_file=index_file)
+    shard_number = get_next_shard_number(
+        export_dir=export_dir,
+        source_name=source_name,
+    )
+
+    exported_count = 0
+    shard: ShardWriter | None = None
+    shard_records: list[ExportIndexRecord] = []
+
+    with ExitStack() as stack:
+        # Read without the lock, so that a running crawl is not interrupted
+        manifest: ManifestReader | None = None
+        manifest_file = get_manifest_file(output_dir=output_dir)
+        if manifest_file.exists():
+            manifest = stack.enter_context(
+                ManifestReader(manifest_file=manifest_file),
+            )
+
+        metadata_store = MetadataStore(
+            output_dir=output_dir,
+            output_layout=output_layout,
+            metadata_output="files",
+            manifest=None,
+        )
+        index_fp = stack.enter_context(index_file.open("ab"))
+
+        def finish_shard(shard: ShardWriter) -> None:
+            shard.close()
+
+            # Indexed only once complete, so that an interrupted export
+            # exports the same items again
+            for record in shard_records:
+                index_fp.write(record.model_dump_json().encode("utf-8") + b"\n")
+            index_fp.flush()
+            os.fsync(index_fp.fileno())
+
+            logger.info(
+                f"Wrote {len(shard_records)} items to {shard.shard_file.name} "
+                f"({shard.size} bytes before compression)"
+            )
+            shard_records.clear()
+
+        try:
+            for item_state in state_store.iter_item_states(source_name=source_name):
+                if item_state.status != "fetched" or item_state.file_name is None:
+                    continue
+
+                # Refetched images are exported again
+                if (
+                    item_state.id in exported_fetched_ats
+                    and exported_fetched_ats[item_state.id] == item_state.fetched_at
+                ):
+                    continue
+
+                image_file = output_dir / item_state.file_name
+                if not image_file.exists():
+                    logger.warning(f"[id={item_state.id}] Missing {image_file}")
+                    continue
+
+                metadata: bytes | None = None
+                if manifest is not None:
+                    metadata = manifest.read(item_id=item_state.id)
+                if metadata is None and metadata_store.exists(item_id=item_state.id):
+                    metadata = metadata_store.read(item_id=item_state.id)
+
+                item_size = image_file.stat().st_size + len(metadata or b"")
+                if (
+                    shard is not None
+                    and shard.size > 0
+                    and shard.size + item_size > shard_size
+                ):
+                    finish_shard(shard=shard)
+                    shard = None
+
+                if shard is None:
+                    shard = ShardWriter(
+                        shard_file=export_dir
+                        / get_shard_file_name(
+                            source_name=source_name,
+                            shard_number=shard_number,
+                            compression=compression,
+                        ),
+                        compression=compression,
+                        zstd_level=zstd_level,
+                    )
+                    shard_number += 1
+
+                # WebDataset groups the members of a sample by the name
+                # before the first dot
+                mtime = image_file.stat().st_mtime
+                members = [
+                    shard.add_file(
+                        name=f"{item_state.id}{Path(item_state.file_name).suffix}",
+                        source_file=image_file,
+                        mtime=mtime,
+                    ),
+                ]
+                if metadata is not None:
+                    members.append(
+                        shard.add_bytes(
+                            name=f"{item_state.id}.json",
+                            data=metadata,
+                            mtime=mtime,
+                        )
+                    )
+
+                shard_records.append(
+                    ExportIndexRecord(
+                        id=item_state.id,
+                        shard=shard.shard_file.name,
+                        fetched_at=item_state.fetched_at,
+                        sha256=item_state.sha256,
+                        members=members,
+                    )
+                )
+                exported_count += 1
+
+            if shard is not None:
+                finish_shard(shard=shard)
+        except BaseException:
+            if shard is not None:
+                shard.discard()
+            raise
+
+    return exported_count
+
+
+def export_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source_name: str = args.source
+    output_dir: Path = args.output_dir
+    export_dir: Path = args.export_dir
+    state_file: Path | None = args.state_file
+    shard_size: int = args.shard_size
+    compression: ExportCompression = args.compression
+    zstd_level: int = args.zstd_level
+
+    if compression == "zstd":
+        check_zstd_support()
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with StateStore(state_file=state_file, mode="ro") as state_store:
+        exported_count = export_source(
+            source_name=source_name,
+            output_dir=get_source_output_dir(
+                source_name=source_name,
+                output_dir=output_dir,
+            ),
+            export_dir=export_dir,
+            state_store=state_store,
+            shard_size=shard_size,
+            compression=compression,
+            zstd_level=zstd_level,
+            logger=logger,
+        )
+
+    logger.info(f"Exported {exported_count} {source_name} items to {export_dir}")
+
+
+def add_export_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--source",
+        type=str,
+        required=True,
+        help=(
+            "Source whose output directory is exported "
+            "(e.g. twitter_tweet_images, youtube_lives_maxresdefault)"
+        ),
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help=(
+            "Output directory of the crawl "
+            "(youtube_lives_{variant} sources are read from its {variant} directory)"
+        ),
+    )
+    parser.add_argument(
+        "--export_dir",
+        type=Path,
+        required=True,
+        help="Directory of the tar shards and {source}.index.jsonl",
+    )
+    parser.add_argument(
+        "--shard_size",
+        type=int,
+        default=1024 * 1024 * 1024,
+        help="Start a new shard before a tar grows beyond this many bytes",
+    )
+    parser.add_argument(
+        "--compression",
+        type=parse_export_compression,
+        choices=EXPORT_COMPRESSIONS,
+        default="none",
+        help="zstd compresses each shard as a whole (requires zstandard)",
+    )
+    parser.add_argument(
+        "--zstd_level",
+        type=int,
+        default=3,
+        help="zstd compression level",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=export_command,
+    )
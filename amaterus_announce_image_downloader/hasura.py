@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections.abc import AsyncIterator, Callable, Coroutine
+from typing import Any, Protocol, TypeVar
+from urllib.parse import urljoin
+
+import httpx
+
+from .metrics import HASURA_REQUEST_DURATION
+from .profiler import PROFILER
+
+
+class HasuraQueryError(Exception):
+    pass
+
+
+class HasuraRow(Protocol):
+    @property
+    def id(self) -> str: ...
+
+
+RowT = TypeVar("RowT", bound=HasuraRow)
+
+
+async def post_hasura_query(
+    client: httpx.AsyncClient,
+    amaterus_hasura_url: str,
+    internal_useragent: str,
+    query: str,
+    variables: dict[str, Any],
+) -> Any:
+    amaterus_hasura_api_url = urljoin(amaterus_hasura_url, "v1/graphql")
+
+    sent_at = time.monotonic()
+    status = "error"
+    try:
+        raw_response = await client.post(
+            url=amaterus_hasura_api_url,
+            headers={
+                "User-Agent": internal_useragent,
+            },
+            json={
+                "query": query,
+                "variables": variables,
+            },
+        )
+        status = str(raw_response.status_code)
+    finally:
+        PROFILER.record(stage="hasura_query", started_at=sent_at)
+        HASURA_REQUEST_DURATION.observe(
+            value=time.monotonic() - sent_at,
+            labels=(status,),
+        )
+
+    raw_response.raise_for_status()
+
+    with PROFILER.span("hasura_decode"):
+        response = raw_response.json()
+    if "errors" in response:
+        raise HasuraQueryError(f"Hasura returned errors: {response['errors']}")
+
+    return response
+
+
+def get_keyset_page_where(
+    where: dict[str, Any],
+    cursor: str | None,
+) -> dict[str, Any]:
+    if cursor is None:
+        return where
+
+    cursor_where = {"id": {"_gt": cursor}}
+    if not where:
+        return cursor_where
+
+    return {"_and": [where, cursor_where]}
+
+
+async def iter_keyset_paginated(
+    fetch_page: Callable[[dict[str, Any], int], Coroutine[Any, Any, list[RowT]]],
+    where: dict[str, Any],
+    page_size: int,
+) -> AsyncIterator[RowT]:
+    if page_size < 1:
+        raise ValueError(f"page_size must be at least 1: {page_size}")
+
+    next_page_task: asyncio.Task[list[RowT]] | None = asyncio.create_task(
+        fetch_page(get_keyset_page_where(where=where, cursor=None), page_size)
+    )
+
+    # The next page is requested while the rows of the current page are consumed.
+    # fetch_page(where, limit) must order rows by id ascending.
+    try:
+        while next_page_task is not None:
+            page = await next_page_task
+
+            next_page_task = None
+            if len(page) == page_size:
+                cursor = page[-1].id
+                next_page_task = asyncio.create_task(
+                    fetch_page(
+                        get_keyset_page_where(where=where, cursor=cursor),
+                        page_size,
+                    )
+                )
+
+            for row in page:
+                yield row
+    finally:
+        if next_page_task is not None:
+            next_page_task.cancel()
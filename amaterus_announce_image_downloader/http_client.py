@@ -0,0 +1,157 @@
+import time
+from argparse import ArgumentParser, BooleanOptionalAction, Namespace
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from logging import Logger
+from typing import Any
+
+import httpx
+from pydantic import BaseModel
+
+from .app_config import AppConfig
+
+
+class HttpClientConfig(BaseModel):
+    http2: bool
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    timeout: float
+
+
+class HostConnectionStats(BaseModel):
+    requests: int = 0
+    new_connections: int = 0
+    handshake_seconds: float = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return max(self.requests - self.new_connections, 0)
+
+    @property
+    def average_handshake_seconds(self) -> float:
+        if self.new_connections == 0:
+            return 0
+        return self.handshake_seconds / self.new_connections
+
+
+class ConnectionStats:
+    def __init__(self) -> None:
+        self.hosts: dict[str, HostConnectionStats] = {}
+
+    def get_host_stats(self, host: str) -> HostConnectionStats:
+        host_stats = self.hosts.get(host)
+        if host_stats is None:
+            host_stats = HostConnectionStats()
+            self.hosts[host] = host_stats
+        return host_stats
+
+    async def on_request(self, request: httpx.Request) -> None:
+        host_stats = self.get_host_stats(request.url.host)
+        host_stats.requests += 1
+
+        connect_started_at: float | None = None
+
+        # httpcore reports connection lifecycle events through the trace extension.
+        # A request which never opens a TCP connection rode on a pooled one.
+        async def trace(event_name: str, info: dict[str, Any]) -> None:
+            nonlocal connect_started_at
+
+            if event_name == "connection.connect_tcp.started":
+                host_stats.new_connections += 1
+                connect_started_at = time.monotonic()
+            elif connect_started_at is not None and event_name in (
+                "connection.connect_tcp.complete",
+                "connection.start_tls.complete",
+            ):
+                now = time.monotonic()
+                host_stats.handshake_seconds += now - connect_started_at
+                connect_started_at = now
+
+        request.extensions["trace"] = trace
+
+    def log_summary(self, logger: Logger) -> None:
+        for host, host_stats in sorted(self.hosts.items()):
+            estimated_saved_seconds = (
+                host_stats.reused_connections * host_stats.average_handshake_seconds
+            )
+            logger.info(
+                f"[host={host}] "
+                f"requests={host_stats.requests}, "
+                f"new_connections={host_stats.new_connections}, "
+                f"reused_connections={host_stats.reused_connections}, "
+                "average_handshake_ms="
+                f"{host_stats.average_handshake_seconds * 1000:.1f}, "
+                f"estimated_saved_handshake_seconds={estimated_saved_seconds:.1f}"
+            )
+
+
+@asynccontextmanager
+async def open_http_client(
+    http_client_config: HttpClientConfig,
+    logger: Logger,
+) -> AsyncIterator[httpx.AsyncClient]:
+    connection_stats = ConnectionStats()
+
+    async with httpx.AsyncClient(
+        http2=http_client_config.http2,
+        limits=httpx.Limits(
+            max_connections=http_client_config.max_connections,
+            max_keepalive_connections=http_client_config.max_keepalive_connections,
+            keepalive_expiry=http_client_config.keepalive_expiry,
+        ),
+        timeout=http_client_config.timeout,
+        event_hooks={
+            "request": [connection_stats.on_request],
+        },
+    ) as client:
+        try:
+            yield client
+        finally:
+            connection_stats.log_summary(logger=logger)
+
+
+def get_http_client_config_from_args(args: Namespace) -> HttpClientConfig:
+    return HttpClientConfig(
+        http2=args.http2,
+        max_connections=args.http_max_connections,
+        max_keepalive_connections=args.http_max_keepalive_connections,
+        keepalive_expiry=args.http_keepalive_expiry,
+        timeout=args.http_timeout,
+    )
+
+
+def add_http_client_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--http2",
+        action=BooleanOptionalAction,
+        default=app_config.http2,
+        help="Enable HTTP/2 (requires the h2 package)",
+    )
+    parser.add_argument(
+        "--http_max_connections",
+        type=int,
+        default=app_config.http_max_connections,
+        help="Maximum number of connections in the HTTP connection pool",
+    )
+    parser.add_argument(
+        "--http_max_keepalive_connections",
+        type=int,
+        default=app_config.http_max_keepalive_connections,
+        help="Maximum number of idle keep-alive connections in the pool",
+    )
+    parser.add_argument(
+        "--http_keepalive_expiry",
+        type=float,
+        default=app_config.http_keepalive_expiry,
+        help="Seconds to keep an idle connection in the pool",
+    )
+    parser.add_argument(
+        "--http_timeout",
+        type=float,
+        default=app_config.http_timeout,
+        help="Timeout in seconds for each HTTP request",
+    )
@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import os
+import time
+import traceback
+from datetime import datetime
+from logging import Logger
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import httpx
+from pydantic import BaseModel
+
+from .atomic_file import create_tmp_file, discard_tmp_file, get_tmp_dir
+from .blob_store import publish_blob
+from .image_validator import ImageValidationError, StreamingImageValidator
+from .metrics import (
+    IMAGE_REQUEST_DURATION,
+    IMAGE_REQUESTS,
+    IMAGE_RESPONSE_BYTES,
+    RATE_LIMITER_RATE,
+    RATE_LIMITER_WAIT,
+)
+from .output_layout import OutputLayout, get_item_file_name
+from .profiler import PROFILER
+from .rate_limiter import THROTTLE_STATUS_CODES, HostRateLimiter, get_host
+from .retry_policy import is_transient_http_error, parse_retry_after
+
+JST = ZoneInfo("Asia/Tokyo")
+
+
+class ImageDownloadError(Exception):
+    def __init__(
+        self,
+        message: str,
+        fetched_at: datetime,
+        transient: bool = False,
+        retry_after: float | None = None,
+        status_code: int | None = None,
+    ) -> None:
+        super().__init__(message)
+        self.message = message
+        self.fetched_at = fetched_at
+        self.transient = transient
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+
+class SavedBody(BaseModel):
+    file_name: str
+    size: int
+    width: int
+    height: int
+    sha256: str
+    deduplicated: bool
+
+
+class CacheValidator(BaseModel):
+    url: str
+    etag: str | None
+    last_modified: str | None
+
+
+class DownloadedImage(BaseModel):
+    content_type: str
+    file_name: str
+    size: int
+    width: int
+    height: int
+    sha256: str
+    deduplicated: bool
+    etag: str | None
+    last_modified: str | None
+    fetched_at: datetime
+
+
+class ImageNotModified(BaseModel):
+    etag: str | None
+    last_modified: str | None
+    checked_at: datetime
+
+
+def get_suffix_from_content_type(content_type: str) -> str | None:
+    if content_type == "image/jpeg":
+        return ".jpg"
+    if content_type == "image/png":
+        return ".png"
+    return None
+
+
+async def save_response_body(
+    res: httpx.Response,
+    output_dir: Path,
+    file_name: str,
+    content_type: str,
+    suffix: str,
+    max_size: int,
+    content_addressed: bool,
+    fetched_at: datetime,
+) -> SavedBody:
+    output_file = output_dir / file_name
+
+    fd, tmp_file = create_tmp_file(
+        target_file=output_file,
+        tmp_dir=get_tmp_dir(output_dir=output_dir),
+    )
+    try:
+        size = 0
+        hash_object = hashlib.sha256()
+        # Checked as the body arrives, so that broken images are never published
+        validator = StreamingImageValidator(content_type=content_type)
+        with os.fdopen(fd, "wb") as fp:
+            async for chunk in res.aiter_bytes():
+                size += len(chunk)
+                if size > max_size:
+                    raise ImageDownloadError(
+                        message=f"Response body exceeds {max_size} bytes",
+                        fetched_at=fetched_at,
+                    )
+
+                validator.feed(chunk)
+                hash_object.update(chunk)
+                fp.write(chunk)
+
+            image_info = validator.finish()
+
+            fp.flush()
+            with PROFILER.span("fsync"):
+                await asyncio.to_thread(os.fsync, fp.fileno())
+
+        sha256 = hash_object.hexdigest()
+
+        if not content_addressed:
+            os.replace(tmp_file, output_file)
+            return SavedBody(
+                file_name=file_name,
+                size=size,
+                width=image_info.width,
+                height=image_info.height,
+                sha256=sha256,
+                deduplicated=False,
+            )
+
+        with PROFILER.span("publish_blob"):
+            published_blob = publish_blob(
+                tmp_file=tmp_file,
+                output_dir=output_dir,
+                sha256=sha256,
+                suffix=suffix,
+                file_name=file_name,
+            )
+    except ImageValidationError as error:
+        discard_tmp_file(tmp_file=tmp_file)
+        # Truncated bodies and error pages served as images are usually temporary
+        raise ImageDownloadError(
+            message=f"Invalid image: {error}",
+            fetched_at=fetched_at,
+            transient=True,
+        ) from error
+    except BaseException:
+        discard_tmp_file(tmp_file=tmp_file)
+        raise
+
+    return SavedBody(
+        file_name=published_blob.file_name,
+        size=size,
+        width=image_info.width,
+        height=image_info.height,
+        sha256=sha256,
+        deduplicated=published_blob.deduplicated,
+    )
+
+
+async def download_image(
+    client: httpx.AsyncClient,
+    rate_limiter: HostRateLimiter,
+    item_id: str,
+    url: str,
+    external_useragent: str,
+    output_dir: Path,
+    max_size: int,
+    content_addressed: bool,
+    output_layout: OutputLayout,
+    cache_validator: CacheValidator | None,
+    logger: Logger,
+) -> DownloadedImage | ImageNotModified:
+    host = get_host(url)
+
+    acquire_started_at = time.monotonic()
+    await rate_limiter.acquire(url)
+    PROFILER.record(
+        stage="rate_limit_wait",
+        started_at=acquire_started_at,
+        item_id=item_id,
+    )
+    RATE_LIMITER_WAIT.inc(
+        labels=(host,),
+        amount=time.monotonic() - acquire_started_at,
+    )
+
+    fetched_at = datetime.now().astimezone(tz=JST)
+
+    headers = {
+        "User-Agent": external_useragent,
+    }
+    # Validators belong to the URL which was fetched before
+    if cache_validator is not None and cache_validator.url != url:
+        cache_validator = None
+
+    if cache_validator is not None:
+        if cache_validator.etag is not None:
+            headers["If-None-Match"] = cache_validator.etag
+        if cache_validator.last_modified is not None:
+            headers["If-Modified-Since"] = cache_validator.last_modified
+
+    logger.info(f"[id={item_id}] Send request to {url}")
+    sent_at = time.monotonic()
+    status = "error"
+    try:
+        async with client.stream(
+            method="GET",
+            url=url,
+            headers=headers,
+        ) as res:
+            status = str(res.status_code)
+            PROFILER.record(
+                stage="response_headers",
+                started_at=sent_at,
+                item_id=item_id,
+            )
+            rate_limiter.on_response(
+                url=url,
+                latency=time.monotonic() - sent_at,
+                throttled=res.status_code in THROTTLE_STATUS_CODES,
+            )
+            RATE_LIMITER_RATE.set(
+                value=rate_limiter.get_bucket(host).rate,
+                labels=(host,),
+            )
+
+            # raise_for_status treats 304 as an error
+            if res.status_code == 304 and cache_validator is not None:
+                return ImageNotModified(
+                    etag=res.headers.get("ETag", cache_validator.etag),
+                    last_modified=res.headers.get(
+                        "Last-Modified",
+                        cache_validator.last_modified,
+                    ),
+                    checked_at=fetched_at,
+                )
+
+            res.raise_for_status()
+
+            # Headers are checked before the body is read
+            content_type = res.headers.get("Content-Type")
+            if content_type is None:
+                raise ImageDownloadError(
+                    message="Response header Content-Type cannot be None",
+                    fetched_at=fetched_at,
+                )
+
+            suffix = get_suffix_from_content_type(content_type)
+            if suffix is None:
+                raise ImageDownloadError(
+                    message=f"Unsupported Content-Type: {content_type}",
+                    fetched_at=fetched_at,
+                )
+
+            content_length = res.headers.get("Content-Length")
+            if content_length is not None and int(content_length) > max_size:
+                raise ImageDownloadError(
+                    message=f"Content-Length {content_length} exceeds {max_size} bytes",
+                    fetched_at=fetched_at,
+                )
+
+            # Reading the body, hashing and writing it to disk are interleaved
+            with PROFILER.span("response_body", item_id=item_id):
+                saved_body = await save_response_body(
+                    res=res,
+                    output_dir=output_dir,
+                    file_name=get_item_file_name(
+                        item_id=item_id,
+                        suffix=suffix,
+                        output_layout=output_layout,
+                    ),
+                    content_type=content_type,
+                    suffix=suffix,
+                    max_size=max_size,
+                    content_addressed=content_addressed,
+                    fetched_at=fetched_at,
+                )
+            IMAGE_RESPONSE_BYTES.inc(labels=(host,), amount=saved_body.size)
+    except httpx.HTTPError as error:
+        if isinstance(error, httpx.TransportError):
+            rate_limiter.on_response(url=url, latency=None, throttled=False)
+            RATE_LIMITER_RATE.set(
+                value=rate_limiter.get_bucket(host).rate,
+                labels=(host,),
+            )
+
+        retry_after: float | None = None
+        status_code: int | None = None
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = parse_retry_after(response=error.response, now=fetched_at)
+            status_code = error.response.status_code
+
+        raise ImageDownloadError(
+            message=traceback.format_exc(),
+            fetched_at=fetched_at,
+            transient=is_transient_http_error(error),
+            retry_after=retry_after,
+            status_code=status_code,
+        ) from error
+    finally:
+        IMAGE_REQUESTS.inc(labels=(host, status))
+        IMAGE_REQUEST_DURATION.observe(
+            value=time.monotonic() - sent_at,
+            labels=(host, status),
+        )
+
+    return DownloadedImage(
+        content_type=content_type,
+        file_name=saved_body.file_name,
+        size=saved_body.size,
+        width=saved_body.width,
+        height=saved_body.height,
+        sha256=saved_body.sha256,
+        deduplicated=saved_body.deduplicated,
+        etag=res.headers.get("ETag"),
+        last_modified=res.headers.get("Last-Modified"),
+        fetched_at=fetched_at,
+    )
@@ -0,0 +1,138 @@
+from datetime import datetime
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from .derivatives import DerivativeImage
+from .youtube_thumbnail import VariantMode
+
+
+class SourceRow(BaseModel):
+    id: str
+    updated_at: datetime
+
+
+class ImageMetadata(BaseModel):
+    id: str
+    url: str
+    content_type: str
+    file_name: str
+    size: int | None = None
+    width: int | None = None
+    height: int | None = None
+    sha256: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+    fetched_at: datetime
+    checked_at: datetime | None = None
+    derivatives: list[DerivativeImage] | None = None
+
+
+class ImageSource(BaseModel):
+    # Subcommand, also the prefix of its crawl_all arguments
+    name: str
+    # Amaterus Hasura table, also the source name in the state store
+    table_name: str
+    # Fields of the table to query, besides id and updated_at
+    row_model: type[SourceRow]
+    # Formatted with the row fields, {variant} and {thumbnail_base_url}
+    image_url_template: str
+    # Whether --variant selects among several images of a row
+    has_variants: bool
+    metadata_model: type[ImageMetadata]
+    # For help texts, e.g. Twitter
+    external_service_name: str
+
+
+class CrawlTarget(BaseModel):
+    source_name: str
+    output_dir: Path
+    # Tried in order, [None] for sources without variants
+    variants: list[str | None]
+
+
+def get_crawl_targets(
+    source: ImageSource,
+    output_dir: Path,
+    variants: list[str],
+    variant_mode: VariantMode,
+) -> list[CrawlTarget]:
+    if not source.has_variants:
+        return [
+            CrawlTarget(
+                source_name=source.table_name,
+                output_dir=output_dir,
+                variants=[None],
+            ),
+        ]
+
+    if variant_mode == "first":
+        return [
+            CrawlTarget(
+                source_name=source.table_name,
+                output_dir=output_dir,
+                variants=list(variants),
+            ),
+        ]
+
+    # Each variant is tracked as a source of its own
+    return [
+        CrawlTarget(
+            source_name=f"{source.table_name}_{variant}",
+            output_dir=output_dir / variant,
+            variants=[variant],
+        )
+        for variant in variants
+    ]
+
+
+def get_image_url(
+    source: ImageSource,
+    row: SourceRow,
+    variant: str | None,
+    thumbnail_base_url: str,
+) -> str:
+    return source.image_url_template.format(
+        **row.model_dump(),
+        variant=variant,
+        thumbnail_base_url=thumbnail_base_url,
+    )
+
+
+def get_source_query(source: ImageSource) -> str:
+    query_name = "".join(part.capitalize() for part in source.table_name.split("_"))
+    fields = "\n    ".join(source.row_model.model_fields)
+    return f"""
+query Get{query_name}(
+  $where: {source.table_name}_bool_exp!
+  $limit: Int!
+) {{
+  {source.table_name}(
+    where: $where
+    order_by: {{id: asc}}
+    limit: $limit
+  ) {{
+    {fields}
+  }}
+}}
+"""
+
+
+def get_source_probe_query(source: ImageSource) -> str:
+    query_name = "".join(part.capitalize() for part in source.table_name.split("_"))
+    return f"""
+query Probe{query_name}(
+  $where: {source.table_name}_bool_exp!
+) {{
+  {source.table_name}_aggregate(
+    where: $where
+  ) {{
+    aggregate {{
+      count
+      max {{
+        updated_at
+      }}
+    }}
+  }}
+}}
+"""
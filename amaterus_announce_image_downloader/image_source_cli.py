@@ -0,0 +1,238 @@
+import asyncio
+from argparse import ArgumentParser, Namespace
+from logging import Logger
+from pathlib import Path
+
+from .app_config import AppConfig
+from .crawler import (
+    add_crawler_arguments,
+    get_host_rate_limiter_from_args,
+    get_watch_interval_from_args,
+    run_crawl,
+)
+from .derivatives import (
+    DerivativeGenerator,
+    add_derivative_arguments,
+    get_derivative_config_from_args,
+    open_derivative_generator,
+)
+from .http_client import (
+    add_http_client_arguments,
+    get_http_client_config_from_args,
+    open_http_client,
+)
+from .image_source import ImageSource, SourceRow
+from .image_source_crawler import crawl_image_source
+from .listing_cache import get_listing_cache_config_from_args
+from .metadata_store import MetadataOutput
+from .metrics import (
+    add_metrics_arguments,
+    get_metrics_config_from_args,
+    open_metrics_server,
+    write_metrics_textfile,
+)
+from .output_layout import OutputLayout
+from .pending_file import read_pending_file
+from .profiler import add_profile_arguments, start_profile_from_args, write_profile
+from .retry_policy import add_retry_policy_arguments, get_retry_policy_from_args
+from .state_store import (
+    StateStore,
+    add_state_store_arguments,
+    get_default_state_file,
+)
+from .work_distribution import (
+    Shard,
+    add_work_distribution_arguments,
+    get_work_queue_config_from_args,
+)
+from .youtube_thumbnail import (
+    DEFAULT_THUMBNAIL_BASE_URL,
+    VariantMode,
+    add_thumbnail_variant_arguments,
+)
+
+
+def image_source_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source: ImageSource = args.image_source
+    amaterus_hasura_url: str = args.amaterus_hasura_url
+    internal_useragent: str = args.internal_useragent
+    external_useragent: str = args.external_useragent
+    variants: list[str] = args.variant
+    variant_mode: VariantMode = args.variant_mode
+    thumbnail_base_url: str = args.thumbnail_base_url
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+    http_client_config = get_http_client_config_from_args(args)
+    metrics_config = get_metrics_config_from_args(args)
+    retry_policy = get_retry_policy_from_args(args)
+    hasura_page_size: int = args.hasura_page_size
+    incremental: bool = args.incremental
+    watch_interval = get_watch_interval_from_args(args)
+    refresh_older_than: float | None = args.refresh_older_than
+    max_image_size: int = args.max_image_size
+    content_addressed: bool = args.content_addressed
+    output_layout: OutputLayout | None = args.output_layout
+    metadata_output: MetadataOutput = args.metadata_output
+    derivative_config = get_derivative_config_from_args(args)
+    concurrency: int = args.concurrency
+    rate_limiter = get_host_rate_limiter_from_args(args)
+    shard: Shard | None = args.shard
+    work_queue = get_work_queue_config_from_args(args)
+    pending_file: Path | None = args.pending_file
+    listing_cache_config = get_listing_cache_config_from_args(args)
+    profile_file = start_profile_from_args(args)
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    pending_rows: list[SourceRow] | None = None
+    if pending_file is not None:
+        if watch_interval is not None:
+            raise ValueError("--pending_file cannot be combined with --watch")
+
+        header, pending_rows = read_pending_file(
+            pending_file=pending_file,
+            source=source,
+        )
+        logger.info(
+            f"Read {len(pending_rows)} rows planned at "
+            f"{header.planned_at.isoformat()} from {pending_file}"
+        )
+
+    async def run(
+        state_store: StateStore,
+        derivative_generator: DerivativeGenerator | None,
+    ) -> None:
+        async with (
+            open_metrics_server(
+                metrics_config=metrics_config,
+                logger=logger,
+            ),
+            open_http_client(
+                http_client_config=http_client_config,
+                logger=logger,
+            ) as client,
+        ):
+
+            async def crawl(incremental: bool) -> None:
+                await crawl_image_source(
+                    client=client,
+                    source=source,
+                    amaterus_hasura_url=amaterus_hasura_url,
+                    internal_useragent=internal_useragent,
+                    external_useragent=external_useragent,
+                    variants=variants,
+                    variant_mode=variant_mode,
+                    thumbnail_base_url=thumbnail_base_url,
+                    output_dir=output_dir,
+                    state_store=state_store,
+                    retry_policy=retry_policy,
+                    hasura_page_size=hasura_page_size,
+                    incremental=incremental,
+                    refresh_older_than=refresh_older_than,
+                    max_image_size=max_image_size,
+                    content_addressed=content_addressed,
+                    output_layout=output_layout,
+                    metadata_output=metadata_output,
+                    derivative_generator=derivative_generator,
+                    concurrency=concurrency,
+                    rate_limiter=rate_limiter,
+                    shard=shard,
+                    work_queue=work_queue,
+                    pending_rows=pending_rows,
+                    listing_cache_config=listing_cache_config,
+                    logger=logger,
+                )
+
+            await run_crawl(
+                crawl=crawl,
+                incremental=incremental,
+                watch_interval=watch_interval,
+                logger=logger,
+            )
+
+        rate_limiter.log_summary(logger=logger)
+
+    try:
+        with (
+            StateStore(state_file=state_file) as state_store,
+            open_derivative_generator(
+                config=derivative_config,
+            ) as derivative_generator,
+        ):
+            asyncio.run(
+                run(
+                    state_store=state_store,
+                    derivative_generator=derivative_generator,
+                )
+            )
+    finally:
+        # Also written when a --watch run is interrupted
+        write_profile(profile_file=profile_file, logger=logger)
+
+    write_metrics_textfile(metrics_config=metrics_config)
+
+
+def add_image_source_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+    source: ImageSource,
+) -> None:
+    parser.add_argument(
+        "--amaterus_hasura_url",
+        type=str,
+        default=app_config.amaterus_hasura_url,
+        required=app_config.amaterus_hasura_url is None,
+        help="Amaterus Hasura URL",
+    )
+    parser.add_argument(
+        "--internal_useragent",
+        type=str,
+        default=app_config.internal_useragent,
+        required=app_config.internal_useragent is None,
+        help="Useragent for internal HTTP request (Amaterus Hasura)",
+    )
+    parser.add_argument(
+        "--external_useragent",
+        type=str,
+        default=app_config.external_useragent,
+        required=app_config.external_useragent is None,
+        help=f"Useragent for external HTTP request ({source.external_service_name})",
+    )
+    if source.has_variants:
+        add_thumbnail_variant_arguments(parser=parser, required=True)
+    else:
+        parser.set_defaults(
+            variant=[],
+            variant_mode="first",
+            thumbnail_base_url=DEFAULT_THUMBNAIL_BASE_URL,
+        )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory",
+    )
+    parser.add_argument(
+        "--pending_file",
+        type=Path,
+        help="Crawl the rows written by the plan command instead of listing them",
+    )
+    add_http_client_arguments(
+        parser=parser,
+        app_config=app_config,
+    )
+    add_state_store_arguments(parser=parser)
+    add_derivative_arguments(parser=parser)
+    add_metrics_arguments(parser=parser)
+    add_profile_arguments(parser=parser)
+    add_retry_policy_arguments(parser=parser)
+    add_crawler_arguments(parser=parser)
+    add_work_distribution_arguments(parser=parser)
+    parser.set_defaults(
+        handler=image_source_command,
+        image_source=source,
+    )
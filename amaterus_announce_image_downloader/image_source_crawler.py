@@ -0,0 +1,638 @@
+from collections.abc import AsyncIterator
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from logging import Logger
+from pathlib import Path
+from typing import Any
+
+import httpx
+from pydantic import BaseModel
+
+from .atomic_file import remove_stale_tmp_files
+from .crawler import STALE_TMP_FILE_MAX_AGE, record_download_error, run_workers
+from .derivatives import DerivativeGenerator, DerivativeImage
+from .hasura import HasuraQueryError, iter_keyset_paginated, post_hasura_query
+from .image_downloader import (
+    CacheValidator,
+    DownloadedImage,
+    ImageDownloadError,
+    ImageNotModified,
+    download_image,
+)
+from .image_source import (
+    CrawlTarget,
+    ImageSource,
+    SourceRow,
+    get_crawl_targets,
+    get_image_url,
+    get_source_query,
+)
+from .listing_cache import (
+    CachedListing,
+    ListingCacheConfig,
+    get_page_key,
+    revalidate_listing,
+)
+from .metadata_store import MetadataOutput, MetadataStore, open_metadata_store
+from .metrics import CRAWL_ITEMS
+from .output_layout import OutputLayout, resolve_output_layout
+from .profiler import PROFILER
+from .rate_limiter import HostRateLimiter
+from .retry_policy import RetryPolicy
+from .state_store import StateStore
+from .watermark import (
+    MAX_INCREMENTAL_DUE_IDS,
+    WatermarkTracker,
+    get_incremental_where,
+)
+from .work_distribution import Shard, WorkQueueConfig, is_in_shard
+from .youtube_thumbnail import VariantMode
+
+
+class FetchSourceRowsResponse(BaseModel):
+    data: dict[str, list[dict[str, Any]]]
+
+
+async def fetch_source_rows(
+    client: httpx.AsyncClient,
+    source: ImageSource,
+    amaterus_hasura_url: str,
+    internal_useragent: str,
+    where: dict[str, Any],
+    page_size: int,
+    state_store: StateStore,
+    listing_cache_config: ListingCacheConfig | None,
+    logger: Logger,
+) -> AsyncIterator[SourceRow]:
+    query = get_source_query(source=source)
+
+    cached_listing: CachedListing | None = None
+    if listing_cache_config is not None:
+        cached_listing = await revalidate_listing(
+            client=client,
+            source=source,
+            amaterus_hasura_url=amaterus_hasura_url,
+            internal_useragent=internal_useragent,
+            query=query,
+            where=where,
+            page_size=page_size,
+            state_store=state_store,
+            listing_cache_config=listing_cache_config,
+            logger=logger,
+        )
+
+    async def fetch_page(
+        where: dict[str, Any],
+        limit: int,
+    ) -> list[SourceRow]:
+        page_key = get_page_key(where=where, limit=limit)
+        if cached_listing is not None and cached_listing.hit:
+            with PROFILER.span("listing_cache_read"):
+                cached_rows = state_store.load_listing_cache_page(
+                    listing_key=cached_listing.entry.listing_key,
+                    page_key=page_key,
+                )
+                if cached_rows is not None:
+                    # JSON Lines of rows, parsed without the response wrapper
+                    return [
+                        source.row_model.model_validate_json(line)
+                        for line in cached_rows.splitlines()
+                    ]
+
+        raw_response = await post_hasura_query(
+            client=client,
+            amaterus_hasura_url=amaterus_hasura_url,
+            internal_useragent=internal_useragent,
+            query=query,
+            variables={
+                "where": where,
+                "limit": limit,
+            },
+        )
+
+        with PROFILER.span("hasura_validate"):
+            response = FetchSourceRowsResponse.model_validate(raw_response)
+            rows = response.data.get(source.table_name)
+            if rows is None:
+                raise HasuraQueryError(
+                    f"Hasura returned no {source.table_name}: {raw_response}"
+                )
+            page: list[SourceRow] = [
+                source.row_model.model_validate(row) for row in rows
+            ]
+
+        if cached_listing is not None:
+            state_store.save_listing_cache_page(
+                listing_key=cached_listing.entry.listing_key,
+                page_key=page_key,
+                rows="\n".join(row.model_dump_json() for row in page),
+            )
+        return page
+
+    async for row in iter_keyset_paginated(
+        fetch_page=fetch_page,
+        where=where,
+        page_size=page_size,
+    ):
+        yield row
+
+    if cached_listing is not None and not cached_listing.hit:
+        # Complete as of the probe, which came before the first page
+        state_store.save_listing_cache_entry(
+            entry=cached_listing.entry.model_copy(update={"complete": True}),
+        )
+
+
+async def iter_pending_rows(
+    pending_rows: list[SourceRow],
+) -> AsyncIterator[SourceRow]:
+    for row in pending_rows:
+        yield row
+
+
+async def download_source_image(
+    client: httpx.AsyncClient,
+    source: ImageSource,
+    rate_limiter: HostRateLimiter,
+    row: SourceRow,
+    variants: list[str | None],
+    thumbnail_base_url: str,
+    external_useragent: str,
+    output_dir: Path,
+    max_size: int,
+    content_addressed: bool,
+    output_layout: OutputLayout,
+    cache_validator: CacheValidator | None,
+    logger: Logger,
+) -> tuple[str | None, str, DownloadedImage | ImageNotModified]:
+    for index, variant in enumerate(variants):
+        image_url = get_image_url(
+            source=source,
+            row=row,
+            variant=variant,
+            thumbnail_base_url=thumbnail_base_url,
+        )
+
+        try:
+            downloaded_image = await download_image(
+                client=client,
+                rate_limiter=rate_limiter,
+                item_id=row.id,
+                url=image_url,
+                external_useragent=external_useragent,
+                output_dir=output_dir,
+                max_size=max_size,
+                content_addressed=content_addressed,
+                output_layout=output_layout,
+                cache_validator=cache_validator,
+                logger=logger,
+            )
+        except ImageDownloadError as error:
+            # Not every video has every variant
+            if error.status_code == 404 and index < len(variants) - 1:
+                logger.info(f"[id={row.id}] No {variant} image")
+                continue
+            raise
+
+        return variant, image_url, downloaded_image
+
+    raise ValueError("variants must not be empty")
+
+
+def load_listing_watermark(
+    targets: list[CrawlTarget],
+    state_store: StateStore,
+) -> datetime | None:
+    # The listing has to cover the target which is furthest behind
+    target_watermarks = [
+        state_store.load_watermark(source_name=target.source_name) for target in targets
+    ]
+    if None in target_watermarks:
+        return None
+
+    return min(
+        target_watermark
+        for target_watermark in target_watermarks
+        if target_watermark is not None
+    )
+
+
+def get_listing_where(
+    source: ImageSource,
+    targets: list[CrawlTarget],
+    state_store: StateStore,
+    watermark: datetime | None,
+    incremental: bool,
+    now: datetime,
+    refresh_before: datetime | None,
+    logger: Logger,
+) -> dict[str, Any]:
+    where: dict[str, Any] = {}
+    if incremental and watermark is not None:
+        due_retry_ids: set[str] = set()
+        refresh_ids: set[str] = set()
+        for target in targets:
+            due_retry_ids.update(
+                state_store.get_due_retry_ids(
+                    source_name=target.source_name,
+                    now=now,
+                )
+            )
+            if refresh_before is not None:
+                refresh_ids.update(
+                    state_store.get_refresh_ids(
+                        source_name=target.source_name,
+                        refresh_before=refresh_before,
+                    )
+                )
+        due_ids = due_retry_ids | refresh_ids
+        if len(due_ids) > MAX_INCREMENTAL_DUE_IDS:
+            logger.info(
+                f"Fetch all {source.table_name}, "
+                f"{len(due_retry_ids)} due retries and {len(refresh_ids)} refreshes "
+                f"are more than {MAX_INCREMENTAL_DUE_IDS}"
+            )
+            return where
+
+        logger.info(
+            f"Fetch {source.table_name} updated since {watermark.isoformat()}, "
+            f"{len(due_retry_ids)} due retries and {len(refresh_ids)} refreshes"
+        )
+        where = get_incremental_where(
+            updated_since=watermark,
+            due_ids=sorted(due_ids),
+        )
+
+    return where
+
+
+async def crawl_image_source(
+    client: httpx.AsyncClient,
+    source: ImageSource,
+    amaterus_hasura_url: str,
+    internal_useragent: str,
+    external_useragent: str,
+    variants: list[str],
+    variant_mode: VariantMode,
+    thumbnail_base_url: str,
+    output_dir: Path,
+    state_store: StateStore,
+    retry_policy: RetryPolicy,
+    hasura_page_size: int,
+    incremental: bool,
+    refresh_older_than: float | None,
+    max_image_size: int,
+    content_addressed: bool,
+    output_layout: OutputLayout | None,
+    metadata_output: MetadataOutput,
+    derivative_generator: DerivativeGenerator | None,
+    concurrency: int,
+    rate_limiter: HostRateLimiter,
+    shard: Shard | None,
+    work_queue: WorkQueueConfig | None,
+    pending_rows: list[SourceRow] | None,
+    listing_cache_config: ListingCacheConfig | None,
+    logger: Logger,
+) -> None:
+    if work_queue is not None and metadata_output != "files":
+        # The manifest is locked by a single process
+        raise ValueError("--work_queue requires --metadata_output files")
+
+    targets = get_crawl_targets(
+        source=source,
+        output_dir=output_dir,
+        variants=variants,
+        variant_mode=variant_mode,
+    )
+
+    output_layouts: dict[str, OutputLayout] = {}
+    for target in targets:
+        state_store.ensure_migrated_source(
+            source_name=target.source_name,
+            output_dir=target.output_dir,
+        )
+        remove_stale_tmp_files(
+            output_dir=target.output_dir,
+            max_age=STALE_TMP_FILE_MAX_AGE,
+        )
+        output_layouts[target.source_name] = resolve_output_layout(
+            state_store=state_store,
+            source_name=target.source_name,
+            output_layout=output_layout,
+        )
+
+    if work_queue is not None:
+        # Left over by a previous run of this worker which crashed
+        released_count = state_store.release_leases(
+            worker_id=work_queue.worker_id,
+            expired_before=None,
+        )
+        if released_count > 0:
+            logger.info(f"Released {released_count} leases of {work_queue.worker_id}")
+
+    now = datetime.now().astimezone()
+    refresh_before: datetime | None = None
+    if refresh_older_than is not None:
+        refresh_before = now - timedelta(seconds=refresh_older_than)
+
+    skip_ids = {
+        target.source_name: state_store.get_skip_ids(
+            source_name=target.source_name,
+            now=now,
+            refresh_before=refresh_before,
+        )
+        for target in targets
+    }
+
+    watermark = load_listing_watermark(targets=targets, state_store=state_store)
+    watermark_tracker = WatermarkTracker(updated_at=watermark)
+
+    rows: AsyncIterator[SourceRow]
+    if pending_rows is not None:
+        # Listed by the plan command, so Amaterus Hasura is not queried again
+        logger.info(f"Crawl {len(pending_rows)} planned {source.table_name} rows")
+        rows = iter_pending_rows(pending_rows=pending_rows)
+    else:
+        # A row inserted during the listing below the keyset cursor is not
+        # listed, so the watermark must not move past the start of the listing
+        watermark_tracker.hold(updated_at=now)
+        rows = fetch_source_rows(
+            client=client,
+            source=source,
+            amaterus_hasura_url=amaterus_hasura_url,
+            internal_useragent=internal_useragent,
+            where=get_listing_where(
+                source=source,
+                targets=targets,
+                state_store=state_store,
+                watermark=watermark,
+                incremental=incremental,
+                now=now,
+                refresh_before=refresh_before,
+                logger=logger,
+            ),
+            page_size=hasura_page_size,
+            state_store=state_store,
+            listing_cache_config=listing_cache_config,
+            logger=logger,
+        )
+
+    async def fetch_row_target(
+        row: SourceRow,
+        target: CrawlTarget,
+    ) -> None:
+        metadata_store = metadata_stores[target.source_name]
+
+        # Fetched images are refreshed with a conditional request
+        with PROFILER.span("state_lookup", item_id=row.id):
+            item_state = state_store.get_item_state(
+                source_name=target.source_name,
+                item_id=row.id,
+            )
+            cache_validator: CacheValidator | None = None
+            if (
+                item_state is not None
+                and item_state.status == "fetched"
+                and item_state.url is not None
+                and metadata_store.exists(item_id=row.id)
+            ):
+                cache_validator = CacheValidator(
+                    url=item_state.url,
+                    etag=item_state.etag,
+                    last_modified=item_state.last_modified,
+                )
+
+        try:
+            variant, image_url, downloaded_image = await download_source_image(
+                client=client,
+                source=source,
+                rate_limiter=rate_limiter,
+                row=row,
+                variants=target.variants,
+                thumbnail_base_url=thumbnail_base_url,
+                external_useragent=external_useragent,
+                output_dir=target.output_dir,
+                max_size=max_image_size,
+                content_addressed=content_addressed,
+                output_layout=output_layouts[target.source_name],
+                cache_validator=cache_validator,
+                logger=logger,
+            )
+        except ImageDownloadError as error:
+            if cache_validator is not None:
+                # Keep the previously fetched image until the next refresh
+                logger.warning(
+                    f"[id={row.id}] Failed to refresh: "
+                    f"{error.message.strip().splitlines()[-1]}"
+                )
+                with PROFILER.span("state_write", item_id=row.id):
+                    state_store.record_checked(
+                        source_name=target.source_name,
+                        item_id=row.id,
+                        etag=cache_validator.etag,
+                        last_modified=cache_validator.last_modified,
+                        checked_at=error.fetched_at,
+                    )
+                CRAWL_ITEMS.inc(labels=(target.source_name, "refresh_failed"))
+                return
+
+            with PROFILER.span("state_write", item_id=row.id):
+                record_download_error(
+                    state_store=state_store,
+                    retry_policy=retry_policy,
+                    source_name=target.source_name,
+                    item_id=row.id,
+                    error=error,
+                    logger=logger,
+                )
+            return
+
+        if isinstance(downloaded_image, ImageNotModified):
+            logger.info(f"[id={row.id}] Not modified")
+
+            metadata = source.metadata_model.model_validate_json(
+                metadata_store.read(item_id=row.id),
+            )
+
+            # Derivatives added to the configuration since the last fetch
+            derivatives = metadata.derivatives
+            if derivative_generator is not None:
+                derivatives = await derivative_generator.generate(
+                    item_id=row.id,
+                    output_dir=target.output_dir,
+                    file_name=metadata.file_name,
+                    sha256=metadata.sha256,
+                    previous_derivatives=metadata.derivatives,
+                    output_layout=output_layouts[target.source_name],
+                    logger=logger,
+                )
+
+            with PROFILER.span("metadata_write", item_id=row.id):
+                metadata_store.write(
+                    item_id=row.id,
+                    text=metadata.model_copy(
+                        update={
+                            "etag": downloaded_image.etag,
+                            "last_modified": downloaded_image.last_modified,
+                            "checked_at": downloaded_image.checked_at,
+                            "derivatives": derivatives,
+                        },
+                    ).model_dump_json(),
+                )
+
+            with PROFILER.span("state_write", item_id=row.id):
+                state_store.record_checked(
+                    source_name=target.source_name,
+                    item_id=row.id,
+                    etag=downloaded_image.etag,
+                    last_modified=downloaded_image.last_modified,
+                    checked_at=downloaded_image.checked_at,
+                )
+            CRAWL_ITEMS.inc(labels=(target.source_name, "not_modified"))
+            return
+
+        if downloaded_image.deduplicated:
+            logger.info(f"[id={row.id}] Deduplicated to blob {downloaded_image.sha256}")
+
+        derivatives = None
+        if derivative_generator is not None:
+            previous_derivatives: list[DerivativeImage] | None = None
+            if cache_validator is not None:
+                # Refetched bytes which did not change keep their derivatives
+                previous_derivatives = source.metadata_model.model_validate_json(
+                    metadata_store.read(item_id=row.id),
+                ).derivatives
+
+            derivatives = await derivative_generator.generate(
+                item_id=row.id,
+                output_dir=target.output_dir,
+                file_name=downloaded_image.file_name,
+                sha256=downloaded_image.sha256,
+                previous_derivatives=previous_derivatives,
+                output_layout=output_layouts[target.source_name],
+                logger=logger,
+            )
+
+        with PROFILER.span("metadata_write", item_id=row.id):
+            # Models of sources without variants ignore the variant field
+            metadata_store.write(
+                item_id=row.id,
+                text=source.metadata_model.model_validate(
+                    {
+                        "id": row.id,
+                        "url": image_url,
+                        "variant": variant,
+                        "content_type": downloaded_image.content_type,
+                        "file_name": downloaded_image.file_name,
+                        "size": downloaded_image.size,
+                        "width": downloaded_image.width,
+                        "height": downloaded_image.height,
+                        "sha256": downloaded_image.sha256,
+                        "etag": downloaded_image.etag,
+                        "last_modified": downloaded_image.last_modified,
+                        "fetched_at": downloaded_image.fetched_at,
+                        "checked_at": downloaded_image.fetched_at,
+                        "derivatives": derivatives,
+                    }
+                ).model_dump_json(),
+            )
+
+        with PROFILER.span("state_write", item_id=row.id):
+            state_store.record_fetched(
+                source_name=target.source_name,
+                item_id=row.id,
+                url=image_url,
+                content_type=downloaded_image.content_type,
+                file_name=downloaded_image.file_name,
+                size=downloaded_image.size,
+                sha256=downloaded_image.sha256,
+                stored_as_blob=content_addressed,
+                etag=downloaded_image.etag,
+                last_modified=downloaded_image.last_modified,
+                fetched_at=downloaded_image.fetched_at,
+            )
+        CRAWL_ITEMS.inc(labels=(target.source_name, "fetched"))
+
+    async def crawl_row_target(
+        row: SourceRow,
+        target: CrawlTarget,
+    ) -> None:
+        if row.id in skip_ids[target.source_name]:
+            # already fetched, failed permanently or waiting for retry
+            CRAWL_ITEMS.inc(labels=(target.source_name, "skipped"))
+            return
+
+        if work_queue is None:
+            await fetch_row_target(row=row, target=target)
+            return
+
+        with PROFILER.span("state_lease", item_id=row.id):
+            acquired = state_store.acquire_lease(
+                source_name=target.source_name,
+                item_id=row.id,
+                worker_id=work_queue.worker_id,
+                now=datetime.now().astimezone(),
+                lease_duration=work_queue.lease_duration,
+            )
+        if not acquired:
+            logger.info(f"[id={row.id}] Leased by another worker")
+            watermark_tracker.hold(updated_at=row.updated_at)
+            CRAWL_ITEMS.inc(labels=(target.source_name, "leased"))
+            return
+
+        try:
+            # Another worker may have finished the item since skip_ids was loaded
+            if state_store.should_skip(
+                source_name=target.source_name,
+                item_id=row.id,
+                now=now,
+                refresh_before=refresh_before,
+            ):
+                CRAWL_ITEMS.inc(labels=(target.source_name, "skipped"))
+                return
+
+            await fetch_row_target(row=row, target=target)
+        finally:
+            state_store.release_lease(
+                source_name=target.source_name,
+                item_id=row.id,
+                worker_id=work_queue.worker_id,
+            )
+
+    async def crawl_row(row: SourceRow) -> None:
+        watermark_tracker.observe(updated_at=row.updated_at)
+
+        if shard is not None and not is_in_shard(item_id=row.id, shard=shard):
+            return
+
+        # Variants of a row share the pooled connection to the image host
+        for target in targets:
+            await crawl_row_target(row=row, target=target)
+
+    with ExitStack() as stack:
+        metadata_stores: dict[str, MetadataStore] = {
+            target.source_name: stack.enter_context(
+                open_metadata_store(
+                    output_dir=target.output_dir,
+                    output_layout=output_layouts[target.source_name],
+                    metadata_output=metadata_output,
+                    logger=logger,
+                )
+            )
+            for target in targets
+        }
+
+        await run_workers(
+            items=rows,
+            worker=crawl_row,
+            concurrency=concurrency,
+            source_name=source.table_name,
+        )
+
+    saved_updated_at = watermark_tracker.get_saved_updated_at()
+    if saved_updated_at is not None:
+        for target in targets:
+            state_store.save_watermark(
+                source_name=target.source_name,
+                updated_at=saved_updated_at,
+            )
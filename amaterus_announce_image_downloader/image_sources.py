@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from .image_source import ImageMetadata, ImageSource, SourceRow
+
+
+class TwitterTweetImage(SourceRow):
+    url: str
+
+
+class YoutubeThumbnailRow(SourceRow):
+    remote_youtube_video_id: str
+
+
+class YoutubeThumbnailImageMetadata(ImageMetadata):
+    variant: str | None = None
+
+
+YOUTUBE_THUMBNAIL_IMAGE_URL_TEMPLATE = (
+    "{thumbnail_base_url}{remote_youtube_video_id}/{variant}.jpg"
+)
+
+# A new source only needs an entry here to get a subcommand, a crawl_all
+# argument and a benchmark scenario
+IMAGE_SOURCES = [
+    ImageSource(
+        name="twitter_tweet_image",
+        table_name="twitter_tweet_images",
+        row_model=TwitterTweetImage,
+        image_url_template="{url}",
+        has_variants=False,
+        metadata_model=ImageMetadata,
+        external_service_name="Twitter",
+    ),
+    ImageSource(
+        name="youtube_live_thumbnail_image",
+        table_name="youtube_lives",
+        row_model=YoutubeThumbnailRow,
+        image_url_template=YOUTUBE_THUMBNAIL_IMAGE_URL_TEMPLATE,
+        has_variants=True,
+        metadata_model=YoutubeThumbnailImageMetadata,
+        external_service_name="YouTube",
+    ),
+    ImageSource(
+        name="youtube_video_thumbnail_image",
+        table_name="youtube_videos",
+        row_model=YoutubeThumbnailRow,
+        image_url_template=YOUTUBE_THUMBNAIL_IMAGE_URL_TEMPLATE,
+        has_variants=True,
+        metadata_model=YoutubeThumbnailImageMetadata,
+        external_service_name="YouTube",
+    ),
+]
+
+
+def get_source_output_dir(source_name: str, output_dir: Path) -> Path:
+    # The {table_name}_{variant} sources of --variant_mode all share the state
+    # file of output_dir but keep their files in output_dir/{variant}
+    for source in IMAGE_SOURCES:
+        if not source.has_variants:
+            continue
+        variant = source_name.removeprefix(f"{source.table_name}_")
+        if variant != source_name:
+            return output_dir / variant
+    return output_dir
+
+
+def get_image_source(name: str) -> ImageSource:
+    for source in IMAGE_SOURCES:
+        if source.name == name:
+            return source
+    raise ValueError(f"Unknown image source: {name}")
@@ -0,0 +1,177 @@
+from pydantic import BaseModel
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+JPEG_EOI = b"\xff\xd9"
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+PNG_IEND = b"\x00\x00\x00\x00IEND\xaeB`\x82"
+
+# Start of frame markers carrying the dimensions (DHT, JPG and DAC excluded)
+JPEG_SOF_MARKERS = {
+    0xC0,
+    0xC1,
+    0xC2,
+    0xC3,
+    0xC5,
+    0xC6,
+    0xC7,
+    0xC9,
+    0xCA,
+    0xCB,
+    0xCD,
+    0xCE,
+    0xCF,
+}
+JPEG_SOS_MARKER = 0xDA
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD9)}
+
+# Some encoders pad the file after EOI
+TRAILING_PADDING_BYTES = b"\x00\r\n "
+TAIL_SIZE = 64
+
+CONTENT_TYPE_FORMATS = {
+    "image/jpeg": "jpeg",
+    "image/png": "png",
+}
+
+
+class ImageValidationError(Exception):
+    pass
+
+
+class ImageInfo(BaseModel):
+    format: str
+    width: int
+    height: int
+
+
+class StreamingImageValidator:
+    def __init__(self, content_type: str) -> None:
+        self.expected_format = CONTENT_TYPE_FORMATS.get(content_type)
+        if self.expected_format is None:
+            raise ImageValidationError(f"Unsupported Content-Type: {content_type}")
+
+        self.format: str | None = None
+        self.width: int | None = None
+        self.height: int | None = None
+
+        # Bytes kept until the dimensions are parsed
+        self._header = bytearray()
+        # JPEG segment bytes still to be skipped
+        self._skip = 0
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> None:
+        self._tail = (self._tail + chunk[-TAIL_SIZE:])[-TAIL_SIZE:]
+
+        if self.width is not None:
+            return
+
+        self._header.extend(chunk)
+        if self.format is None:
+            self.detect_format()
+        if self.format == "png":
+            self.parse_png_header()
+        elif self.format == "jpeg":
+            self.parse_jpeg_header()
+
+    def detect_format(self) -> None:
+        if len(self._header) < len(PNG_MAGIC):
+            return
+
+        if self._header.startswith(JPEG_MAGIC):
+            self.format = "jpeg"
+        elif self._header.startswith(PNG_MAGIC):
+            self.format = "png"
+        else:
+            # Typically an HTML error page served with an image Content-Type
+            raise ImageValidationError(
+                f"Unknown magic bytes: {bytes(self._header[:8]).hex()}"
+            )
+
+        if self.format != self.expected_format:
+            raise ImageValidationError(
+                f"Body is {self.format} but Content-Type is {self.expected_format}"
+            )
+
+        # Drop SOI, the segment parser starts at the first marker after it
+        if self.format == "jpeg":
+            del self._header[:2]
+
+    def parse_png_header(self) -> None:
+        # Signature, then the IHDR chunk: length, type, width, height
+        if len(self._header) < 24:
+            return
+        if self._header[12:16] != b"IHDR":
+            raise ImageValidationError("PNG does not start with IHDR")
+
+        self.width = int.from_bytes(self._header[16:20], "big")
+        self.height = int.from_bytes(self._header[20:24], "big")
+        self._header.clear()
+
+    def parse_jpeg_header(self) -> None:
+        header = self._header
+        while True:
+            if self._skip > 0:
+                skipped = min(self._skip, len(header))
+                del header[:skipped]
+                self._skip -= skipped
+                if self._skip > 0:
+                    return
+
+            if len(header) < 2:
+                return
+            if header[0] != 0xFF:
+                raise ImageValidationError("Invalid JPEG marker")
+
+            marker = header[1]
+            if marker == 0xFF:
+                # Fill byte
+                del header[:1]
+                continue
+            if marker in JPEG_STANDALONE_MARKERS:
+                del header[:2]
+                continue
+            if marker == JPEG_SOS_MARKER:
+                raise ImageValidationError("JPEG has no frame header before scan")
+
+            if len(header) < 4:
+                return
+            length = int.from_bytes(header[2:4], "big")
+            if length < 2:
+                raise ImageValidationError(f"Invalid JPEG segment length: {length}")
+
+            if marker in JPEG_SOF_MARKERS:
+                # Length, precision, height, width
+                if len(header) < 9:
+                    return
+                self.height = int.from_bytes(header[5:7], "big")
+                self.width = int.from_bytes(header[7:9], "big")
+                header.clear()
+                return
+
+            del header[:4]
+            self._skip = length - 2
+
+    def finish(self) -> ImageInfo:
+        if self.format is None:
+            raise ImageValidationError("Body is too short to be an image")
+        if self.width is None or self.height is None:
+            raise ImageValidationError(f"Truncated {self.format} header")
+        if self.width == 0 or self.height == 0:
+            raise ImageValidationError(
+                f"Invalid dimensions: {self.width}x{self.height}"
+            )
+
+        tail = self._tail.rstrip(TRAILING_PADDING_BYTES)
+        if self.format == "jpeg" and not tail.endswith(JPEG_EOI):
+            raise ImageValidationError("Truncated JPEG: no EOI marker")
+        if self.format == "png" and not self._tail.endswith(PNG_IEND):
+            raise ImageValidationError("Truncated PNG: no IEND chunk")
+
+        return ImageInfo(
+            format=self.format,
+            width=self.width,
+            height=self.height,
+        )
@@ -0,0 +1,160 @@
+import hashlib
+import json
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta
+from logging import Logger
+from typing import Any
+
+import httpx
+from pydantic import BaseModel
+
+from .hasura import HasuraQueryError, post_hasura_query
+from .image_source import ImageSource, get_source_probe_query
+from .state_store import ListingCacheEntry, StateStore
+
+# Incremental listings get a new key whenever the watermark moves
+LISTING_CACHE_RETENTION: float = 7 * 24 * 3600
+
+
+class ListingCacheConfig(BaseModel):
+    ttl: float
+
+
+class CachedListing(BaseModel):
+    entry: ListingCacheEntry
+    # Whether the stored pages can be served instead of querying
+    hit: bool
+
+
+class ProbeListingResponse(BaseModel):
+    data: dict[str, dict[str, dict[str, Any]]]
+
+
+def get_cache_key(value: dict[str, Any]) -> str:
+    text = json.dumps(value, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_listing_key(query: str, where: dict[str, Any], page_size: int) -> str:
+    return get_cache_key({"query": query, "where": where, "limit": page_size})
+
+
+def get_page_key(where: dict[str, Any], limit: int) -> str:
+    return get_cache_key({"where": where, "limit": limit})
+
+
+async def probe_listing(
+    client: httpx.AsyncClient,
+    source: ImageSource,
+    amaterus_hasura_url: str,
+    internal_useragent: str,
+    where: dict[str, Any],
+) -> str:
+    raw_response = await post_hasura_query(
+        client=client,
+        amaterus_hasura_url=amaterus_hasura_url,
+        internal_useragent=internal_useragent,
+        query=get_source_probe_query(source=source),
+        variables={
+            "where": where,
+        },
+    )
+
+    response = ProbeListingResponse.model_validate(raw_response)
+    aggregate = response.data.get(f"{source.table_name}_aggregate")
+    if aggregate is None:
+        raise HasuraQueryError(
+            f"Hasura returned no {source.table_name}_aggregate: {raw_response}"
+        )
+
+    # Changes with inserted, deleted and updated rows. Not max(id), which uuid
+    # keys do not have and which says nothing of non-monotonic ids.
+    return json.dumps(aggregate, sort_keys=True, separators=(",", ":"))
+
+
+async def revalidate_listing(
+    client: httpx.AsyncClient,
+    source: ImageSource,
+    amaterus_hasura_url: str,
+    internal_useragent: str,
+    query: str,
+    where: dict[str, Any],
+    page_size: int,
+    state_store: StateStore,
+    listing_cache_config: ListingCacheConfig,
+    logger: Logger,
+) -> CachedListing | None:
+    now = datetime.now().astimezone()
+    state_store.delete_listing_cache_entries(
+        cached_before=now - timedelta(seconds=LISTING_CACHE_RETENTION),
+    )
+
+    listing_key = get_listing_key(query=query, where=where, page_size=page_size)
+    entry = state_store.load_listing_cache_entry(listing_key=listing_key)
+
+    if (
+        entry is not None
+        and entry.complete
+        and now - entry.cached_at < timedelta(seconds=listing_cache_config.ttl)
+    ):
+        logger.info(f"Use the cached {source.table_name} listing")
+        return CachedListing(entry=entry, hit=True)
+
+    try:
+        fingerprint = await probe_listing(
+            client=client,
+            source=source,
+            amaterus_hasura_url=amaterus_hasura_url,
+            internal_useragent=internal_useragent,
+            where=where,
+        )
+    except HasuraQueryError as error:
+        # e.g. aggregations not allowed for the role
+        logger.warning(f"Listing cache disabled, the probe failed: {error}")
+        return None
+
+    if entry is not None and entry.complete and entry.fingerprint == fingerprint:
+        logger.info(f"Use the cached {source.table_name} listing, unchanged")
+        entry = entry.model_copy(update={"cached_at": now})
+        state_store.save_listing_cache_entry(entry=entry)
+        return CachedListing(entry=entry, hit=True)
+
+    # Pages of the previous listing may start at other ids
+    state_store.delete_listing_cache_pages(listing_key=listing_key)
+    entry = ListingCacheEntry(
+        listing_key=listing_key,
+        fingerprint=fingerprint,
+        cached_at=now,
+        complete=False,
+    )
+    state_store.save_listing_cache_entry(entry=entry)
+    return CachedListing(entry=entry, hit=False)
+
+
+def get_listing_cache_config_from_args(args: Namespace) -> ListingCacheConfig | None:
+    listing_cache: bool = args.listing_cache
+    if not listing_cache:
+        return None
+
+    return ListingCacheConfig(
+        ttl=args.listing_cache_ttl,
+    )
+
+
+def add_listing_cache_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--listing_cache",
+        action="store_true",
+        help=(
+            "Keep Amaterus Hasura listings in the state file and reuse them "
+            "while an aggregate count/max probe of the table does not change"
+        ),
+    )
+    parser.add_argument(
+        "--listing_cache_ttl",
+        type=float,
+        default=0,
+        help="Seconds during which a cached listing is reused without the probe",
+    )
@@ -0,0 +1,263 @@
+import fcntl
+import importlib.util
+import json
+import os
+import re
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+from types import NoneType, UnionType
+from typing import IO, Any, Self, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from .atomic_file import create_tmp_file, discard_tmp_file, get_tmp_dir
+
+MANIFEST_FILE_NAME = "manifest.jsonl"
+
+# Compacted at close once superseded records outnumber the live ones
+MANIFEST_COMPACT_STALE_RATIO = 1.0
+
+# model_dump_json writes id as the first field, so the scan does not have to
+# decode whole records
+RECORD_ID_PATTERN = re.compile(rb'^\{"id":("(?:[^"\\]|\\.)*")')
+
+
+class ManifestLockedError(Exception):
+    pass
+
+
+def get_manifest_file(output_dir: Path) -> Path:
+    return output_dir / MANIFEST_FILE_NAME
+
+
+def get_record_id(line: bytes) -> str:
+    match = RECORD_ID_PATTERN.match(line)
+    if match is not None:
+        record_id: str = json.loads(match.group(1))
+        return record_id
+
+    record: dict[str, Any] = json.loads(line)
+    return str(record["id"])
+
+
+# Read-only snapshot of a manifest, without the lock, so that it can be read
+# while a crawl appends to it
+class ManifestReader:
+    def __init__(self, manifest_file: Path) -> None:
+        self.manifest_file = manifest_file
+
+        self._fp: IO[bytes] = open(manifest_file, "rb")
+
+        # Byte offset of the latest record of each id
+        self._offsets: dict[str, int] = {}
+        self.record_count = 0
+        self._load()
+
+    def _load(self) -> int:
+        self._fp.seek(0)
+        offset = 0
+        for line in self._fp:
+            if not line.endswith(b"\n"):
+                # Torn write of a crashed run, or a record being appended
+                break
+
+            if line.strip():
+                self._offsets[get_record_id(line)] = offset
+                self.record_count += 1
+            offset += len(line)
+
+        # Size of the complete records
+        return offset
+
+    def close(self) -> None:
+        self._fp.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    @property
+    def live_count(self) -> int:
+        return len(self._offsets)
+
+    @property
+    def stale_count(self) -> int:
+        return self.record_count - len(self._offsets)
+
+    def get_item_ids(self) -> list[str]:
+        return list(self._offsets)
+
+    def has(self, item_id: str) -> bool:
+        return item_id in self._offsets
+
+    def read(self, item_id: str) -> bytes | None:
+        offset = self._offsets.get(item_id)
+        if offset is None:
+            return None
+        return self._read_at(offset=offset)
+
+    def _read_at(self, offset: int) -> bytes:
+        self._fp.seek(offset)
+        return self._fp.readline().rstrip(b"\n")
+
+    def iter_records(self) -> Iterator[tuple[str, bytes]]:
+        # Sorted by id, so that compacted manifests diff and merge well
+        for item_id, offset in sorted(self._offsets.items()):
+            yield item_id, self._read_at(offset=offset)
+
+
+# Append-only JSON Lines file of item metadata, the last record of an id wins
+class Manifest(ManifestReader):
+    def __init__(self, manifest_file: Path) -> None:
+        manifest_file.parent.mkdir(parents=True, exist_ok=True)
+
+        self.manifest_file = manifest_file
+
+        # Offsets are only valid while no other process appends
+        self._lock_fp = open(
+            manifest_file.with_name(f".{MANIFEST_FILE_NAME}.lock"),
+            "ab",
+        )
+        try:
+            fcntl.flock(self._lock_fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError as error:
+            self._lock_fp.close()
+            raise ManifestLockedError(
+                f"{manifest_file} is in use by another process"
+            ) from error
+
+        self._fp = open(manifest_file, "a+b")
+
+        self._offsets = {}
+        self.record_count = 0
+        complete_size = self._load()
+        if os.fstat(self._fp.fileno()).st_size > complete_size:
+            # Torn write of a crashed run
+            self._fp.truncate(complete_size)
+
+    def close(self) -> None:
+        self.sync()
+        self._fp.close()
+        self._lock_fp.close()
+
+    def _read_at(self, offset: int) -> bytes:
+        self._fp.flush()
+        return super()._read_at(offset=offset)
+
+    def append(self, item_id: str, text: str) -> None:
+        # Append mode writes at the end whatever the read position is
+        self._fp.seek(0, os.SEEK_END)
+        offset = self._fp.tell()
+        self._fp.write(text.encode("utf-8") + b"\n")
+
+        self._offsets[item_id] = offset
+        self.record_count += 1
+
+    def sync(self) -> None:
+        # Appended records are buffered until then
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+    def should_compact(self) -> bool:
+        return self.stale_count > self.live_count * MANIFEST_COMPACT_STALE_RATIO
+
+    def compact(self) -> None:
+        # Cleaned up with the other temporary files of the output directory
+        fd, tmp_file = create_tmp_file(
+            target_file=self.manifest_file,
+            tmp_dir=get_tmp_dir(output_dir=self.manifest_file.parent),
+        )
+        try:
+            offsets: dict[str, int] = {}
+            record_count = 0
+            with os.fdopen(fd, "wb") as fp:
+                for item_id, record in self.iter_records():
+                    offsets[item_id] = fp.tell()
+                    fp.write(record + b"\n")
+                    record_count += 1
+                fp.flush()
+                os.fsync(fp.fileno())
+
+            os.replace(tmp_file, self.manifest_file)
+        except BaseException:
+            discard_tmp_file(tmp_file=tmp_file)
+            raise
+
+        self._fp.close()
+        self._fp = open(self.manifest_file, "a+b")
+        self._offsets = offsets
+        self.record_count = record_count
+
+
+def check_parquet_support() -> None:
+    # pyarrow is an optional dependency, only needed for Parquet export
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("Parquet export requires pyarrow (poetry install -E parquet)")
+
+
+def get_parquet_type(annotation: Any) -> Any:
+    import pyarrow as pa
+
+    origin = get_origin(annotation)
+    if origin in (Union, UnionType):
+        # Optional fields are nullable anyway
+        args = [arg for arg in get_args(annotation) if arg is not NoneType]
+        return get_parquet_type(args[0])
+    if origin is list:
+        return pa.list_(get_parquet_type(get_args(annotation)[0]))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return pa.struct(get_parquet_fields(models=[annotation]))
+
+    parquet_types = {
+        str: pa.string(),
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        # As written in the JSON records
+        datetime: pa.string(),
+    }
+    if annotation not in parquet_types:
+        raise TypeError(f"No Parquet type for {annotation}")
+    return parquet_types[annotation]
+
+
+def get_parquet_fields(models: list[type[BaseModel]]) -> list[Any]:
+    import pyarrow as pa
+
+    fields: dict[str, Any] = {}
+    for model in models:
+        for name, field in model.model_fields.items():
+            if name not in fields:
+                fields[name] = pa.field(name, get_parquet_type(field.annotation))
+    return list(fields.values())
+
+
+def write_manifest_parquet(
+    manifest: Manifest,
+    parquet_file: Path,
+    metadata_models: list[type[BaseModel]],
+) -> int:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    records: list[dict[str, Any]] = [
+        json.loads(record) for _, record in manifest.iter_records()
+    ]
+
+    # Not inferred from the records, where older ones lack the newer fields
+    schema = pa.schema(get_parquet_fields(models=metadata_models))
+    table = pa.Table.from_pylist(records, schema=schema)
+
+    fd, tmp_file = create_tmp_file(target_file=parquet_file)
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_file, compression="zstd")
+        os.replace(tmp_file, parquet_file)
+    except BaseException:
+        discard_tmp_file(tmp_file=tmp_file)
+        raise
+
+    return len(records)
@@ -0,0 +1,276 @@
+import json
+import os
+import shutil
+from argparse import ArgumentParser, Namespace
+from contextlib import ExitStack
+from datetime import datetime
+from logging import Logger
+from pathlib import Path
+from typing import Any
+
+from .app_config import AppConfig
+from .atomic_file import TMP_DIR_NAME, create_tmp_file, discard_tmp_file, get_tmp_dir
+from .blob_store import link_file_atomically
+from .manifest import MANIFEST_FILE_NAME, Manifest, ManifestReader
+from .output_layout import OutputLayoutMismatchError
+from .state_store import StateStore, add_state_store_arguments, get_default_state_file
+
+PROGRESS_LOG_INTERVAL = 10000
+
+
+def is_merged_file(relative_path: Path, state_file_name: str) -> bool:
+    # The state and the manifests are merged record by record
+    name = relative_path.name
+    if name.startswith(state_file_name):
+        return False
+    if name == MANIFEST_FILE_NAME or name == f".{MANIFEST_FILE_NAME}.lock":
+        return False
+    return TMP_DIR_NAME not in relative_path.parts
+
+
+def copy_file_atomically(source_file: Path, target_file: Path, tmp_dir: Path) -> None:
+    fd, tmp_file = create_tmp_file(target_file=target_file, tmp_dir=tmp_dir)
+    os.close(fd)
+    try:
+        shutil.copy2(source_file, tmp_file)
+        os.replace(tmp_file, target_file)
+    except BaseException:
+        discard_tmp_file(tmp_file=tmp_file)
+        raise
+
+
+def merge_shard_files(input_dir: Path, output_dir: Path, logger: Logger) -> int:
+    state_file_name = get_default_state_file(output_dir=input_dir).name
+    tmp_dir = get_tmp_dir(output_dir=output_dir)
+
+    merged_count = 0
+    for dir_path, dir_names, file_names in os.walk(input_dir):
+        dir_names[:] = sorted(name for name in dir_names if name != TMP_DIR_NAME)
+        for file_name in sorted(file_names):
+            source_file = Path(dir_path) / file_name
+            relative_path = source_file.relative_to(input_dir)
+            if not is_merged_file(
+                relative_path=relative_path,
+                state_file_name=state_file_name,
+            ):
+                continue
+
+            # Files of an earlier merge are kept unless the shard has a newer one
+            target_file = output_dir / relative_path
+            if (
+                target_file.exists()
+                and target_file.stat().st_mtime >= source_file.stat().st_mtime
+            ):
+                continue
+
+            try:
+                link_file_atomically(
+                    source_file=source_file,
+                    target_file=target_file,
+                    tmp_dir=tmp_dir,
+                )
+            except OSError:
+                # Shards on another filesystem
+                copy_file_atomically(
+                    source_file=source_file,
+                    target_file=target_file,
+                    tmp_dir=tmp_dir,
+                )
+
+            merged_count += 1
+            if merged_count % PROGRESS_LOG_INTERVAL == 0:
+                logger.info(f"Merged {merged_count} files from {input_dir}")
+
+    return merged_count
+
+
+def get_record_checked_at(record: bytes) -> datetime:
+    metadata: dict[str, Any] = json.loads(record)
+    return datetime.fromisoformat(metadata.get("checked_at") or metadata["fetched_at"])
+
+
+def merge_shard_manifests(input_dir: Path, output_dir: Path) -> int:
+    merged_count = 0
+    for input_manifest_file in sorted(input_dir.rglob(MANIFEST_FILE_NAME)):
+        relative_path = input_manifest_file.relative_to(input_dir)
+        if TMP_DIR_NAME in relative_path.parts:
+            continue
+
+        with (
+            # Shards may still be crawling
+            ManifestReader(manifest_file=input_manifest_file) as input_manifest,
+            Manifest(manifest_file=output_dir / relative_path) as output_manifest,
+        ):
+            for item_id, record in input_manifest.iter_records():
+                # The latest check wins, as in the state
+                output_record = output_manifest.read(item_id=item_id)
+                if output_record is not None and get_record_checked_at(
+                    record=output_record
+                ) >= get_record_checked_at(record=record):
+                    continue
+
+                output_manifest.append(
+                    item_id=item_id,
+                    text=record.decode("utf-8"),
+                )
+                merged_count += 1
+
+            if output_manifest.stale_count > 0:
+                output_manifest.compact()
+
+    return merged_count
+
+
+def get_source_output_layout(
+    source_name: str,
+    state_stores: list[StateStore],
+) -> str | None:
+    output_layouts = {
+        output_layout
+        for output_layout in (
+            state_store.load_output_layout(source_name=source_name)
+            for state_store in state_stores
+        )
+        if output_layout is not None
+    }
+    if len(output_layouts) > 1:
+        raise OutputLayoutMismatchError(
+            f"{source_name} uses the {' and '.join(sorted(output_layouts))} "
+            "layouts. Run the migrate_layout command on the shards first."
+        )
+
+    for output_layout in output_layouts:
+        return output_layout
+    return None
+
+
+def merge_shard_states(
+    source_name: str,
+    input_state_stores: list[StateStore],
+    output_state_store: StateStore,
+    output_layout: str | None,
+) -> int:
+    output_state_store.ensure_source(source_name=source_name)
+
+    merged_count = 0
+    for input_state_store in input_state_stores:
+        merged_count += output_state_store.merge_item_states(
+            source_name=source_name,
+            item_states=input_state_store.iter_item_states(source_name=source_name),
+        )
+
+    if output_layout is not None:
+        output_state_store.save_output_layout(
+            source_name=source_name,
+            output_layout=output_layout,
+        )
+
+    # Every shard lists all rows, so the merged output is complete up to
+    # the watermark of the shard which is furthest behind
+    watermarks = [
+        input_state_store.load_watermark(source_name=source_name)
+        for input_state_store in input_state_stores
+    ]
+    if None not in watermarks:
+        output_state_store.save_watermark(
+            source_name=source_name,
+            updated_at=min(
+                watermark for watermark in watermarks if watermark is not None
+            ),
+        )
+
+    return merged_count
+
+
+def merge_shards_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    input_dirs: list[Path] = args.input_dir
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+
+    for input_dir in input_dirs:
+        if input_dir.resolve() == output_dir.resolve():
+            raise ValueError(f"Input directory is the output directory: {input_dir}")
+        if not get_default_state_file(output_dir=input_dir).exists():
+            raise ValueError(f"No state file in {input_dir}")
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with ExitStack() as stack:
+        input_state_stores = [
+            stack.enter_context(
+                StateStore(state_file=get_default_state_file(output_dir=input_dir))
+            )
+            for input_dir in input_dirs
+        ]
+        output_state_store = stack.enter_context(StateStore(state_file=state_file))
+
+        source_state_stores: dict[str, list[StateStore]] = {}
+        for input_state_store in input_state_stores:
+            for source_name in input_state_store.get_source_names():
+                source_state_stores.setdefault(source_name, []).append(
+                    input_state_store
+                )
+
+        # Checked before anything is merged
+        output_layouts = {
+            source_name: get_source_output_layout(
+                source_name=source_name,
+                state_stores=[output_state_store, *state_stores],
+            )
+            for source_name, state_stores in source_state_stores.items()
+        }
+
+        # Files first, so that the merged state never references a missing file
+        for input_dir in input_dirs:
+            file_count = merge_shard_files(
+                input_dir=input_dir,
+                output_dir=output_dir,
+                logger=logger,
+            )
+            record_count = merge_shard_manifests(
+                input_dir=input_dir,
+                output_dir=output_dir,
+            )
+            logger.info(
+                f"Merged {file_count} files and {record_count} manifest records "
+                f"from {input_dir}"
+            )
+
+        for source_name, state_stores in sorted(source_state_stores.items()):
+            merged_count = merge_shard_states(
+                source_name=source_name,
+                input_state_stores=state_stores,
+                output_state_store=output_state_store,
+                output_layout=output_layouts[source_name],
+            )
+            logger.info(
+                f"Merged {merged_count} {source_name} item states "
+                f"from {len(state_stores)} shards"
+            )
+
+
+def add_merge_shards_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--input_dir",
+        type=Path,
+        nargs="+",
+        required=True,
+        help="Output directories of the --shard workers",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory to merge the shards into (may already exist)",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=merge_shards_command,
+    )
@@ -0,0 +1,126 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from logging import Logger
+from pathlib import Path
+from typing import Literal
+
+from .atomic_file import discard_tmp_file, get_tmp_dir, write_text_atomically
+from .manifest import Manifest, get_manifest_file
+from .output_layout import (
+    OUTPUT_LAYOUTS,
+    OutputLayout,
+    find_item_file,
+    get_item_file_name,
+)
+
+MetadataOutput = Literal["files", "manifest", "both"]
+
+METADATA_OUTPUTS: list[MetadataOutput] = ["files", "manifest", "both"]
+
+
+def parse_metadata_output(value: str) -> MetadataOutput:
+    for metadata_output in METADATA_OUTPUTS:
+        if metadata_output == value:
+            return metadata_output
+    raise ValueError(f"Unknown metadata output: {value}")
+
+
+class MetadataStore:
+    def __init__(
+        self,
+        output_dir: Path,
+        output_layout: OutputLayout,
+        metadata_output: MetadataOutput,
+        manifest: Manifest | None,
+    ) -> None:
+        self.output_dir = output_dir
+        self.output_layout = output_layout
+        self.metadata_output = metadata_output
+        self.manifest = manifest
+
+    def _find_metadata_file(self, item_id: str) -> Path:
+        # Read from either layout while migrate_layout is in progress
+        return find_item_file(
+            output_dir=self.output_dir,
+            item_id=item_id,
+            suffix=".json",
+            output_layout=self.output_layout,
+        )
+
+    def exists(self, item_id: str) -> bool:
+        if self.manifest is not None and self.manifest.has(item_id=item_id):
+            return True
+        return self._find_metadata_file(item_id=item_id).exists()
+
+    def read(self, item_id: str) -> bytes:
+        if self.manifest is not None:
+            record = self.manifest.read(item_id=item_id)
+            if record is not None:
+                return record
+
+        # Fetched before the manifest was enabled
+        return self._find_metadata_file(item_id=item_id).read_bytes()
+
+    def write(self, item_id: str, text: str) -> None:
+        if self.metadata_output != "manifest":
+            write_text_atomically(
+                target_file=self.output_dir
+                / get_item_file_name(
+                    item_id=item_id,
+                    suffix=".json",
+                    output_layout=self.output_layout,
+                ),
+                tmp_dir=get_tmp_dir(output_dir=self.output_dir),
+                text=text,
+            )
+
+        if self.manifest is not None:
+            self.manifest.append(item_id=item_id, text=text)
+            # Durable before the state records the item as fetched
+            self.manifest.sync()
+
+            if self.metadata_output == "manifest":
+                # Superseded by the manifest record
+                for layout in OUTPUT_LAYOUTS:
+                    discard_tmp_file(
+                        tmp_file=self.output_dir
+                        / get_item_file_name(
+                            item_id=item_id,
+                            suffix=".json",
+                            output_layout=layout,
+                        ),
+                    )
+
+
+@contextmanager
+def open_metadata_store(
+    output_dir: Path,
+    output_layout: OutputLayout,
+    metadata_output: MetadataOutput,
+    logger: Logger,
+) -> Iterator[MetadataStore]:
+    if metadata_output == "files":
+        yield MetadataStore(
+            output_dir=output_dir,
+            output_layout=output_layout,
+            metadata_output=metadata_output,
+            manifest=None,
+        )
+        return
+
+    with Manifest(manifest_file=get_manifest_file(output_dir=output_dir)) as manifest:
+        yield MetadataStore(
+            output_dir=output_dir,
+            output_layout=output_layout,
+            metadata_output=metadata_output,
+            manifest=manifest,
+        )
+
+        if manifest.should_compact():
+            stale_count = manifest.stale_count
+            manifest.compact()
+            logger.info(
+                f"Compacted {manifest.manifest_file}: "
+                f"dropped {stale_count} superseded records, "
+                f"kept {manifest.live_count}"
+            )
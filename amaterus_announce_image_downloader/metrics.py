@@ -0,0 +1,313 @@
+import asyncio
+import math
+from argparse import ArgumentParser, Namespace
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from logging import Logger
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from .atomic_file import write_text_atomically
+
+DEFAULT_DURATION_BUCKETS = [
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+]
+
+
+def format_labels(label_names: list[str], labels: tuple[str, ...]) -> str:
+    if not label_names:
+        return ""
+
+    pairs = []
+    for label_name, label_value in zip(label_names, labels, strict=True):
+        escaped_value = (
+            label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{label_name}="{escaped_value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Counter:
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, label_names: list[str]) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, labels: tuple[str, ...] = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: tuple[str, ...] = ()) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.label_names, labels)} "
+            f"{format_value(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, labels: tuple[str, ...] = ()) -> None:
+        self._values[labels] = value
+
+
+class Histogram:
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: list[str],
+        buckets: list[float] = DEFAULT_DURATION_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = [*sorted(buckets), math.inf]
+
+        # Per label set: cumulative bucket counts, sum and count
+        self._bucket_counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, labels: tuple[str, ...] = ()) -> None:
+        bucket_counts = self._bucket_counts.get(labels)
+        if bucket_counts is None:
+            bucket_counts = [0] * len(self.buckets)
+            self._bucket_counts[labels] = bucket_counts
+
+        for index, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                bucket_counts[index] += 1
+
+        self._sums[labels] = self._sums.get(labels, 0) + value
+
+    def render(self) -> list[str]:
+        lines = []
+        bucket_label_names = [*self.label_names, "le"]
+        for labels, bucket_counts in sorted(self._bucket_counts.items()):
+            for upper_bound, bucket_count in zip(
+                self.buckets,
+                bucket_counts,
+                strict=True,
+            ):
+                bucket_labels = (*labels, format_value(upper_bound))
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{format_labels(bucket_label_names, bucket_labels)} "
+                    f"{bucket_count}"
+                )
+
+            formatted_labels = format_labels(self.label_names, labels)
+            lines.append(
+                f"{self.name}_sum{formatted_labels} {format_value(self._sums[labels])}"
+            )
+            lines.append(f"{self.name}_count{formatted_labels} {bucket_counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[Counter | Histogram] = []
+
+    def counter(self, name: str, help: str, label_names: list[str]) -> Counter:
+        counter = Counter(name=name, help=help, label_names=label_names)
+        self._metrics.append(counter)
+        return counter
+
+    def gauge(self, name: str, help: str, label_names: list[str]) -> Gauge:
+        gauge = Gauge(name=name, help=help, label_names=label_names)
+        self._metrics.append(gauge)
+        return gauge
+
+    def histogram(self, name: str, help: str, label_names: list[str]) -> Histogram:
+        histogram = Histogram(name=name, help=help, label_names=label_names)
+        self._metrics.append(histogram)
+        return histogram
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+IMAGE_REQUESTS = REGISTRY.counter(
+    name="image_downloader_image_requests_total",
+    help="Image requests by host and status code (error for transport failures)",
+    label_names=["host", "status"],
+)
+IMAGE_REQUEST_DURATION = REGISTRY.histogram(
+    name="image_downloader_image_request_duration_seconds",
+    help="Time from sending an image request to reading the whole body",
+    label_names=["host", "status"],
+)
+IMAGE_RESPONSE_BYTES = REGISTRY.counter(
+    name="image_downloader_image_response_bytes_total",
+    help="Image bytes downloaded",
+    label_names=["host"],
+)
+RATE_LIMITER_WAIT = REGISTRY.counter(
+    name="image_downloader_rate_limiter_wait_seconds_total",
+    help="Time spent waiting for the per-host rate limiter",
+    label_names=["host"],
+)
+RATE_LIMITER_RATE = REGISTRY.gauge(
+    name="image_downloader_rate_limiter_rate",
+    help="Current requests per second allowed to the host",
+    label_names=["host"],
+)
+HASURA_REQUEST_DURATION = REGISTRY.histogram(
+    name="image_downloader_hasura_request_duration_seconds",
+    help="Amaterus Hasura query duration",
+    label_names=["status"],
+)
+CRAWL_ITEMS = REGISTRY.counter(
+    name="image_downloader_crawl_items_total",
+    help=(
+        "Crawled rows by source and result "
+        "(skipped, leased, fetched, not_modified, refresh_failed, retrying, errored)"
+    ),
+    label_names=["source", "result"],
+)
+WORKER_QUEUE_DEPTH = REGISTRY.gauge(
+    name="image_downloader_worker_queue_depth",
+    help="Rows listed from Amaterus Hasura and waiting for a worker",
+    label_names=["source"],
+)
+
+
+class MetricsConfig(BaseModel):
+    listen_host: str
+    port: int | None
+    textfile: Path | None
+
+
+async def handle_metrics_request(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    try:
+        request_line = await reader.readline()
+        # Headers are not needed
+        while (await reader.readline()).strip():
+            pass
+
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+            status = "200 OK"
+            body = REGISTRY.render().encode("utf-8")
+        else:
+            status = "404 Not Found"
+            body = b""
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n"
+            "\r\n".encode("latin-1")
+            + body
+        )
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+@asynccontextmanager
+async def open_metrics_server(
+    metrics_config: MetricsConfig,
+    logger: Logger,
+) -> AsyncIterator[None]:
+    if metrics_config.port is None:
+        yield
+        return
+
+    server = await asyncio.start_server(
+        handle_metrics_request,
+        host=metrics_config.listen_host,
+        port=metrics_config.port,
+    )
+    logger.info(
+        f"Serve metrics on http://{metrics_config.listen_host}:"
+        f"{metrics_config.port}/metrics"
+    )
+
+    try:
+        yield
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def write_metrics_textfile(metrics_config: MetricsConfig) -> None:
+    if metrics_config.textfile is None:
+        return
+
+    # Atomic, so that the node_exporter textfile collector never reads half a file
+    write_text_atomically(
+        target_file=metrics_config.textfile,
+        text=REGISTRY.render(),
+    )
+
+
+def get_metrics_config_from_args(args: Namespace) -> MetricsConfig:
+    return MetricsConfig(
+        listen_host=args.metrics_listen_host,
+        port=args.metrics_port,
+        textfile=args.metrics_textfile,
+    )
+
+
+def add_metrics_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        help="Serve Prometheus metrics on this port at /metrics",
+    )
+    parser.add_argument(
+        "--metrics_listen_host",
+        type=str,
+        default="127.0.0.1",
+        help="Address the metrics endpoint listens on",
+    )
+    parser.add_argument(
+        "--metrics_textfile",
+        type=Path,
+        help=(
+            "Write Prometheus metrics to this file at exit "
+            "(for the node_exporter textfile collector, use a .prom suffix)"
+        ),
+    )
@@ -0,0 +1,310 @@
+import json
+import os
+from argparse import ArgumentParser, Namespace
+from contextlib import ExitStack
+from logging import Logger
+from pathlib import Path
+from typing import Any
+
+from .app_config import AppConfig
+from .atomic_file import discard_tmp_file, get_tmp_dir, write_text_atomically
+from .image_sources import get_source_output_dir
+from .manifest import Manifest, get_manifest_file
+from .output_layout import (
+    OUTPUT_LAYOUTS,
+    OutputLayout,
+    find_item_file,
+    get_item_file_name,
+    parse_output_layout,
+    relocate_item_file_name,
+)
+from .state_store import StateStore, add_state_store_arguments, get_default_state_file
+
+PROGRESS_LOG_INTERVAL = 10000
+
+
+def move_item_file(source_file: Path, target_file: Path) -> bool:
+    if source_file == target_file or not source_file.exists():
+        # Moved by an interrupted run
+        return False
+
+    if target_file.exists():
+        # Written by a crawl which ran during the migration, so it is newer
+        discard_tmp_file(tmp_file=source_file)
+        return True
+
+    target_file.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(source_file, target_file)
+    return True
+
+
+def remove_empty_dirs(output_dir: Path, file_name: str) -> None:
+    # Shard directories left empty by moving to the flat layout
+    parent = (output_dir / file_name).parent
+    while parent != output_dir and output_dir in parent.parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            # Not empty or already removed
+            return
+        parent = parent.parent
+
+
+def relocate_metadata(
+    metadata: dict[str, Any],
+    item_id: str,
+    output_layout: OutputLayout,
+) -> dict[str, Any]:
+    # Metadata models differ between sources, only their file names are rewritten
+    relocated_metadata = {
+        **metadata,
+        "file_name": relocate_item_file_name(
+            file_name=metadata["file_name"],
+            item_id=item_id,
+            output_layout=output_layout,
+        ),
+    }
+    if metadata.get("derivatives"):
+        relocated_metadata["derivatives"] = [
+            {
+                **derivative,
+                "file_name": relocate_item_file_name(
+                    file_name=derivative["file_name"],
+                    item_id=item_id,
+                    output_layout=output_layout,
+                ),
+            }
+            for derivative in metadata["derivatives"]
+        ]
+    return relocated_metadata
+
+
+def dump_metadata(metadata: dict[str, Any]) -> str:
+    return json.dumps(metadata, ensure_ascii=False, separators=(",", ":"))
+
+
+def migrate_item_layout(
+    source_name: str,
+    output_dir: Path,
+    item_id: str,
+    output_layout: OutputLayout,
+    state_store: StateStore,
+    manifest: Manifest | None,
+) -> bool:
+    moved = False
+
+    metadata_file = find_item_file(
+        output_dir=output_dir,
+        item_id=item_id,
+        suffix=".json",
+        output_layout=output_layout,
+    )
+    file_metadata: dict[str, Any] | None = None
+    if metadata_file.exists():
+        file_metadata = json.loads(metadata_file.read_bytes())
+
+    manifest_metadata: dict[str, Any] | None = None
+    if manifest is not None:
+        manifest_record = manifest.read(item_id=item_id)
+        if manifest_record is not None:
+            manifest_metadata = json.loads(manifest_record)
+
+    file_names: list[str] = []
+    item_state = state_store.get_item_state(source_name=source_name, item_id=item_id)
+    if item_state is not None and item_state.file_name is not None:
+        file_names.append(item_state.file_name)
+    for metadata in (file_metadata, manifest_metadata):
+        if metadata is not None:
+            file_names.append(metadata["file_name"])
+            for derivative in metadata.get("derivatives") or []:
+                file_names.append(derivative["file_name"])
+
+    # Image files first, so that an interrupted run leaves metadata which
+    # still resolves to the new location on the next run
+    for file_name in dict.fromkeys(file_names):
+        if move_item_file(
+            source_file=output_dir / file_name,
+            target_file=output_dir
+            / relocate_item_file_name(
+                file_name=file_name,
+                item_id=item_id,
+                output_layout=output_layout,
+            ),
+        ):
+            remove_empty_dirs(output_dir=output_dir, file_name=file_name)
+            moved = True
+
+    if file_metadata is not None:
+        target_metadata_file = output_dir / get_item_file_name(
+            item_id=item_id,
+            suffix=".json",
+            output_layout=output_layout,
+        )
+        relocated_metadata = relocate_metadata(
+            metadata=file_metadata,
+            item_id=item_id,
+            output_layout=output_layout,
+        )
+        if relocated_metadata != file_metadata or target_metadata_file != metadata_file:
+            write_text_atomically(
+                target_file=target_metadata_file,
+                text=dump_metadata(metadata=relocated_metadata),
+                tmp_dir=get_tmp_dir(output_dir=output_dir),
+            )
+            moved = True
+
+        # Leftovers of the other layouts
+        for layout in OUTPUT_LAYOUTS:
+            if layout == output_layout:
+                continue
+            stale_metadata_file = output_dir / get_item_file_name(
+                item_id=item_id,
+                suffix=".json",
+                output_layout=layout,
+            )
+            if stale_metadata_file.exists():
+                discard_tmp_file(tmp_file=stale_metadata_file)
+                remove_empty_dirs(
+                    output_dir=output_dir,
+                    file_name=stale_metadata_file.relative_to(output_dir).as_posix(),
+                )
+
+    if manifest is not None and manifest_metadata is not None:
+        relocated_metadata = relocate_metadata(
+            metadata=manifest_metadata,
+            item_id=item_id,
+            output_layout=output_layout,
+        )
+        if relocated_metadata != manifest_metadata:
+            manifest.append(
+                item_id=item_id,
+                text=dump_metadata(metadata=relocated_metadata),
+            )
+            manifest.sync()
+            moved = True
+
+    if item_state is not None and item_state.file_name is not None:
+        relocated_file_name = relocate_item_file_name(
+            file_name=item_state.file_name,
+            item_id=item_id,
+            output_layout=output_layout,
+        )
+        if relocated_file_name != item_state.file_name:
+            state_store.update_file_name(
+                source_name=source_name,
+                item_id=item_id,
+                file_name=relocated_file_name,
+            )
+
+    return moved
+
+
+def migrate_layout(
+    source_name: str,
+    output_dir: Path,
+    output_layout: OutputLayout,
+    state_store: StateStore,
+    logger: Logger,
+) -> None:
+    state_store.ensure_migrated_source(
+        source_name=source_name,
+        output_dir=output_dir,
+    )
+
+    # Recorded first, so that crawls during the migration already write the
+    # new layout. They read items not moved yet from the old one.
+    state_store.save_output_layout(
+        source_name=source_name,
+        output_layout=output_layout,
+    )
+
+    item_ids = state_store.get_item_ids(source_name=source_name)
+    moved_count = 0
+    with ExitStack() as stack:
+        manifest: Manifest | None = None
+        manifest_file = get_manifest_file(output_dir=output_dir)
+        if manifest_file.exists():
+            manifest = stack.enter_context(Manifest(manifest_file=manifest_file))
+
+        for index, item_id in enumerate(item_ids, start=1):
+            if migrate_item_layout(
+                source_name=source_name,
+                output_dir=output_dir,
+                item_id=item_id,
+                output_layout=output_layout,
+                state_store=state_store,
+                manifest=manifest,
+            ):
+                moved_count += 1
+
+            if index % PROGRESS_LOG_INTERVAL == 0:
+                logger.info(f"Checked {index}/{len(item_ids)} items")
+
+        if manifest is not None and manifest.stale_count > 0:
+            # Superseded records of the old layout
+            manifest.compact()
+
+    logger.info(
+        f"Moved {moved_count} of {len(item_ids)} {source_name} items "
+        f"to the {output_layout} layout in {output_dir}"
+    )
+
+
+def migrate_layout_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source_name: str = args.source
+    output_dir: Path = args.output_dir
+    output_layout: OutputLayout = args.output_layout
+    state_file: Path | None = args.state_file
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with StateStore(state_file=state_file, mode="rw") as state_store:
+        migrate_layout(
+            source_name=source_name,
+            output_dir=get_source_output_dir(
+                source_name=source_name,
+                output_dir=output_dir,
+            ),
+            output_layout=output_layout,
+            state_store=state_store,
+            logger=logger,
+        )
+
+
+def add_migrate_layout_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--source",
+        type=str,
+        required=True,
+        help=(
+            "Source whose output directory is migrated "
+            "(e.g. twitter_tweet_images, youtube_lives_maxresdefault)"
+        ),
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help=(
+            "Output directory of the crawl "
+            "(youtube_lives_{variant} sources are moved in its {variant} directory)"
+        ),
+    )
+    parser.add_argument(
+        "--output_layout",
+        type=parse_output_layout,
+        choices=OUTPUT_LAYOUTS,
+        required=True,
+        help="Layout to move the files to",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=migrate_layout_command,
+    )
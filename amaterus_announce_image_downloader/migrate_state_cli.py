@@ -0,0 +1,166 @@
+import os
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator
+from datetime import datetime
+from logging import Logger
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from pydantic import BaseModel
+
+from .app_config import AppConfig
+from .image_sources import IMAGE_SOURCES
+from .retry_policy import is_transient_legacy_error
+from .state_store import (
+    ItemState,
+    StateStore,
+    add_state_store_arguments,
+    get_default_state_file,
+)
+
+JST = ZoneInfo("Asia/Tokyo")
+
+SOURCE_NAMES = [source.table_name for source in IMAGE_SOURCES]
+
+
+class LegacyImageMetadata(BaseModel):
+    id: str
+    url: str | None = None
+    content_type: str
+    file_name: str
+    fetched_at: datetime
+
+
+class LegacyWatermark(BaseModel):
+    updated_at: datetime
+
+
+def iter_legacy_item_states(
+    output_dir: Path,
+) -> Iterator[ItemState]:
+    now = datetime.now().astimezone(tz=JST)
+
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+
+            if entry.name.endswith(".error.txt"):
+                last_error = Path(entry.path).read_text(encoding="utf-8").strip()
+
+                # Transient failures are retried on the next crawl
+                transient = is_transient_legacy_error(last_error=last_error)
+
+                yield ItemState(
+                    id=entry.name.removesuffix(".error.txt"),
+                    status="retrying" if transient else "errored",
+                    url=None,
+                    content_type=None,
+                    file_name=None,
+                    size=None,
+                    sha256=None,
+                    stored_as_blob=False,
+                    etag=None,
+                    last_modified=None,
+                    fetched_at=datetime.fromtimestamp(
+                        entry.stat().st_mtime,
+                        tz=JST,
+                    ),
+                    checked_at=None,
+                    attempt_count=1,
+                    failure_count=1,
+                    last_error=last_error,
+                    next_attempt_at=now if transient else None,
+                )
+            elif entry.name.endswith(".json"):
+                metadata = LegacyImageMetadata.model_validate_json(
+                    Path(entry.path).read_bytes(),
+                )
+                yield ItemState(
+                    id=metadata.id,
+                    status="fetched",
+                    url=metadata.url,
+                    content_type=metadata.content_type,
+                    file_name=metadata.file_name,
+                    size=None,
+                    sha256=None,
+                    stored_as_blob=False,
+                    etag=None,
+                    last_modified=None,
+                    fetched_at=metadata.fetched_at,
+                    checked_at=metadata.fetched_at,
+                    attempt_count=1,
+                    failure_count=0,
+                    last_error=None,
+                    next_attempt_at=None,
+                )
+
+
+def migrate_state(
+    source_name: str,
+    output_dir: Path,
+    state_store: StateStore,
+    logger: Logger,
+) -> None:
+    state_store.ensure_source(source_name=source_name)
+
+    imported_count = state_store.import_item_states(
+        source_name=source_name,
+        item_states=iter_legacy_item_states(output_dir=output_dir),
+    )
+    logger.info(f"Imported {imported_count} {source_name} items from {output_dir}")
+
+    legacy_watermark_file = output_dir / f".{source_name}.watermark.json"
+    if legacy_watermark_file.exists():
+        legacy_watermark = LegacyWatermark.model_validate_json(
+            legacy_watermark_file.read_text(encoding="utf-8"),
+        )
+        state_store.save_watermark(
+            source_name=source_name,
+            updated_at=legacy_watermark.updated_at,
+        )
+        legacy_watermark_file.unlink()
+        logger.info(f"Imported watermark {legacy_watermark.updated_at.isoformat()}")
+
+
+def migrate_state_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source_name: str = args.source
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with StateStore(state_file=state_file) as state_store:
+        migrate_state(
+            source_name=source_name,
+            output_dir=output_dir,
+            state_store=state_store,
+            logger=logger,
+        )
+
+
+def add_migrate_state_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--source",
+        type=str,
+        choices=SOURCE_NAMES,
+        required=True,
+        help="Source whose output directory is imported",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory containing {id}.json and {id}.error.txt files",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=migrate_state_command,
+    )
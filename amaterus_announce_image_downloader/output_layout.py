@@ -0,0 +1,129 @@
+import hashlib
+from pathlib import Path
+from typing import Literal
+
+from .state_store import StateStore
+
+OutputLayout = Literal["flat", "sharded"]
+
+OUTPUT_LAYOUTS: list[OutputLayout] = ["flat", "sharded"]
+
+
+class OutputLayoutMismatchError(Exception):
+    pass
+
+
+def parse_output_layout(value: str) -> OutputLayout:
+    for output_layout in OUTPUT_LAYOUTS:
+        if output_layout == value:
+            return output_layout
+    raise ValueError(f"Unknown output layout: {value}")
+
+
+def get_shard_prefix(item_id: str, output_layout: OutputLayout) -> str:
+    if output_layout == "flat":
+        return ""
+
+    # Two levels of 256 directories, evenly filled whatever the id format is
+    digest = hashlib.sha256(item_id.encode("utf-8")).hexdigest()
+    return f"{digest[0:2]}/{digest[2:4]}/"
+
+
+def get_item_file_name(
+    item_id: str,
+    suffix: str,
+    output_layout: OutputLayout,
+) -> str:
+    shard_prefix = get_shard_prefix(item_id=item_id, output_layout=output_layout)
+    return f"{shard_prefix}{item_id}{suffix}"
+
+
+def find_item_file(
+    output_dir: Path,
+    item_id: str,
+    suffix: str,
+    output_layout: OutputLayout,
+) -> Path:
+    # Items not moved yet by migrate_layout are found in the other layout
+    for candidate_layout in [
+        output_layout,
+        *(layout for layout in OUTPUT_LAYOUTS if layout != output_layout),
+    ]:
+        item_file = output_dir / get_item_file_name(
+            item_id=item_id,
+            suffix=suffix,
+            output_layout=candidate_layout,
+        )
+        if item_file.exists():
+            return item_file
+
+    return output_dir / get_item_file_name(
+        item_id=item_id,
+        suffix=suffix,
+        output_layout=output_layout,
+    )
+
+
+def relocate_item_file_name(
+    file_name: str,
+    item_id: str,
+    output_layout: OutputLayout,
+) -> str:
+    # file_name is relative to the output directory, possibly under a
+    # subdirectory such as derivatives/. Blob paths are returned as they are.
+    name = file_name.rsplit("/", 1)[-1]
+    if not name.startswith(item_id):
+        return file_name
+    suffix = name.removeprefix(item_id)
+
+    # flat matches any path ending with {id}{suffix}, so it is tried last
+    for layout in sorted(OUTPUT_LAYOUTS, key=lambda layout: layout == "flat"):
+        tail = get_item_file_name(
+            item_id=item_id,
+            suffix=suffix,
+            output_layout=layout,
+        )
+        base = file_name.removesuffix(tail)
+        if base != file_name and (base == "" or base.endswith("/")):
+            return base + get_item_file_name(
+                item_id=item_id,
+                suffix=suffix,
+                output_layout=output_layout,
+            )
+
+    return file_name
+
+
+def resolve_output_layout(
+    state_store: StateStore,
+    source_name: str,
+    output_layout: OutputLayout | None,
+) -> OutputLayout:
+    stored_value = state_store.load_output_layout(source_name=source_name)
+    stored_output_layout = (
+        parse_output_layout(stored_value) if stored_value is not None else None
+    )
+    if output_layout is None:
+        return stored_output_layout or "flat"
+
+    if stored_output_layout is None:
+        # Output directories created before layouts were recorded are flat
+        if (
+            output_layout != "flat"
+            and state_store.count_items(source_name=source_name) > 0
+        ):
+            stored_output_layout = "flat"
+        else:
+            state_store.save_output_layout(
+                source_name=source_name,
+                output_layout=output_layout,
+            )
+            return output_layout
+
+    if stored_output_layout != output_layout:
+        raise OutputLayoutMismatchError(
+            f"{source_name} uses the {stored_output_layout} layout. "
+            f"Run the migrate_layout command to change it to {output_layout}."
+        )
+
+    return output_layout
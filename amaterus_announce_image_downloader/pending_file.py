@@ -0,0 +1,50 @@
+from datetime import datetime
+from pathlib import Path
+
+from pydantic import BaseModel
+
+from .atomic_file import write_text_atomically
+from .image_source import ImageSource, SourceRow
+
+
+class PendingFileHeader(BaseModel):
+    source: str
+    planned_at: datetime
+    row_count: int
+
+
+def write_pending_file(
+    pending_file: Path,
+    source: ImageSource,
+    planned_at: datetime,
+    rows: list[SourceRow],
+) -> None:
+    # JSON Lines: a header, then the rows as Amaterus Hasura returned them
+    header = PendingFileHeader(
+        source=source.name,
+        planned_at=planned_at,
+        row_count=len(rows),
+    )
+    lines = [header.model_dump_json(), *(row.model_dump_json() for row in rows)]
+    write_text_atomically(
+        target_file=pending_file,
+        text="".join(f"{line}\n" for line in lines),
+    )
+
+
+def read_pending_file(
+    pending_file: Path,
+    source: ImageSource,
+) -> tuple[PendingFileHeader, list[SourceRow]]:
+    with pending_file.open("r", encoding="utf-8") as fp:
+        header = PendingFileHeader.model_validate_json(fp.readline())
+        if header.source != source.name:
+            raise ValueError(
+                f"{pending_file} was planned for {header.source}, not {source.name}"
+            )
+
+        rows: list[SourceRow] = [
+            source.row_model.model_validate_json(line) for line in fp if line.strip()
+        ]
+
+    return header, rows
@@ -0,0 +1,423 @@
+import asyncio
+from argparse import ArgumentParser, Namespace
+from collections import Counter
+from datetime import datetime, timedelta
+from logging import Logger
+from pathlib import Path
+from typing import Literal
+
+import httpx
+from pydantic import BaseModel
+
+from .app_config import AppConfig
+from .crawler import add_crawler_arguments, get_host_rate_limiter_from_args
+from .http_client import (
+    add_http_client_arguments,
+    get_http_client_config_from_args,
+    open_http_client,
+)
+from .image_source import (
+    ImageSource,
+    SourceRow,
+    get_crawl_targets,
+    get_image_url,
+)
+from .image_source_crawler import (
+    fetch_source_rows,
+    get_listing_where,
+    load_listing_watermark,
+)
+from .image_sources import IMAGE_SOURCES
+from .listing_cache import ListingCacheConfig, get_listing_cache_config_from_args
+from .pending_file import write_pending_file
+from .rate_limiter import HostRateLimiter, get_host
+from .state_store import (
+    ItemStatus,
+    StateStore,
+    add_state_store_arguments,
+    get_default_state_file,
+)
+from .work_distribution import Shard, add_work_distribution_arguments, is_in_shard
+from .youtube_thumbnail import (
+    DEFAULT_THUMBNAIL_BASE_URL,
+    VariantMode,
+    add_thumbnail_variant_arguments,
+)
+
+PlanResult = Literal["new", "refresh", "retry", "done", "errored", "waiting"]
+
+PENDING_PLAN_RESULTS: list[PlanResult] = ["new", "refresh", "retry"]
+
+# Results of the items which the crawl skips, by status
+SKIPPED_PLAN_RESULTS: dict[ItemStatus, PlanResult] = {
+    "fetched": "done",
+    "errored": "errored",
+    "retrying": "waiting",
+}
+
+
+class TargetPlan(BaseModel):
+    source_name: str
+    listed: int
+    new: int
+    refresh: int
+    retry: int
+    done: int
+    errored: int
+    waiting: int
+    # Known to the state but no longer listed, only counted for full listings
+    tombstoned: int | None
+
+
+class ImageSourcePlan(BaseModel):
+    target_plans: list[TargetPlan]
+    pending_rows: list[SourceRow]
+    # Requests to each image host, one per pending item and target
+    host_request_counts: dict[str, int]
+
+
+def get_plan_result(
+    item_id: str,
+    item_status: ItemStatus | None,
+    skip_ids: set[str],
+) -> PlanResult:
+    # Pending exactly when the crawl would not skip the item
+    if item_status is not None and item_id in skip_ids:
+        return SKIPPED_PLAN_RESULTS[item_status]
+    if item_status == "retrying":
+        return "retry"
+    if item_status == "fetched":
+        return "refresh"
+    return "new"
+
+
+async def plan_image_source(
+    client: httpx.AsyncClient,
+    source: ImageSource,
+    amaterus_hasura_url: str,
+    internal_useragent: str,
+    variants: list[str],
+    variant_mode: VariantMode,
+    thumbnail_base_url: str,
+    output_dir: Path,
+    state_store: StateStore,
+    hasura_page_size: int,
+    incremental: bool,
+    refresh_older_than: float | None,
+    shard: Shard | None,
+    listing_cache_config: ListingCacheConfig | None,
+    logger: Logger,
+) -> ImageSourcePlan:
+    targets = get_crawl_targets(
+        source=source,
+        output_dir=output_dir,
+        variants=variants,
+        variant_mode=variant_mode,
+    )
+    for target in targets:
+        state_store.ensure_migrated_source(
+            source_name=target.source_name,
+            output_dir=target.output_dir,
+        )
+
+    now = datetime.now().astimezone()
+    refresh_before: datetime | None = None
+    if refresh_older_than is not None:
+        refresh_before = now - timedelta(seconds=refresh_older_than)
+
+    # The same skip logic as the crawl
+    skip_ids = {
+        target.source_name: state_store.get_skip_ids(
+            source_name=target.source_name,
+            now=now,
+            refresh_before=refresh_before,
+        )
+        for target in targets
+    }
+    item_statuses: dict[str, dict[str, ItemStatus]] = {
+        target.source_name: {
+            item_state.id: item_state.status
+            for item_state in state_store.iter_item_states(
+                source_name=target.source_name,
+            )
+        }
+        for target in targets
+    }
+
+    watermark = load_listing_watermark(targets=targets, state_store=state_store)
+    where = get_listing_where(
+        source=source,
+        targets=targets,
+        state_store=state_store,
+        watermark=watermark,
+        incremental=incremental,
+        now=now,
+        refresh_before=refresh_before,
+        logger=logger,
+    )
+
+    result_counts = {target.source_name: Counter[PlanResult]() for target in targets}
+    listed_ids: set[str] = set()
+    pending_rows: list[SourceRow] = []
+    host_request_counts: Counter[str] = Counter()
+    async for row in fetch_source_rows(
+        client=client,
+        source=source,
+        amaterus_hasura_url=amaterus_hasura_url,
+        internal_useragent=internal_useragent,
+        where=where,
+        page_size=hasura_page_size,
+        state_store=state_store,
+        listing_cache_config=listing_cache_config,
+        logger=logger,
+    ):
+        if shard is not None and not is_in_shard(item_id=row.id, shard=shard):
+            continue
+
+        listed_ids.add(row.id)
+        pending = False
+        for target in targets:
+            plan_result = get_plan_result(
+                item_id=row.id,
+                item_status=item_statuses[target.source_name].get(row.id),
+                skip_ids=skip_ids[target.source_name],
+            )
+            result_counts[target.source_name][plan_result] += 1
+            if plan_result not in PENDING_PLAN_RESULTS:
+                continue
+
+            pending = True
+            image_url = get_image_url(
+                source=source,
+                row=row,
+                variant=target.variants[0],
+                thumbnail_base_url=thumbnail_base_url,
+            )
+            host_request_counts[get_host(image_url)] += 1
+
+        if pending:
+            pending_rows.append(row)
+
+    target_plans: list[TargetPlan] = []
+    for target in targets:
+        tombstoned: int | None = None
+        if not where:
+            tombstoned = sum(
+                1
+                for item_id in item_statuses[target.source_name]
+                if item_id not in listed_ids
+                and (shard is None or is_in_shard(item_id=item_id, shard=shard))
+            )
+
+        counts = result_counts[target.source_name]
+        target_plans.append(
+            TargetPlan(
+                source_name=target.source_name,
+                listed=len(listed_ids),
+                new=counts["new"],
+                refresh=counts["refresh"],
+                retry=counts["retry"],
+                done=counts["done"],
+                errored=counts["errored"],
+                waiting=counts["waiting"],
+                tombstoned=tombstoned,
+            )
+        )
+
+    return ImageSourcePlan(
+        target_plans=target_plans,
+        pending_rows=pending_rows,
+        host_request_counts=dict(host_request_counts),
+    )
+
+
+def format_duration(seconds: float) -> str:
+    return str(timedelta(seconds=round(seconds)))
+
+
+def log_duration_estimate(
+    host_request_counts: dict[str, int],
+    rate_limiter: HostRateLimiter,
+    logger: Logger,
+) -> None:
+    # Hosts are crawled in parallel, so the slowest one sets the duration.
+    # Variant fallbacks and retries add requests, so these are lower bounds.
+    total_seconds = 0.0
+    for host, request_count in sorted(host_request_counts.items()):
+        controller = rate_limiter.get_controller(host)
+        seconds = request_count / controller.bucket.rate
+        total_seconds = max(total_seconds, seconds)
+
+        message = (
+            f"[host={host}] {request_count} requests, "
+            f"{format_duration(seconds)} at {controller.bucket.rate}/s"
+        )
+        if controller.max_rate > controller.bucket.rate:
+            message += (
+                f", {format_duration(request_count / controller.max_rate)} "
+                f"once the rate reaches {controller.max_rate}/s"
+            )
+        logger.info(message)
+
+    logger.info(f"Estimated duration: at least {format_duration(total_seconds)}")
+
+
+def plan_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    source: ImageSource = args.image_source
+    amaterus_hasura_url: str = args.amaterus_hasura_url
+    internal_useragent: str = args.internal_useragent
+    variants: list[str] = args.variant
+    variant_mode: VariantMode = args.variant_mode
+    thumbnail_base_url: str = args.thumbnail_base_url
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+    http_client_config = get_http_client_config_from_args(args)
+    hasura_page_size: int = args.hasura_page_size
+    incremental: bool = args.incremental
+    refresh_older_than: float | None = args.refresh_older_than
+    rate_limiter = get_host_rate_limiter_from_args(args)
+    shard: Shard | None = args.shard
+    pending_file: Path | None = args.pending_file
+    listing_cache_config = get_listing_cache_config_from_args(args)
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    planned_at = datetime.now().astimezone()
+
+    async def run(state_store: StateStore) -> ImageSourcePlan:
+        async with open_http_client(
+            http_client_config=http_client_config,
+            logger=logger,
+        ) as client:
+            return await plan_image_source(
+                client=client,
+                source=source,
+                amaterus_hasura_url=amaterus_hasura_url,
+                internal_useragent=internal_useragent,
+                variants=variants,
+                variant_mode=variant_mode,
+                thumbnail_base_url=thumbnail_base_url,
+                output_dir=output_dir,
+                state_store=state_store,
+                hasura_page_size=hasura_page_size,
+                incremental=incremental,
+                refresh_older_than=refresh_older_than,
+                shard=shard,
+                listing_cache_config=listing_cache_config,
+                logger=logger,
+            )
+
+    with StateStore(state_file=state_file) as state_store:
+        plan = asyncio.run(run(state_store=state_store))
+
+    for target_plan in plan.target_plans:
+        tombstoned = (
+            f"{target_plan.tombstoned} tombstoned"
+            if target_plan.tombstoned is not None
+            else "tombstoned unknown (incremental listing)"
+        )
+        logger.info(
+            f"{target_plan.source_name}: {target_plan.listed} listed, "
+            f"{target_plan.new} new, "
+            f"{target_plan.refresh} refresh, "
+            f"{target_plan.retry} retryable, "
+            f"{target_plan.done} done, "
+            f"{target_plan.errored} errored, "
+            f"{target_plan.waiting} waiting for retry, "
+            f"{tombstoned}"
+        )
+
+    log_duration_estimate(
+        host_request_counts=plan.host_request_counts,
+        rate_limiter=rate_limiter,
+        logger=logger,
+    )
+
+    if pending_file is not None:
+        write_pending_file(
+            pending_file=pending_file,
+            source=source,
+            planned_at=planned_at,
+            rows=plan.pending_rows,
+        )
+        logger.info(f"Wrote {len(plan.pending_rows)} pending rows to {pending_file}")
+
+
+def add_plan_source_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+    source: ImageSource,
+) -> None:
+    parser.add_argument(
+        "--amaterus_hasura_url",
+        type=str,
+        default=app_config.amaterus_hasura_url,
+        required=app_config.amaterus_hasura_url is None,
+        help="Amaterus Hasura URL",
+    )
+    parser.add_argument(
+        "--internal_useragent",
+        type=str,
+        default=app_config.internal_useragent,
+        required=app_config.internal_useragent is None,
+        help="Useragent for internal HTTP request (Amaterus Hasura)",
+    )
+    if source.has_variants:
+        add_thumbnail_variant_arguments(parser=parser, required=True)
+    else:
+        parser.set_defaults(
+            variant=[],
+            variant_mode="first",
+            thumbnail_base_url=DEFAULT_THUMBNAIL_BASE_URL,
+        )
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory",
+    )
+    parser.add_argument(
+        "--pending_file",
+        type=Path,
+        help="Write the pending rows to this file, for the --pending_file of a crawl",
+    )
+    add_http_client_arguments(
+        parser=parser,
+        app_config=app_config,
+    )
+    add_state_store_arguments(parser=parser)
+    # The flags of the crawl to plan, some of which only matter to the crawl
+    add_crawler_arguments(parser=parser)
+    add_work_distribution_arguments(parser=parser)
+    parser.set_defaults(
+        handler=plan_command,
+        image_source=source,
+    )
+
+
+def add_plan_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    subparsers = parser.add_subparsers(required=True)
+    for source in IMAGE_SOURCES:
+        subparser_source = subparsers.add_parser(
+            source.name,
+            # Amaterus has no deletion marker, so a row missing from the
+            # listing is all that tells a deleted or hidden row apart
+            description=(
+                f"Count the {source.table_name} rows a crawl would fetch. "
+                "Tombstoned counts the items of the state file which the full "
+                "listing no longer returns, i.e. rows deleted or hidden upstream; "
+                "it is unknown for --incremental listings."
+            ),
+        )
+        add_plan_source_arguments(
+            parser=subparser_source,
+            app_config=app_config,
+            source=source,
+        )
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+import time
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator
+from contextlib import contextmanager
+from logging import Logger
+from pathlib import Path
+from typing import Any
+
+from pydantic import BaseModel
+
+from .atomic_file import write_text_atomically
+
+# Per-stage totals are always kept; trace events stop being recorded beyond this
+MAX_TRACE_EVENTS = 1_000_000
+
+
+class StageStats(BaseModel):
+    count: int = 0
+    total_seconds: float = 0
+    max_seconds: float = 0
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.stages: dict[str, StageStats] = {}
+        self.dropped_event_count = 0
+
+        self._started_at = time.monotonic()
+        self._trace_events: list[dict[str, Any]] = []
+        # Chrome trace lanes, one per asyncio task
+        self._lanes: dict[int, int] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._started_at = time.monotonic()
+
+    def get_lane(self) -> int:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            return 0
+
+        lane = self._lanes.get(id(task))
+        if lane is None:
+            lane = len(self._lanes) + 1
+            self._lanes[id(task)] = lane
+        return lane
+
+    @contextmanager
+    def span(self, stage: str, item_id: str | None = None) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage=stage, started_at=started_at, item_id=item_id)
+
+    def record(self, stage: str, started_at: float, item_id: str | None = None) -> None:
+        # started_at is a time.monotonic() timestamp
+        if not self.enabled:
+            return
+
+        elapsed = time.monotonic() - started_at
+
+        stage_stats = self.stages.get(stage)
+        if stage_stats is None:
+            stage_stats = StageStats()
+            self.stages[stage] = stage_stats
+        stage_stats.count += 1
+        stage_stats.total_seconds += elapsed
+        stage_stats.max_seconds = max(stage_stats.max_seconds, elapsed)
+
+        if len(self._trace_events) >= MAX_TRACE_EVENTS:
+            self.dropped_event_count += 1
+            return
+
+        trace_event: dict[str, Any] = {
+            "name": stage,
+            "ph": "X",
+            "ts": (started_at - self._started_at) * 1_000_000,
+            "dur": elapsed * 1_000_000,
+            "pid": os.getpid(),
+            "tid": self.get_lane(),
+        }
+        if item_id is not None:
+            trace_event["args"] = {"id": item_id}
+        self._trace_events.append(trace_event)
+
+    def merge(
+        self,
+        stages: dict[str, StageStats],
+        trace_events: list[dict[str, Any]],
+    ) -> None:
+        # Recorded by a child process, e.g. a benchmark crawl
+        for stage, stage_stats in stages.items():
+            merged_stats = self.stages.get(stage)
+            if merged_stats is None:
+                merged_stats = StageStats()
+                self.stages[stage] = merged_stats
+            merged_stats.count += stage_stats.count
+            merged_stats.total_seconds += stage_stats.total_seconds
+            merged_stats.max_seconds = max(
+                merged_stats.max_seconds,
+                stage_stats.max_seconds,
+            )
+
+        kept_count = max(MAX_TRACE_EVENTS - len(self._trace_events), 0)
+        self._trace_events.extend(trace_events[:kept_count])
+        self.dropped_event_count += len(trace_events[kept_count:])
+
+    def get_chrome_trace(self) -> dict[str, Any]:
+        return {
+            "traceEvents": self._trace_events,
+            "displayTimeUnit": "ms",
+        }
+
+    def log_summary(self, logger: Logger) -> None:
+        # Spans run concurrently across workers, so totals can exceed the wall time
+        wall_seconds = time.monotonic() - self._started_at
+        logger.info(f"Profile of {wall_seconds:.3f}s wall time")
+        for stage, stage_stats in sorted(
+            self.stages.items(),
+            key=lambda item: item[1].total_seconds,
+            reverse=True,
+        ):
+            logger.info(
+                f"[stage={stage}] "
+                f"count={stage_stats.count}, "
+                f"total={stage_stats.total_seconds:.3f}s, "
+                f"mean={stage_stats.total_seconds / stage_stats.count * 1000:.3f}ms, "
+                f"max={stage_stats.max_seconds * 1000:.3f}ms"
+            )
+
+        if self.dropped_event_count > 0:
+            logger.warning(
+                f"{self.dropped_event_count} trace events were dropped "
+                f"beyond {MAX_TRACE_EVENTS}"
+            )
+
+
+PROFILER = Profiler()
+
+
+def start_profile_from_args(args: Namespace) -> Path | None:
+    profile_file: Path | None = args.profile
+    if profile_file is not None:
+        PROFILER.enable()
+    return profile_file
+
+
+def write_profile(profile_file: Path | None, logger: Logger) -> None:
+    if profile_file is None:
+        return
+
+    PROFILER.log_summary(logger=logger)
+    write_text_atomically(
+        target_file=profile_file,
+        text=json.dumps(PROFILER.get_chrome_trace()),
+    )
+    logger.info(f"Wrote trace to {profile_file}")
+
+
+def add_profile_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        help=(
+            "Time each pipeline stage, log a breakdown at exit "
+            "and write spans as Chrome trace JSON (open in Perfetto) to this file"
+        ),
+    )
@@ -0,0 +1,181 @@
+import asyncio
+import math
+import time
+from logging import Logger
+from urllib.parse import urlsplit
+
+THROTTLE_STATUS_CODES = {429, 503}
+
+# Multiplicative decrease applied on throttling or rising latency
+RATE_DECREASE_FACTOR = 0.5
+
+# Latency this many times above the best observed average counts as congestion
+LATENCY_CONGESTION_FACTOR = 3.0
+
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def get_host(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError(f"rate must be positive: {rate}")
+        if burst < 1:
+            raise ValueError(f"burst must be at least 1: {burst}")
+
+        self.rate = rate
+        self.burst = burst
+
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate: float) -> None:
+        # Tokens accumulated so far are counted at the old rate
+        self._refill()
+        self.rate = rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        # asyncio.Lock wakes waiters in FIFO order,
+        # so requests to the same host are served in arrival order.
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AimdRateController:
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        min_rate: float,
+        max_rate: float,
+        rate_increase: float,
+    ) -> None:
+        if not 0 < min_rate <= max_rate:
+            raise ValueError(f"Invalid rate range: {min_rate} - {max_rate}")
+
+        self.bucket = bucket
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_increase = rate_increase
+
+        self._latency_average: float | None = None
+        self._best_latency_average = math.inf
+        self._decreased_at = -math.inf
+
+    def on_response(self, latency: float | None, throttled: bool) -> None:
+        # No latency means the request failed in transport (e.g. a timeout)
+        congested = throttled or latency is None
+
+        if latency is not None:
+            if self._latency_average is None:
+                self._latency_average = latency
+            else:
+                self._latency_average += LATENCY_EWMA_ALPHA * (
+                    latency - self._latency_average
+                )
+
+            self._best_latency_average = min(
+                self._best_latency_average,
+                self._latency_average,
+            )
+            if (
+                self._latency_average
+                > self._best_latency_average * LATENCY_CONGESTION_FACTOR
+            ):
+                congested = True
+
+        rate = self.bucket.rate
+        if congested:
+            # Responses to requests sent before the last decrease
+            # do not reflect it yet
+            now = time.monotonic()
+            if now - self._decreased_at < 1 / rate:
+                return
+
+            self._decreased_at = now
+            self.bucket.set_rate(max(self.min_rate, rate * RATE_DECREASE_FACTOR))
+        else:
+            # rate_increase requests per second are added per second
+            self.bucket.set_rate(min(self.max_rate, rate + self.rate_increase / rate))
+
+
+class HostRateLimiter:
+    def __init__(
+        self,
+        rate_per_host: float,
+        burst_per_host: float,
+        min_rate_per_host: float | None = None,
+        max_rate_per_host: float | None = None,
+        rate_increase: float = 0.1,
+        host_rate_ranges: dict[str, tuple[float, float]] | None = None,
+    ) -> None:
+        self.rate_per_host = rate_per_host
+        self.burst_per_host = burst_per_host
+
+        # A fixed rate unless a range is configured
+        self.min_rate_per_host = (
+            min_rate_per_host if min_rate_per_host is not None else rate_per_host
+        )
+        self.max_rate_per_host = (
+            max_rate_per_host if max_rate_per_host is not None else rate_per_host
+        )
+        self.rate_increase = rate_increase
+        self.host_rate_ranges = host_rate_ranges or {}
+
+        self._controllers: dict[str, AimdRateController] = {}
+
+    def get_controller(self, host: str) -> AimdRateController:
+        controller = self._controllers.get(host)
+        if controller is None:
+            min_rate, max_rate = self.host_rate_ranges.get(
+                host,
+                (self.min_rate_per_host, self.max_rate_per_host),
+            )
+
+            controller = AimdRateController(
+                bucket=TokenBucket(
+                    rate=min(max(self.rate_per_host, min_rate), max_rate),
+                    burst=self.burst_per_host,
+                ),
+                min_rate=min_rate,
+                max_rate=max_rate,
+                rate_increase=self.rate_increase,
+            )
+            self._controllers[host] = controller
+        return controller
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        return self.get_controller(host).bucket
+
+    async def acquire(self, url: str) -> None:
+        await self.get_bucket(get_host(url)).acquire()
+
+    def on_response(self, url: str, latency: float | None, throttled: bool) -> None:
+        host = get_host(url)
+        self.get_controller(host).on_response(latency=latency, throttled=throttled)
+
+    def log_summary(self, logger: Logger) -> None:
+        for host, controller in sorted(self._controllers.items()):
+            logger.info(
+                f"[host={host}] rate={controller.bucket.rate:.3f}/s "
+                f"(min={controller.min_rate}, max={controller.max_rate})"
+            )
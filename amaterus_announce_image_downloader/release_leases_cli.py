@@ -0,0 +1,57 @@
+from argparse import ArgumentParser, Namespace
+from datetime import datetime
+from logging import Logger
+from pathlib import Path
+
+from .app_config import AppConfig
+from .state_store import StateStore, add_state_store_arguments, get_default_state_file
+
+
+def release_leases_command(
+    args: Namespace,
+    logger: Logger,
+) -> None:
+    output_dir: Path = args.output_dir
+    state_file: Path | None = args.state_file
+    worker_id: str | None = args.worker_id
+    expired: bool = args.expired
+
+    if worker_id is None and not expired:
+        raise ValueError("Either --worker_id or --expired is required")
+
+    if state_file is None:
+        state_file = get_default_state_file(output_dir=output_dir)
+
+    with StateStore(state_file=state_file, mode="rw") as state_store:
+        released_count = state_store.release_leases(
+            worker_id=worker_id,
+            expired_before=datetime.now().astimezone() if expired else None,
+        )
+
+    logger.info(f"Released {released_count} leases in {state_file}")
+
+
+def add_release_leases_arguments(
+    parser: ArgumentParser,
+    app_config: AppConfig,
+) -> None:
+    parser.add_argument(
+        "--output_dir",
+        type=Path,
+        required=True,
+        help="Output directory shared by the --work_queue workers",
+    )
+    parser.add_argument(
+        "--worker_id",
+        type=str,
+        help="Release the leases of this crashed worker right away",
+    )
+    parser.add_argument(
+        "--expired",
+        action="store_true",
+        help="Release the expired leases",
+    )
+    add_state_store_arguments(parser=parser)
+    parser.set_defaults(
+        handler=release_leases_command,
+    )
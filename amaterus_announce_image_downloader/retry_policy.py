@@ -0,0 +1,123 @@
+import random
+from argparse import ArgumentParser, Namespace
+from datetime import UTC, datetime, timedelta
+from email.utils import parsedate_to_datetime
+
+import httpx
+from pydantic import BaseModel
+
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# Markers of transient failures in the tracebacks of legacy .error.txt files
+LEGACY_TRANSIENT_ERROR_MARKERS = [
+    "httpx.ConnectError",
+    "httpx.ConnectTimeout",
+    "httpx.PoolTimeout",
+    "httpx.ReadError",
+    "httpx.ReadTimeout",
+    "httpx.RemoteProtocolError",
+    "httpx.WriteTimeout",
+    *(f"'{status_code} " for status_code in sorted(TRANSIENT_STATUS_CODES)),
+]
+
+
+class RetryPolicy(BaseModel):
+    max_attempts: int
+    initial_backoff: float
+    max_backoff: float
+
+    def get_retry_delay(
+        self,
+        failure_count: int,
+        retry_after: float | None,
+    ) -> float:
+        backoff = min(
+            self.max_backoff,
+            self.initial_backoff * 2 ** max(failure_count - 1, 0),
+        )
+
+        # Jitter spreads retries of items which failed together (e.g. an outage)
+        delay = random.uniform(backoff / 2, backoff)
+
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        return delay
+
+    def get_next_attempt_at(
+        self,
+        failure_count: int,
+        retry_after: float | None,
+        failed_at: datetime,
+    ) -> datetime | None:
+        if failure_count >= self.max_attempts:
+            return None
+
+        delay = self.get_retry_delay(
+            failure_count=failure_count,
+            retry_after=retry_after,
+        )
+        return failed_at + timedelta(seconds=delay)
+
+
+def is_transient_http_error(error: httpx.HTTPError) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in TRANSIENT_STATUS_CODES
+
+    # Timeouts, connection failures and protocol errors
+    return isinstance(error, httpx.TransportError)
+
+
+def is_transient_legacy_error(last_error: str) -> bool:
+    return any(marker in last_error for marker in LEGACY_TRANSIENT_ERROR_MARKERS)
+
+
+def parse_retry_after(response: httpx.Response, now: datetime) -> float | None:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after is None:
+        return None
+
+    retry_after = retry_after.strip()
+    if retry_after.isdigit():
+        return float(retry_after)
+
+    try:
+        retry_at = parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=UTC)
+
+    return max((retry_at - now).total_seconds(), 0)
+
+
+def get_retry_policy_from_args(args: Namespace) -> RetryPolicy:
+    return RetryPolicy(
+        max_attempts=args.retry_max_attempts,
+        initial_backoff=args.retry_initial_backoff,
+        max_backoff=args.retry_max_backoff,
+    )
+
+
+def add_retry_policy_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--retry_max_attempts",
+        type=int,
+        default=8,
+        help="Give up an item after this many consecutive transient failures",
+    )
+    parser.add_argument(
+        "--retry_initial_backoff",
+        type=float,
+        default=3600,
+        help="Seconds to wait before the first retry of a transient failure",
+    )
+    parser.add_argument(
+        "--retry_max_backoff",
+        type=float,
+        default=7 * 24 * 3600,
+        help="Upper bound in seconds of the exponential retry backoff",
+    )
@@ -0,0 +1,929 @@
+import os
+import re
+import sqlite3
+from argparse import ArgumentParser
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+ItemStatus = Literal["fetched", "errored", "retrying"]
+
+# SQLite open modes: rwc creates a missing state file, rw and ro require one
+StateFileMode = Literal["rwc", "rw", "ro"]
+
+SOURCE_NAME_PATTERN = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+STATE_FILE_LOCK_TIMEOUT = 30.0
+
+ITEM_STATE_COLUMNS = """
+  id,
+  status,
+  url,
+  content_type,
+  file_name,
+  size,
+  sha256,
+  stored_as_blob,
+  etag,
+  last_modified,
+  fetched_at,
+  checked_at,
+  attempt_count,
+  failure_count,
+  last_error,
+  next_attempt_at
+"""
+
+# Everything except retries which are due and stale fetched items
+SKIP_CONDITION = """
+  (status != 'retrying' OR next_attempt_at > ?)
+  AND NOT (status = 'fetched' AND COALESCE(checked_at, 0) < ?)
+"""
+
+
+class ItemState(BaseModel):
+    id: str
+    status: ItemStatus
+    url: str | None
+    content_type: str | None
+    file_name: str | None
+    size: int | None
+    sha256: str | None
+    # Hard linked to or referencing a blob of --content_addressed
+    stored_as_blob: bool
+    etag: str | None
+    last_modified: str | None
+    fetched_at: datetime | None
+    checked_at: datetime | None
+    attempt_count: int
+    failure_count: int
+    last_error: str | None
+    next_attempt_at: datetime | None
+
+
+class ListingCacheEntry(BaseModel):
+    listing_key: str
+    fingerprint: str
+    cached_at: datetime
+    # False until every page of the listing is stored
+    complete: bool
+
+
+class DedupStats(BaseModel):
+    item_count: int
+    blob_count: int
+    total_size: int
+    stored_size: int
+
+    @property
+    def saved_size(self) -> int:
+        return self.total_size - self.stored_size
+
+
+class StateStoreNotMigratedError(Exception):
+    pass
+
+
+class StateFileNotFoundError(Exception):
+    pass
+
+
+def get_default_state_file(output_dir: Path) -> Path:
+    return output_dir / "state.sqlite3"
+
+
+def has_legacy_state_files(output_dir: Path) -> bool:
+    if not output_dir.exists():
+        return False
+
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.name.endswith(".json") or entry.name.endswith(".error.txt"):
+                return True
+
+    return False
+
+
+class StateStore:
+    def __init__(self, state_file: Path, mode: StateFileMode = "rwc") -> None:
+        if mode == "rwc":
+            state_file.parent.mkdir(parents=True, exist_ok=True)
+        elif not state_file.is_file():
+            raise StateFileNotFoundError(
+                f"{state_file} does not exist. Run a crawl first, or pass "
+                "--state_file if it is not in the output directory."
+            )
+
+        self.state_file = state_file
+        # Workers of a --work_queue share the file and wait for each other's writes
+        self._connection = sqlite3.connect(
+            f"{state_file.absolute().as_uri()}?mode={mode}",
+            timeout=STATE_FILE_LOCK_TIMEOUT,
+            uri=True,
+        )
+        if mode == "ro":
+            return
+
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            """
+CREATE TABLE IF NOT EXISTS watermarks (
+  source_name TEXT PRIMARY KEY,
+  updated_at TEXT NOT NULL
+)
+"""
+        )
+        self._connection.execute(
+            """
+CREATE TABLE IF NOT EXISTS output_layouts (
+  source_name TEXT PRIMARY KEY,
+  output_layout TEXT NOT NULL
+)
+"""
+        )
+        self._connection.execute(
+            """
+CREATE TABLE IF NOT EXISTS leases (
+  source_name TEXT NOT NULL,
+  item_id TEXT NOT NULL,
+  worker_id TEXT NOT NULL,
+  expires_at REAL NOT NULL,
+  PRIMARY KEY (source_name, item_id)
+)
+"""
+        )
+        self._connection.execute(
+            """
+CREATE TABLE IF NOT EXISTS listing_cache (
+  listing_key TEXT PRIMARY KEY,
+  fingerprint TEXT NOT NULL,
+  cached_at REAL NOT NULL,
+  complete INTEGER NOT NULL
+)
+"""
+        )
+        self._connection.execute(
+            """
+CREATE TABLE IF NOT EXISTS listing_cache_pages (
+  listing_key TEXT NOT NULL,
+  page_key TEXT NOT NULL,
+  rows TEXT NOT NULL,
+  PRIMARY KEY (listing_key, page_key)
+)
+"""
+        )
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "StateStore":
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def _get_table_name(self, source_name: str) -> str:
+        # Table names cannot be bound as parameters
+        if SOURCE_NAME_PATTERN.match(source_name) is None:
+            raise ValueError(f"Invalid source name: {source_name}")
+        return f"items_{source_name}"
+
+    def ensure_source(self, source_name: str) -> bool:
+        table_name = self._get_table_name(source_name)
+
+        # Workers of a --work_queue may start on the same state file at once
+        with self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+
+            row = self._connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table_name,),
+            ).fetchone()
+            if row is not None:
+                self._ensure_columns(
+                    table_name=table_name,
+                    columns={
+                        "url": "TEXT",
+                        "size": "INTEGER",
+                        "sha256": "TEXT",
+                        "stored_as_blob": "INTEGER NOT NULL DEFAULT 0",
+                        "etag": "TEXT",
+                        "last_modified": "TEXT",
+                        "checked_at": "REAL",
+                        "failure_count": "INTEGER NOT NULL DEFAULT 0",
+                        "next_attempt_at": "REAL",
+                    },
+                )
+                return False
+
+            self._connection.execute(
+                f"""
+CREATE TABLE IF NOT EXISTS {table_name} (
+  id TEXT PRIMARY KEY,
+  status TEXT NOT NULL,
+  url TEXT,
+  content_type TEXT,
+  file_name TEXT,
+  size INTEGER,
+  sha256 TEXT,
+  stored_as_blob INTEGER NOT NULL DEFAULT 0,
+  etag TEXT,
+  last_modified TEXT,
+  fetched_at TEXT,
+  checked_at REAL,
+  attempt_count INTEGER NOT NULL DEFAULT 0,
+  failure_count INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  next_attempt_at REAL
+)
+"""
+            )
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {table_name}_next_attempt_at "
+                f"ON {table_name} (next_attempt_at)"
+            )
+            return True
+
+    def _ensure_columns(self, table_name: str, columns: dict[str, str]) -> None:
+        # Add columns introduced after the table was created
+        existing_columns = {
+            row[1]
+            for row in self._connection.execute(f"PRAGMA table_info({table_name})")
+        }
+
+        for column_name, column_definition in columns.items():
+            if column_name in existing_columns:
+                continue
+            self._connection.execute(
+                f"ALTER TABLE {table_name} "
+                f"ADD COLUMN {column_name} {column_definition}"
+            )
+
+    def ensure_migrated_source(self, source_name: str, output_dir: Path) -> None:
+        created = self.ensure_source(source_name=source_name)
+        if not created and self.count_items(source_name=source_name) > 0:
+            return
+
+        self._check_legacy_state_files(output_dir=output_dir)
+
+    def check_source(self, source_name: str) -> None:
+        # The read-only counterpart of ensure_source
+        table_name = self._get_table_name(source_name)
+
+        columns = {
+            row[1]
+            for row in self._connection.execute(f"PRAGMA table_info({table_name})")
+        }
+        if len(columns) == 0:
+            source_names = self.get_source_names()
+            raise ValueError(
+                f"No {source_name} in {self.state_file} "
+                f"(sources: {', '.join(source_names) or 'none'})"
+            )
+
+        missing_columns = [
+            column
+            for column in ITEM_STATE_COLUMNS.replace(",", " ").split()
+            if column not in columns
+        ]
+        if len(missing_columns) > 0:
+            raise StateStoreNotMigratedError(
+                f"{source_name} in {self.state_file} has no "
+                f"{', '.join(missing_columns)} columns yet. "
+                "Run a crawl of the source first."
+            )
+
+    def check_migrated_source(self, source_name: str, output_dir: Path) -> None:
+        self.check_source(source_name=source_name)
+        if self.count_items(source_name=source_name) > 0:
+            return
+
+        self._check_legacy_state_files(output_dir=output_dir)
+
+    def _check_legacy_state_files(self, output_dir: Path) -> None:
+        if has_legacy_state_files(output_dir=output_dir):
+            raise StateStoreNotMigratedError(
+                f"{output_dir} contains .json/.error.txt files which are not "
+                f"imported to {self.state_file}. Run the migrate_state command first."
+            )
+
+    def count_items(self, source_name: str) -> int:
+        table_name = self._get_table_name(source_name)
+
+        row = self._connection.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()
+        return int(row[0])
+
+    def get_item_ids(self, source_name: str) -> list[str]:
+        table_name = self._get_table_name(source_name)
+
+        return [
+            row[0]
+            for row in self._connection.execute(
+                f"SELECT id FROM {table_name} ORDER BY id"
+            )
+        ]
+
+    def get_skip_ids(
+        self,
+        source_name: str,
+        now: datetime,
+        refresh_before: datetime | None,
+    ) -> set[str]:
+        table_name = self._get_table_name(source_name)
+
+        # Nothing was checked before the epoch
+        refresh_before_timestamp = (
+            refresh_before.timestamp() if refresh_before is not None else 0.0
+        )
+
+        return {
+            row[0]
+            for row in self._connection.execute(
+                f"SELECT id FROM {table_name} WHERE {SKIP_CONDITION}",
+                (now.timestamp(), refresh_before_timestamp),
+            )
+        }
+
+    def should_skip(
+        self,
+        source_name: str,
+        item_id: str,
+        now: datetime,
+        refresh_before: datetime | None,
+    ) -> bool:
+        table_name = self._get_table_name(source_name)
+
+        refresh_before_timestamp = (
+            refresh_before.timestamp() if refresh_before is not None else 0.0
+        )
+
+        # Same as get_skip_ids, for items another worker may have finished since
+        row = self._connection.execute(
+            f"SELECT 1 FROM {table_name} WHERE id = ? AND {SKIP_CONDITION}",
+            (item_id, now.timestamp(), refresh_before_timestamp),
+        ).fetchone()
+        return row is not None
+
+    def get_due_retry_ids(self, source_name: str, now: datetime) -> list[str]:
+        table_name = self._get_table_name(source_name)
+
+        return [
+            row[0]
+            for row in self._connection.execute(
+                f"""
+SELECT id FROM {table_name}
+WHERE status = 'retrying' AND next_attempt_at <= ?
+ORDER BY id
+""",
+                (now.timestamp(),),
+            )
+        ]
+
+    def get_refresh_ids(
+        self,
+        source_name: str,
+        refresh_before: datetime,
+    ) -> list[str]:
+        table_name = self._get_table_name(source_name)
+
+        return [
+            row[0]
+            for row in self._connection.execute(
+                f"""
+SELECT id FROM {table_name}
+WHERE status = 'fetched' AND COALESCE(checked_at, 0) < ?
+ORDER BY id
+""",
+                (refresh_before.timestamp(),),
+            )
+        ]
+
+    def get_item_state(self, source_name: str, item_id: str) -> ItemState | None:
+        table_name = self._get_table_name(source_name)
+
+        row = self._connection.execute(
+            f"SELECT {ITEM_STATE_COLUMNS} FROM {table_name} WHERE id = ?",
+            (item_id,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return get_item_state_from_row(row=row)
+
+    def iter_item_states(self, source_name: str) -> Iterator[ItemState]:
+        table_name = self._get_table_name(source_name)
+
+        for row in self._connection.execute(
+            f"SELECT {ITEM_STATE_COLUMNS} FROM {table_name} ORDER BY id"
+        ):
+            yield get_item_state_from_row(row=row)
+
+    def get_source_names(self) -> list[str]:
+        return [
+            row[0].removeprefix("items_")
+            for row in self._connection.execute(
+                """
+SELECT name FROM sqlite_master
+WHERE type = 'table' AND name LIKE 'items\\_%' ESCAPE '\\'
+ORDER BY name
+"""
+            )
+        ]
+
+    def record_fetched(
+        self,
+        source_name: str,
+        item_id: str,
+        url: str,
+        content_type: str,
+        file_name: str,
+        size: int,
+        sha256: str,
+        stored_as_blob: bool,
+        etag: str | None,
+        last_modified: str | None,
+        fetched_at: datetime,
+    ) -> None:
+        table_name = self._get_table_name(source_name)
+
+        self._connection.execute(
+            f"""
+INSERT INTO {table_name} (
+  id,
+  status,
+  url,
+  content_type,
+  file_name,
+  size,
+  sha256,
+  stored_as_blob,
+  etag,
+  last_modified,
+  fetched_at,
+  checked_at,
+  attempt_count,
+  failure_count
+)
+VALUES (?, 'fetched', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, 0)
+ON CONFLICT (id) DO UPDATE SET
+  status = excluded.status,
+  url = excluded.url,
+  content_type = excluded.content_type,
+  file_name = excluded.file_name,
+  size = excluded.size,
+  sha256 = excluded.sha256,
+  stored_as_blob = excluded.stored_as_blob,
+  etag = excluded.etag,
+  last_modified = excluded.last_modified,
+  fetched_at = excluded.fetched_at,
+  checked_at = excluded.checked_at,
+  attempt_count = attempt_count + 1,
+  failure_count = 0,
+  last_error = NULL,
+  next_attempt_at = NULL
+""",
+            (
+                item_id,
+                url,
+                content_type,
+                file_name,
+                size,
+                sha256,
+                int(stored_as_blob),
+                etag,
+                last_modified,
+                fetched_at.isoformat(),
+                fetched_at.timestamp(),
+            ),
+        )
+        self._connection.commit()
+
+    def record_checked(
+        self,
+        source_name: str,
+        item_id: str,
+        etag: str | None,
+        last_modified: str | None,
+        checked_at: datetime,
+    ) -> None:
+        table_name = self._get_table_name(source_name)
+
+        # The fetched image is kept as it is
+        self._connection.execute(
+            f"""
+UPDATE {table_name}
+SET etag = ?, last_modified = ?, checked_at = ?
+WHERE id = ?
+""",
+            (etag, last_modified, checked_at.timestamp(), item_id),
+        )
+        self._connection.commit()
+
+    def update_file_name(
+        self,
+        source_name: str,
+        item_id: str,
+        file_name: str,
+    ) -> None:
+        table_name = self._get_table_name(source_name)
+
+        self._connection.execute(
+            f"UPDATE {table_name} SET file_name = ? WHERE id = ?",
+            (file_name, item_id),
+        )
+        self._connection.commit()
+
+    def record_failed(
+        self,
+        source_name: str,
+        item_id: str,
+        error: str,
+        fetched_at: datetime,
+        next_attempt_at: datetime | None,
+    ) -> None:
+        table_name = self._get_table_name(source_name)
+
+        # Without next_attempt_at the failure is permanent
+        status: ItemStatus = "retrying" if next_attempt_at is not None else "errored"
+
+        self._connection.execute(
+            f"""
+INSERT INTO {table_name} (
+  id,
+  status,
+  fetched_at,
+  attempt_count,
+  failure_count,
+  last_error,
+  next_attempt_at
+)
+VALUES (?, ?, ?, 1, 1, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+  status = excluded.status,
+  fetched_at = excluded.fetched_at,
+  attempt_count = attempt_count + 1,
+  failure_count = failure_count + 1,
+  last_error = excluded.last_error,
+  next_attempt_at = excluded.next_attempt_at
+""",
+            (
+                item_id,
+                status,
+                fetched_at.isoformat(),
+                error,
+                next_attempt_at.timestamp() if next_attempt_at is not None else None,
+            ),
+        )
+        self._connection.commit()
+
+    def import_item_states(
+        self,
+        source_name: str,
+        item_states: Iterable[ItemState],
+    ) -> int:
+        table_name = self._get_table_name(source_name)
+
+        with self._connection:
+            cursor = self._connection.executemany(
+                f"""
+INSERT OR IGNORE INTO {table_name} ({ITEM_STATE_COLUMNS})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+""",
+                (
+                    get_item_state_values(item_state=item_state)
+                    for item_state in item_states
+                ),
+            )
+        return cursor.rowcount
+
+    def merge_item_states(
+        self,
+        source_name: str,
+        item_states: Iterable[ItemState],
+    ) -> int:
+        table_name = self._get_table_name(source_name)
+
+        # A fetched item wins over a failed one, then the latest check wins
+        with self._connection:
+            cursor = self._connection.executemany(
+                f"""
+INSERT INTO {table_name} ({ITEM_STATE_COLUMNS})
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+  status = excluded.status,
+  url = excluded.url,
+  content_type = excluded.content_type,
+  file_name = excluded.file_name,
+  size = excluded.size,
+  sha256 = excluded.sha256,
+  stored_as_blob = excluded.stored_as_blob,
+  etag = excluded.etag,
+  last_modified = excluded.last_modified,
+  fetched_at = excluded.fetched_at,
+  checked_at = excluded.checked_at,
+  attempt_count = excluded.attempt_count,
+  failure_count = excluded.failure_count,
+  last_error = excluded.last_error,
+  next_attempt_at = excluded.next_attempt_at
+WHERE
+  (excluded.status = 'fetched') > ({table_name}.status = 'fetched')
+  OR (
+    (excluded.status = 'fetched') = ({table_name}.status = 'fetched')
+    AND COALESCE(excluded.checked_at, 0) > COALESCE({table_name}.checked_at, 0)
+  )
+""",
+                (
+                    get_item_state_values(item_state=item_state)
+                    for item_state in item_states
+                ),
+            )
+        return cursor.rowcount
+
+    def get_dedup_stats(self, source_name: str) -> DedupStats:
+        table_name = self._get_table_name(source_name)
+
+        row = self._connection.execute(
+            f"""
+SELECT
+  COUNT(*),
+  COUNT(DISTINCT sha256),
+  COALESCE(SUM(size), 0),
+  (
+    SELECT COALESCE(SUM(blob_size), 0)
+    FROM (
+      SELECT MAX(size) AS blob_size
+      FROM {table_name}
+      WHERE status = 'fetched' AND stored_as_blob = 1
+      GROUP BY sha256
+    )
+  )
+FROM {table_name}
+WHERE status = 'fetched' AND stored_as_blob = 1
+"""
+        ).fetchone()
+
+        return DedupStats(
+            item_count=row[0],
+            blob_count=row[1],
+            total_size=row[2],
+            stored_size=row[3],
+        )
+
+    def load_watermark(self, source_name: str) -> datetime | None:
+        row = self._connection.execute(
+            "SELECT updated_at FROM watermarks WHERE source_name = ?",
+            (source_name,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return datetime.fromisoformat(row[0])
+
+    def save_watermark(self, source_name: str, updated_at: datetime) -> None:
+        self._connection.execute(
+            """
+INSERT INTO watermarks (source_name, updated_at)
+VALUES (?, ?)
+ON CONFLICT (source_name) DO UPDATE SET updated_at = excluded.updated_at
+""",
+            (source_name, updated_at.isoformat()),
+        )
+        self._connection.commit()
+
+    def load_output_layout(self, source_name: str) -> str | None:
+        row = self._connection.execute(
+            "SELECT output_layout FROM output_layouts WHERE source_name = ?",
+            (source_name,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return str(row[0])
+
+    def save_output_layout(self, source_name: str, output_layout: str) -> None:
+        self._connection.execute(
+            """
+INSERT INTO output_layouts (source_name, output_layout)
+VALUES (?, ?)
+ON CONFLICT (source_name) DO UPDATE SET output_layout = excluded.output_layout
+""",
+            (source_name, output_layout),
+        )
+        self._connection.commit()
+
+    def acquire_lease(
+        self,
+        source_name: str,
+        item_id: str,
+        worker_id: str,
+        now: datetime,
+        lease_duration: float,
+    ) -> bool:
+        # Taken over once expired, so that items of crashed workers are retried
+        cursor = self._connection.execute(
+            """
+INSERT INTO leases (source_name, item_id, worker_id, expires_at)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (source_name, item_id) DO UPDATE SET
+  worker_id = excluded.worker_id,
+  expires_at = excluded.expires_at
+WHERE leases.expires_at <= ? OR leases.worker_id = excluded.worker_id
+""",
+            (
+                source_name,
+                item_id,
+                worker_id,
+                now.timestamp() + lease_duration,
+                now.timestamp(),
+            ),
+        )
+        self._connection.commit()
+        return cursor.rowcount > 0
+
+    def release_lease(self, source_name: str, item_id: str, worker_id: str) -> None:
+        self._connection.execute(
+            """
+DELETE FROM leases
+WHERE source_name = ? AND item_id = ? AND worker_id = ?
+""",
+            (source_name, item_id, worker_id),
+        )
+        self._connection.commit()
+
+    def release_leases(
+        self,
+        worker_id: str | None,
+        expired_before: datetime | None,
+    ) -> int:
+        cursor = self._connection.execute(
+            """
+DELETE FROM leases
+WHERE (? IS NULL OR worker_id = ?) AND (? IS NULL OR expires_at <= ?)
+""",
+            (
+                worker_id,
+                worker_id,
+                expired_before.timestamp() if expired_before is not None else None,
+                expired_before.timestamp() if expired_before is not None else None,
+            ),
+        )
+        self._connection.commit()
+        return cursor.rowcount
+
+    def load_listing_cache_entry(self, listing_key: str) -> ListingCacheEntry | None:
+        row = self._connection.execute(
+            """
+SELECT fingerprint, cached_at, complete FROM listing_cache WHERE listing_key = ?
+""",
+            (listing_key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        return ListingCacheEntry(
+            listing_key=listing_key,
+            fingerprint=row[0],
+            cached_at=row[1],
+            complete=bool(row[2]),
+        )
+
+    def save_listing_cache_entry(self, entry: ListingCacheEntry) -> None:
+        self._connection.execute(
+            """
+INSERT INTO listing_cache (listing_key, fingerprint, cached_at, complete)
+VALUES (?, ?, ?, ?)
+ON CONFLICT (listing_key) DO UPDATE SET
+  fingerprint = excluded.fingerprint,
+  cached_at = excluded.cached_at,
+  complete = excluded.complete
+""",
+            (
+                entry.listing_key,
+                entry.fingerprint,
+                entry.cached_at.timestamp(),
+                int(entry.complete),
+            ),
+        )
+        self._connection.commit()
+
+    def delete_listing_cache_entries(self, cached_before: datetime) -> int:
+        with self._connection:
+            self._connection.execute(
+                """
+DELETE FROM listing_cache_pages
+WHERE listing_key IN (SELECT listing_key FROM listing_cache WHERE cached_at < ?)
+""",
+                (cached_before.timestamp(),),
+            )
+            cursor = self._connection.execute(
+                "DELETE FROM listing_cache WHERE cached_at < ?",
+                (cached_before.timestamp(),),
+            )
+        return cursor.rowcount
+
+    def delete_listing_cache_pages(self, listing_key: str) -> None:
+        self._connection.execute(
+            "DELETE FROM listing_cache_pages WHERE listing_key = ?",
+            (listing_key,),
+        )
+        self._connection.commit()
+
+    def load_listing_cache_page(self, listing_key: str, page_key: str) -> str | None:
+        row = self._connection.execute(
+            """
+SELECT rows FROM listing_cache_pages WHERE listing_key = ? AND page_key = ?
+""",
+            (listing_key, page_key),
+        ).fetchone()
+        if row is None:
+            return None
+
+        rows: str = row[0]
+        return rows
+
+    def save_listing_cache_page(
+        self,
+        listing_key: str,
+        page_key: str,
+        rows: str,
+    ) -> None:
+        self._connection.execute(
+            """
+INSERT INTO listing_cache_pages (listing_key, page_key, rows)
+VALUES (?, ?, ?)
+ON CONFLICT (listing_key, page_key) DO UPDATE SET rows = excluded.rows
+""",
+            (listing_key, page_key, rows),
+        )
+        self._connection.commit()
+
+
+def get_item_state_from_row(row: tuple[Any, ...]) -> ItemState:
+    return ItemState(
+        id=row[0],
+        status=row[1],
+        url=row[2],
+        content_type=row[3],
+        file_name=row[4],
+        size=row[5],
+        sha256=row[6],
+        stored_as_blob=bool(row[7]),
+        etag=row[8],
+        last_modified=row[9],
+        fetched_at=row[10],
+        checked_at=row[11],
+        attempt_count=row[12],
+        failure_count=row[13],
+        last_error=row[14],
+        next_attempt_at=row[15],
+    )
+
+
+def get_item_state_values(item_state: ItemState) -> tuple[Any, ...]:
+    return (
+        item_state.id,
+        item_state.status,
+        item_state.url,
+        item_state.content_type,
+        item_state.file_name,
+        item_state.size,
+        item_state.sha256,
+        int(item_state.stored_as_blob),
+        item_state.etag,
+        item_state.last_modified,
+        (
+            item_state.fetched_at.isoformat()
+            if item_state.fetched_at is not None
+            else None
+        ),
+        (
+            item_state.checked_at.timestamp()
+            if item_state.checked_at is not None
+            else None
+        ),
+        item_state.attempt_count,
+        item_state.failure_count,
+        item_state.last_error,
+        (
+            item_state.next_attempt_at.timestamp()
+            if item_state.next_attempt_at is not None
+            else None
+        ),
+    )
+
+
+def add_state_store_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--state_file",
+        type=Path,
+        help="SQLite state file (default: state.sqlite3 in the output directory)",
+    )
@@ -0,0 +1,46 @@
+from datetime import datetime
+from typing import Any
+
+# Every page request repeats the ids, so beyond this many a full listing
+# is cheaper than an incremental one
+MAX_INCREMENTAL_DUE_IDS = 1000
+
+
+class WatermarkTracker:
+    def __init__(self, updated_at: datetime | None) -> None:
+        self.updated_at = updated_at
+        self.held_at: datetime | None = None
+
+    def observe(self, updated_at: datetime) -> None:
+        if self.updated_at is None or self.updated_at < updated_at:
+            self.updated_at = updated_at
+
+    def hold(self, updated_at: datetime) -> None:
+        # The next listing starts at or before this time, e.g. for rows
+        # still being crawled by another worker
+        if self.held_at is None or updated_at < self.held_at:
+            self.held_at = updated_at
+
+    def get_saved_updated_at(self) -> datetime | None:
+        if self.updated_at is None or self.held_at is None:
+            return self.updated_at
+        return min(self.updated_at, self.held_at)
+
+
+def get_incremental_where(
+    updated_since: datetime,
+    due_ids: list[str],
+) -> dict[str, Any]:
+    # _gte rather than _gt so that rows sharing the boundary timestamp,
+    # but committed after the previous run, are not lost
+    updated_since_where = {"updated_at": {"_gte": updated_since.isoformat()}}
+    if not due_ids:
+        return updated_since_where
+
+    # Rows waiting for retry or refresh are older than the watermark
+    return {
+        "_or": [
+            updated_since_where,
+            {"id": {"_in": due_ids}},
+        ],
+    }
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import socket
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+
+from pydantic import BaseModel
+
+DEFAULT_LEASE_DURATION = 600.0
+
+
+class Shard(BaseModel):
+    index: int
+    count: int
+
+
+class WorkQueueConfig(BaseModel):
+    worker_id: str
+    lease_duration: float
+
+
+def parse_shard(value: str) -> Shard:
+    index, separator, count = value.partition("/")
+    try:
+        shard = Shard(index=int(index), count=int(count))
+    except ValueError as error:
+        raise ArgumentTypeError(f"Expected INDEX/COUNT: {value}") from error
+
+    if not separator or shard.count < 1 or not 0 <= shard.index < shard.count:
+        raise ArgumentTypeError(
+            f"Expected INDEX/COUNT with 0 <= INDEX < COUNT: {value}"
+        )
+    return shard
+
+
+def is_in_shard(item_id: str, shard: Shard) -> bool:
+    # Stable across processes and machines, unlike hash()
+    digest = hashlib.sha256(item_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard.count == shard.index
+
+
+def get_default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_work_queue_config_from_args(args: Namespace) -> WorkQueueConfig | None:
+    work_queue: bool = args.work_queue
+    if not work_queue:
+        return None
+
+    worker_id: str | None = args.worker_id
+    return WorkQueueConfig(
+        worker_id=worker_id if worker_id is not None else get_default_worker_id(),
+        lease_duration=args.lease_duration,
+    )
+
+
+def add_work_distribution_arguments(
+    parser: ArgumentParser,
+) -> None:
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help=(
+            "Crawl only the rows whose id hashes to INDEX/COUNT (e.g. 0/4), "
+            "for workers with separate output directories merged by merge_shards"
+        ),
+    )
+    parser.add_argument(
+        "--work_queue",
+        action="store_true",
+        help=(
+            "Lease each item in the state file before crawling it, "
+            "so that workers sharing an output directory never fetch the same item"
+        ),
+    )
+    parser.add_argument(
+        "--worker_id",
+        type=str,
+        help=(
+            "Owner of the leases of this worker, whose leases left over by a crash "
+            "are released at start. The default HOSTNAME:PID changes on restart, "
+            "so give each worker a stable id (e.g. HOSTNAME:1) to make use of it."
+        ),
+    )
+    parser.add_argument(
+        "--lease_duration",
+        type=float,
+        default=DEFAULT_LEASE_DURATION,
+        help="Seconds after which a lease of a crashed worker is taken over",
+    )
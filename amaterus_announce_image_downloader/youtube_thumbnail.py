@@ -0,0 +1,44 @@
+from argparse import ArgumentParser
+from typing import Literal
+
+VariantMode = Literal["first", "all"]
+
+VARIANT_MODES: list[VariantMode] = ["first", "all"]
+
+DEFAULT_THUMBNAIL_BASE_URL = "https://i.ytimg.com/vi/"
+
+
+def parse_variant_mode(value: str) -> VariantMode:
+    for variant_mode in VARIANT_MODES:
+        if variant_mode == value:
+            return variant_mode
+    raise ValueError(f"Unknown variant mode: {value}")
+
+
+def add_thumbnail_variant_arguments(
+    parser: ArgumentParser,
+    required: bool,
+) -> None:
+    parser.add_argument(
+        "--variant",
+        type=str,
+        nargs="+",
+        required=required,
+        help="Thumbnail variants in order of preference (e.g. maxresdefault hqdefault)",
+    )
+    parser.add_argument(
+        "--variant_mode",
+        type=parse_variant_mode,
+        choices=VARIANT_MODES,
+        default="first",
+        help=(
+            "first: save the first variant which exists as {id}.jpg, "
+            "all: save every variant as {variant}/{id}.jpg"
+        ),
+    )
+    parser.add_argument(
+        "--thumbnail_base_url",
+        type=str,
+        default=DEFAULT_THUMBNAIL_BASE_URL,
+        help="URL prefix of {remote_youtube_video_id}/{variant}.jpg",
+    )
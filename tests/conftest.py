@@ -0,0 +1,39 @@
+import asyncio
+import threading
+from collections.abc import Iterator
+
+import pytest
+
+from amaterus_announce_image_downloader.benchmark_server import (
+    BenchmarkServer,
+    BenchmarkServerConfig,
+)
+
+ROW_COUNT = 300
+
+
+@pytest.fixture
+def benchmark_server() -> Iterator[BenchmarkServer]:
+    server = BenchmarkServer(
+        config=BenchmarkServerConfig(
+            row_count=ROW_COUNT,
+            image_size=1024,
+            image_latency=0.005,
+            hasura_latency=0,
+            error_rate=0,
+            seed=0,
+        )
+    )
+
+    # Served from a thread, while the workers run in processes of their own
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,94 @@
+import pytest
+
+from amaterus_announce_image_downloader.image_validator import (
+    ImageInfo,
+    ImageValidationError,
+    StreamingImageValidator,
+)
+
+# SOI, an APP0 segment, then a baseline frame header of 320x180
+JPEG_HEADER = (
+    b"\xff\xd8"
+    + b"\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    + b"\xff\xc0\x00\x11\x08\x00\xb4\x01\x40\x03"
+    + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01"
+)
+JPEG = (
+    JPEG_HEADER
+    + b"\xff\xda\x00\x08\x01\x01\x00\x00\x3f\x00"
+    + b"\x12" * 200
+    + b"\xff\xd9"
+)
+
+# Signature and the IHDR chunk of 64x48, then IEND
+PNG = (
+    b"\x89PNG\r\n\x1a\n"
+    + b"\x00\x00\x00\x0dIHDR\x00\x00\x00\x40\x00\x00\x00\x30\x08\x02\x00\x00\x00"
+    + b"\x00\x00\x00\x00"
+    + b"\x00\x00\x00\x00IEND\xaeB`\x82"
+)
+
+HTML = b"<!DOCTYPE html><html><body>Not Found</body></html>"
+
+
+def validate(content_type: str, body: bytes, chunk_size: int) -> ImageInfo:
+    validator = StreamingImageValidator(content_type=content_type)
+    for index in range(0, len(body), chunk_size):
+        validator.feed(body[index : index + chunk_size])
+    return validator.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, len(JPEG)])
+def test_jpeg_in_chunks(chunk_size: int) -> None:
+    image_info = validate(content_type="image/jpeg", body=JPEG, chunk_size=chunk_size)
+
+    assert image_info == ImageInfo(format="jpeg", width=320, height=180)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 16, len(PNG)])
+def test_png_in_chunks(chunk_size: int) -> None:
+    image_info = validate(content_type="image/png", body=PNG, chunk_size=chunk_size)
+
+    assert image_info == ImageInfo(format="png", width=64, height=48)
+
+
+def test_jpeg_with_padding_after_eoi() -> None:
+    image_info = validate(content_type="image/jpeg", body=JPEG + b"\r\n", chunk_size=16)
+
+    assert image_info.width == 320
+
+
+def test_jpeg_without_eoi() -> None:
+    with pytest.raises(ImageValidationError, match="no EOI"):
+        validate(content_type="image/jpeg", body=JPEG[:-2], chunk_size=16)
+
+
+def test_png_without_iend() -> None:
+    with pytest.raises(ImageValidationError, match="no IEND"):
+        validate(content_type="image/png", body=PNG[:-12], chunk_size=16)
+
+
+def test_jpeg_cut_before_frame_header() -> None:
+    with pytest.raises(ImageValidationError, match="Truncated jpeg header"):
+        validate(content_type="image/jpeg", body=JPEG_HEADER[:20], chunk_size=16)
+
+
+def test_empty_body() -> None:
+    with pytest.raises(ImageValidationError, match="too short"):
+        validate(content_type="image/jpeg", body=b"", chunk_size=16)
+
+
+@pytest.mark.parametrize("chunk_size", [1, len(HTML)])
+def test_html_body(chunk_size: int) -> None:
+    with pytest.raises(ImageValidationError, match="Unknown magic bytes"):
+        validate(content_type="image/jpeg", body=HTML, chunk_size=chunk_size)
+
+
+def test_body_not_matching_content_type() -> None:
+    with pytest.raises(ImageValidationError, match="Content-Type is jpeg"):
+        validate(content_type="image/jpeg", body=PNG, chunk_size=16)
+
+
+def test_unsupported_content_type() -> None:
+    with pytest.raises(ImageValidationError, match="Unsupported Content-Type"):
+        StreamingImageValidator(content_type="text/html")
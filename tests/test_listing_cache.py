@@ -0,0 +1,55 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from amaterus_announce_image_downloader.benchmark_server import BenchmarkServer
+
+
+def run_crawl(benchmark_server: BenchmarkServer, output_dir: Path) -> str:
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "amaterus_announce_image_downloader",
+            "twitter_tweet_image",
+            "--amaterus_hasura_url",
+            benchmark_server.base_url,
+            "--internal_useragent",
+            "test",
+            "--external_useragent",
+            "test",
+            "--output_dir",
+            str(output_dir),
+            "--hasura_page_size",
+            "50",
+            "--concurrency",
+            "4",
+            "--rate_limit_per_host",
+            "1000",
+            "--listing_cache",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=120,
+    )
+    stderr = process.stderr.decode("utf-8")
+    assert process.returncode == 0, stderr
+    return stderr
+
+
+def test_unchanged_listing_is_served_from_the_cache(
+    benchmark_server: BenchmarkServer,
+    tmp_path: Path,
+) -> None:
+    output_dir = tmp_path / "twitter_tweet_images"
+    page_count = benchmark_server.config.row_count // 50 + 1
+
+    # The probe and every page
+    stderr = run_crawl(benchmark_server=benchmark_server, output_dir=output_dir)
+    assert "Listing cache disabled" not in stderr
+    assert benchmark_server.hasura_request_count == 1 + page_count
+
+    # Only the probe, which the stand-in answers as Hasura would
+    stderr = run_crawl(benchmark_server=benchmark_server, output_dir=output_dir)
+    assert "listing, unchanged" in stderr
+    assert benchmark_server.hasura_request_count == 1 + page_count + 1
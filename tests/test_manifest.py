@@ -0,0 +1,89 @@
+from pathlib import Path
+
+from amaterus_announce_image_downloader.atomic_file import get_tmp_dir
+from amaterus_announce_image_downloader.manifest import Manifest, ManifestReader
+
+RECORD_A1 = '{"id":"a","size":1}'
+RECORD_A2 = '{"id":"a","size":2}'
+RECORD_B = '{"id":"b","size":3}'
+TORN_RECORD = '{"id":"c","si'
+
+
+def write_lines(manifest_file: Path, lines: list[str], tail: str = "") -> None:
+    manifest_file.write_text("".join(f"{line}\n" for line in lines) + tail)
+
+
+def test_manifest_truncates_torn_record(tmp_path: Path) -> None:
+    manifest_file = tmp_path / "manifest.jsonl"
+    write_lines(
+        manifest_file=manifest_file,
+        lines=[RECORD_A1, RECORD_B],
+        tail=TORN_RECORD,
+    )
+
+    with Manifest(manifest_file=manifest_file) as manifest:
+        assert manifest.get_item_ids() == ["a", "b"]
+        assert not manifest.has(item_id="c")
+
+        manifest.append(item_id="c", text='{"id":"c","size":4}')
+
+    assert manifest_file.read_text().splitlines() == [
+        RECORD_A1,
+        RECORD_B,
+        '{"id":"c","size":4}',
+    ]
+
+
+def test_manifest_reader_keeps_torn_record(tmp_path: Path) -> None:
+    manifest_file = tmp_path / "manifest.jsonl"
+    write_lines(manifest_file=manifest_file, lines=[RECORD_A1], tail=TORN_RECORD)
+
+    # It may still be being appended by a crawl
+    with ManifestReader(manifest_file=manifest_file) as manifest:
+        assert manifest.get_item_ids() == ["a"]
+
+    assert manifest_file.read_text().endswith(TORN_RECORD)
+
+
+def test_manifest_last_record_wins(tmp_path: Path) -> None:
+    manifest_file = tmp_path / "manifest.jsonl"
+
+    with Manifest(manifest_file=manifest_file) as manifest:
+        manifest.append(item_id="a", text=RECORD_A1)
+        manifest.append(item_id="b", text=RECORD_B)
+        manifest.append(item_id="a", text=RECORD_A2)
+
+        assert manifest.read(item_id="a") == RECORD_A2.encode("utf-8")
+        assert manifest.live_count == 2
+        assert manifest.stale_count == 1
+
+    with ManifestReader(manifest_file=manifest_file) as manifest:
+        assert manifest.read(item_id="a") == RECORD_A2.encode("utf-8")
+
+
+def test_manifest_compact(tmp_path: Path) -> None:
+    manifest_file = tmp_path / "manifest.jsonl"
+    write_lines(manifest_file=manifest_file, lines=[RECORD_B, RECORD_A1, RECORD_A2])
+
+    with Manifest(manifest_file=manifest_file) as manifest:
+        assert manifest.should_compact() is False
+
+        manifest.compact()
+
+        assert manifest.stale_count == 0
+        assert manifest.read(item_id="b") == RECORD_B.encode("utf-8")
+
+        # Still appendable after the file was replaced
+        manifest.append(item_id="b", text=RECORD_B)
+
+    # Sorted by id
+    assert manifest_file.read_text().splitlines() == [RECORD_A2, RECORD_B, RECORD_B]
+    assert list(get_tmp_dir(output_dir=tmp_path).iterdir()) == []
+
+
+def test_manifest_should_compact(tmp_path: Path) -> None:
+    manifest_file = tmp_path / "manifest.jsonl"
+    write_lines(manifest_file=manifest_file, lines=[RECORD_A1, RECORD_A2, RECORD_A2])
+
+    with Manifest(manifest_file=manifest_file) as manifest:
+        assert manifest.should_compact() is True
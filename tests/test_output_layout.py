@@ -0,0 +1,68 @@
+import pytest
+
+from amaterus_announce_image_downloader.output_layout import (
+    OutputLayout,
+    get_shard_prefix,
+    relocate_item_file_name,
+)
+
+ITEM_ID = "1234"
+SHARD_PREFIX = get_shard_prefix(item_id=ITEM_ID, output_layout="sharded")
+
+
+@pytest.mark.parametrize(
+    ("file_name", "output_layout", "expected"),
+    [
+        ("1234.jpg", "sharded", f"{SHARD_PREFIX}1234.jpg"),
+        (f"{SHARD_PREFIX}1234.jpg", "flat", "1234.jpg"),
+        # Already in the layout
+        ("1234.jpg", "flat", "1234.jpg"),
+        (f"{SHARD_PREFIX}1234.jpg", "sharded", f"{SHARD_PREFIX}1234.jpg"),
+        # Suffixes of other files of the item
+        ("1234.json", "sharded", f"{SHARD_PREFIX}1234.json"),
+        ("1234.error.txt", "sharded", f"{SHARD_PREFIX}1234.error.txt"),
+        # Under a subdirectory of the output directory
+        (
+            "derivatives/webp_320/1234.webp",
+            "sharded",
+            f"derivatives/webp_320/{SHARD_PREFIX}1234.webp",
+        ),
+        (
+            f"derivatives/webp_320/{SHARD_PREFIX}1234.webp",
+            "flat",
+            "derivatives/webp_320/1234.webp",
+        ),
+    ],
+)
+def test_relocate_item_file_name(
+    file_name: str,
+    output_layout: OutputLayout,
+    expected: str,
+) -> None:
+    relocated_file_name = relocate_item_file_name(
+        file_name=file_name,
+        item_id=ITEM_ID,
+        output_layout=output_layout,
+    )
+
+    assert relocated_file_name == expected
+
+
+@pytest.mark.parametrize(
+    "file_name",
+    [
+        # Blobs of --content_addressed are named by their hash
+        "blobs/ab/cd/abcdef.jpg",
+        # Ends with the id, but not at a directory boundary
+        "x1234.jpg",
+        "derivatives/x1234.webp",
+    ],
+)
+def test_relocate_other_file_name(file_name: str) -> None:
+    relocated_file_name = relocate_item_file_name(
+        file_name=file_name,
+        item_id=ITEM_ID,
+        output_layout="sharded",
+    )
+
+    assert relocated_file_name == file_name
@@ -0,0 +1,94 @@
+from datetime import UTC, datetime, timedelta
+
+import httpx
+import pytest
+
+from amaterus_announce_image_downloader.retry_policy import (
+    RetryPolicy,
+    parse_retry_after,
+)
+
+NOW = datetime(2024, 8, 1, 12, 0, 0, tzinfo=UTC)
+
+RETRY_POLICY = RetryPolicy(
+    max_attempts=5,
+    initial_backoff=10,
+    max_backoff=100,
+)
+
+
+def get_response(retry_after: str | None) -> httpx.Response:
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return httpx.Response(status_code=503, headers=headers)
+
+
+@pytest.mark.parametrize(
+    ("retry_after", "expected"),
+    [
+        (None, None),
+        ("120", 120.0),
+        (" 5 ", 5.0),
+        ("Thu, 01 Aug 2024 12:01:30 GMT", 90.0),
+        # Already passed
+        ("Thu, 01 Aug 2024 11:00:00 GMT", 0.0),
+        ("soon", None),
+        ("-1", None),
+    ],
+)
+def test_parse_retry_after(retry_after: str | None, expected: float | None) -> None:
+    response = get_response(retry_after=retry_after)
+
+    assert parse_retry_after(response=response, now=NOW) == expected
+
+
+@pytest.mark.parametrize(
+    ("failure_count", "backoff"),
+    [
+        (0, 10),
+        (1, 10),
+        (2, 20),
+        (4, 80),
+        (5, 100),
+        (30, 100),
+    ],
+)
+def test_retry_delay_bounds(failure_count: int, backoff: float) -> None:
+    for _ in range(100):
+        delay = RETRY_POLICY.get_retry_delay(
+            failure_count=failure_count,
+            retry_after=None,
+        )
+        assert backoff / 2 <= delay <= backoff
+
+
+def test_retry_after_extends_delay() -> None:
+    delay = RETRY_POLICY.get_retry_delay(failure_count=1, retry_after=3600)
+
+    assert delay == 3600
+
+
+def test_retry_after_does_not_shorten_delay() -> None:
+    delay = RETRY_POLICY.get_retry_delay(failure_count=4, retry_after=1)
+
+    assert 40 <= delay <= 80
+
+
+def test_next_attempt_at() -> None:
+    next_attempt_at = RETRY_POLICY.get_next_attempt_at(
+        failure_count=1,
+        retry_after=None,
+        failed_at=NOW,
+    )
+
+    assert next_attempt_at is not None
+    assert NOW + timedelta(seconds=5) <= next_attempt_at <= NOW + timedelta(seconds=10)
+
+
+def test_no_next_attempt_after_max_attempts() -> None:
+    next_attempt_at = RETRY_POLICY.get_next_attempt_at(
+        failure_count=RETRY_POLICY.max_attempts,
+        retry_after=None,
+        failed_at=NOW,
+    )
+
+    assert next_attempt_at is None
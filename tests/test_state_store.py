@@ -0,0 +1,105 @@
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from amaterus_announce_image_downloader.state_store import (
+    ItemState,
+    ItemStatus,
+    StateFileNotFoundError,
+    StateStore,
+)
+
+SOURCE_NAME = "twitter_tweet_images"
+
+CHECKED_AT = datetime(2024, 8, 1, 12, 0, 0, tzinfo=UTC)
+
+
+def get_item_state(status: ItemStatus, checked_at: datetime) -> ItemState:
+    fetched = status == "fetched"
+    return ItemState(
+        id="1",
+        status=status,
+        url=f"https://example.com/{status}.jpg",
+        content_type="image/jpeg" if fetched else None,
+        file_name="1.jpg" if fetched else None,
+        size=100 if fetched else None,
+        sha256="ab" if fetched else None,
+        stored_as_blob=False,
+        etag=None,
+        last_modified=None,
+        fetched_at=checked_at if fetched else None,
+        checked_at=checked_at,
+        attempt_count=1,
+        failure_count=0 if fetched else 1,
+        last_error=None if fetched else "HTTPStatusError",
+        next_attempt_at=None,
+    )
+
+
+@pytest.mark.parametrize(
+    ("stored", "merged", "expected"),
+    [
+        # Fetched wins over a failure whenever it was checked
+        (("fetched", 0), ("errored", 60), "fetched"),
+        (("fetched", 0), ("retrying", 60), "fetched"),
+        (("errored", 60), ("fetched", 0), "fetched"),
+        (("retrying", 60), ("fetched", 0), "fetched"),
+        # Otherwise the latest check wins
+        (("errored", 0), ("retrying", 60), "retrying"),
+        (("retrying", 60), ("errored", 0), "retrying"),
+    ],
+)
+def test_merge_item_states_conflict(
+    tmp_path: Path,
+    stored: tuple[ItemStatus, int],
+    merged: tuple[ItemStatus, int],
+    expected: ItemStatus,
+) -> None:
+    with StateStore(state_file=tmp_path / "state.sqlite3") as state_store:
+        state_store.ensure_source(source_name=SOURCE_NAME)
+        for status, offset in [stored, merged]:
+            state_store.merge_item_states(
+                source_name=SOURCE_NAME,
+                item_states=[
+                    get_item_state(
+                        status=status,
+                        checked_at=CHECKED_AT + timedelta(seconds=offset),
+                    ),
+                ],
+            )
+
+        item_state = state_store.get_item_state(source_name=SOURCE_NAME, item_id="1")
+
+    assert item_state is not None
+    assert item_state.status == expected
+    assert item_state.url == f"https://example.com/{expected}.jpg"
+
+
+def test_merge_item_states_latest_fetch_wins(tmp_path: Path) -> None:
+    with StateStore(state_file=tmp_path / "state.sqlite3") as state_store:
+        state_store.ensure_source(source_name=SOURCE_NAME)
+        for offset in [60, 0]:
+            state_store.merge_item_states(
+                source_name=SOURCE_NAME,
+                item_states=[
+                    get_item_state(
+                        status="fetched",
+                        checked_at=CHECKED_AT + timedelta(seconds=offset),
+                    ),
+                ],
+            )
+
+        item_state = state_store.get_item_state(source_name=SOURCE_NAME, item_id="1")
+
+    assert item_state is not None
+    assert item_state.checked_at == CHECKED_AT + timedelta(seconds=60)
+
+
+def test_missing_state_file(tmp_path: Path) -> None:
+    state_file = tmp_path / "state.sqlite3"
+
+    with pytest.raises(StateFileNotFoundError):
+        StateStore(state_file=state_file, mode="ro")
+
+    assert not state_file.exists()
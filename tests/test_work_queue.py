@@ -0,0 +1,66 @@
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+
+from amaterus_announce_image_downloader.benchmark_server import BenchmarkServer
+
+WORKER_COUNT = 3
+
+
+def test_work_queue_fetches_each_item_once(
+    benchmark_server: BenchmarkServer,
+    tmp_path: Path,
+) -> None:
+    output_dir = tmp_path / "twitter_tweet_images"
+    row_count = benchmark_server.config.row_count
+
+    # Started together, so that they also set up the state file at the same time
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "amaterus_announce_image_downloader",
+                "twitter_tweet_image",
+                "--amaterus_hasura_url",
+                benchmark_server.base_url,
+                "--internal_useragent",
+                "test",
+                "--external_useragent",
+                "test",
+                "--output_dir",
+                str(output_dir),
+                "--hasura_page_size",
+                "50",
+                "--concurrency",
+                "4",
+                "--rate_limit_per_host",
+                "1000",
+                "--work_queue",
+                "--worker_id",
+                f"worker{index}",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        for index in range(WORKER_COUNT)
+    ]
+    for process in processes:
+        _, stderr = process.communicate(timeout=120)
+        assert process.returncode == 0, stderr.decode("utf-8")
+
+    expected_paths = {f"/images/{index:08d}.jpg" for index in range(row_count)}
+    assert set(benchmark_server.image_path_counts) == expected_paths
+    assert set(benchmark_server.image_path_counts.values()) == {1}
+
+    connection = sqlite3.connect(output_dir / "state.sqlite3")
+    try:
+        rows = connection.execute(
+            "SELECT status, COUNT(*) FROM items_twitter_tweet_images GROUP BY status"
+        ).fetchall()
+        lease_count = connection.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+    finally:
+        connection.close()
+    assert rows == [("fetched", row_count)]
+    assert lease_count == 0